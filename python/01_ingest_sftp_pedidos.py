@@ -1,29 +1,62 @@
 # requisitos:
 #   pip install paramiko python-dotenv
+# credenciais em sftp.env (ver pedidos/config.py)
 
 import os
 import sys
 import time
+import json
+import queue
+import random
+import asyncio
 import logging
+import argparse
+import threading
 from pathlib import Path
 import paramiko
-from dotenv import load_dotenv
+from pedidos.manifest import Manifest
+from pedidos import metricas, config
 
-# .env/.credenciais
-load_dotenv(dotenv_path=Path(".env") / "sftp.env")
+CFG = config.carregar()
+SFTP_HOST = CFG.sftp.host
+SFTP_PORT = CFG.sftp.port
+SFTP_USER = CFG.sftp.user
+SFTP_PASS = CFG.sftp.password
+SFTP_DIR  = CFG.sftp.dir
 
-SFTP_HOST = os.getenv("SFTP_HOST")
-SFTP_PORT = int(os.getenv("SFTP_PORT", "22"))
-SFTP_USER = os.getenv("SFTP_USER")
-SFTP_PASS = os.getenv("SFTP_PASS")
-SFTP_DIR  = os.getenv("SFTP_DIR")
-
-DEST_DIR  = Path(r"C:\Users\atend\OneDrive - grupojb.log.br\STORAGE_SFTP\rel_83\novos")
-LOG_DIR   = Path(r"C:\Users\atend\OneDrive - grupojb.log.br\STORAGE_SFTP\rel_83\logs")
+DEST_DIR  = CFG.arquivos.novos
+LOG_DIR   = CFG.arquivos.logs
 LOG_FILE  = LOG_DIR / "ingest_sftp_rel83.log"
+# manifesto compartilhado com 02_load_stage_pedidos.py
+MANIFEST_PATH = CFG.arquivos.manifest
+
+RETRIES = int(os.getenv("SFTP_RETRIES", "5"))
+SLEEP_BETWEEN = 2  # segundos (base do backoff exponencial)
+BACKOFF_MAX   = 60  # segundos
+
+# Downloads retomáveis: a cada CHECKPOINT_BYTES o .part é sincronizado em disco
+# e o offset confirmado é gravado no sidecar <nome>.part.json
+CHECKPOINT_BYTES = int(os.getenv("SFTP_CHECKPOINT_BYTES", str(8 * 1024 * 1024)))
+
+# Download paralelo: nº de conexões (transports) e de canais SFTP por conexão.
+# Com 1 x 1 o comportamento é o sequencial original.
+SFTP_TRANSPORTS = int(os.getenv("SFTP_TRANSPORTS", "1"))
+SFTP_CHANNELS   = int(os.getenv("SFTP_CHANNELS", "1"))
+
+# Leitura pipelined: nº de requisições de leitura em voo, tamanho de cada bloco
+# e janela/pacote do canal SSH. 0 = padrão do paramiko.
+SFTP_PREFETCH_REQUESTS = int(os.getenv("SFTP_PREFETCH_REQUESTS", "64"))
+SFTP_BLOCK_SIZE        = int(os.getenv("SFTP_BLOCK_SIZE", "32768"))
+SFTP_WINDOW_SIZE       = int(os.getenv("SFTP_WINDOW_SIZE", "0"))
+SFTP_MAX_PACKET_SIZE   = int(os.getenv("SFTP_MAX_PACKET_SIZE", "0"))
 
-RETRIES = 3
-SLEEP_BETWEEN = 2  # segundos
+# Modo watch (--watch): conexão mantida aberta com keepalive e listagem a cada
+# SFTP_WATCH_INTERVALO segundos. Um arquivo só é baixado depois de aparecer
+# com o mesmo tamanho/mtime em duas listagens seguidas (fornecedor terminou de
+# gravar). Queda de conexão -> reconexão com backoff até SFTP_RECONEXAO_MAX.
+SFTP_WATCH_INTERVALO = float(os.getenv("SFTP_WATCH_INTERVALO", "30"))
+SFTP_KEEPALIVE       = int(os.getenv("SFTP_KEEPALIVE", "15"))
+SFTP_RECONEXAO_MAX   = float(os.getenv("SFTP_RECONEXAO_MAX", "300"))
 
 def setup_logging():
     DEST_DIR.mkdir(parents=True, exist_ok=True)
@@ -37,101 +70,463 @@ def setup_logging():
         ],
     )
 
-def connect_sftp():
-    transport = paramiko.Transport((SFTP_HOST, SFTP_PORT))
-    transport.connect(username=SFTP_USER, password=SFTP_PASS)
-    sftp = paramiko.SFTPClient.from_transport(transport)
+def _transport_kwargs(window_size: int, max_packet_size: int) -> dict:
+    kw = {}
+    if window_size:
+        kw["default_window_size"] = window_size
+    if max_packet_size:
+        kw["default_max_packet_size"] = max_packet_size
+    return kw
+
+def open_sftp_channel(transport, window_size: int = SFTP_WINDOW_SIZE,
+                      max_packet_size: int = SFTP_MAX_PACKET_SIZE):
+    return paramiko.SFTPClient.from_transport(
+        transport,
+        window_size=window_size or None,
+        max_packet_size=max_packet_size or None,
+    )
+
+def connect_sftp(host=None, port=None, user=None, password=None,
+                 window_size: int = SFTP_WINDOW_SIZE, max_packet_size: int = SFTP_MAX_PACKET_SIZE):
+    if host is None:
+        config.validar("sftp")
+    transport = paramiko.Transport(
+        (host or SFTP_HOST, port or SFTP_PORT),
+        **_transport_kwargs(window_size, max_packet_size),
+    )
+    transport.connect(username=user or SFTP_USER, password=password or SFTP_PASS)
+    sftp = open_sftp_channel(transport, window_size, max_packet_size)
     return transport, sftp
 
+def open_session_pool(n_transports: int, channels_per_transport: int):
+    """Abre N transports com K canais SFTP cada. Retorna (transports, sessões)."""
+    transports, sessions = [], []
+    try:
+        for _ in range(max(1, n_transports)):
+            transport, sftp = connect_sftp()
+            transports.append(transport)
+            sessions.append(sftp)
+            for _ in range(max(1, channels_per_transport) - 1):
+                sessions.append(open_sftp_channel(transport))
+    except Exception:
+        close_session_pool(transports, sessions)
+        raise
+    return transports, sessions
+
+def close_session_pool(transports, sessions):
+    for s in sessions:
+        try:
+            s.close()
+        except Exception:
+            pass
+    for t in transports:
+        try:
+            t.close()
+        except Exception:
+            pass
+
 def list_remote_files(sftp, remote_dir):
     import stat as _stat
     entries = sftp.listdir_attr(remote_dir)
     return [e for e in entries if not _stat.S_ISDIR(e.st_mode) and e.filename.upper().endswith(".CSV")]
 
 def cleanup_part_files():
+    """Remove apenas .part sem sidecar (não retomáveis) e sidecars órfãos."""
     removed = 0
+    kept = 0
     for p in DEST_DIR.glob("*.part"):
+        if sidecar_path_for_part(p).exists():
+            kept += 1
+            continue
         try:
             p.unlink()
             removed += 1
         except Exception:
             pass
+    for sc in DEST_DIR.glob("*.part.json"):
+        if not sc.with_name(sc.name[: -len(".json")]).exists():
+            try:
+                sc.unlink()
+            except Exception:
+                pass
     if removed:
         logging.info("Removidos %d arquivos .part antigos", removed)
+    if kept:
+        logging.info("Mantidos %d arquivos .part retomáveis", kept)
+
+def part_path_for(local_path: Path) -> Path:
+    return local_path.with_name(local_path.name + ".part")
+
+def sidecar_path_for_part(part_path: Path) -> Path:
+    return part_path.with_name(part_path.name + ".json")
+
+def read_sidecar(path: Path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def write_sidecar(path: Path, meta: dict):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+def discard_part(part_path: Path):
+    for p in (part_path, sidecar_path_for_part(part_path)):
+        try:
+            p.unlink(missing_ok=True)
+        except Exception:
+            pass
+
+def resume_offset(part_path: Path, expected_size: int, expected_mtime=None) -> int:
+    """
+    Offset a partir do qual o download pode continuar. Só retoma se o sidecar
+    registrar o mesmo tamanho/mtime remotos; caso contrário descarta o .part.
+    """
+    meta = read_sidecar(sidecar_path_for_part(part_path))
+    if not meta or not part_path.exists():
+        discard_part(part_path)
+        return 0
+    if meta.get("size") != expected_size or (expected_mtime is not None and meta.get("mtime") != expected_mtime):
+        logging.info("Arquivo remoto mudou desde o download parcial; descartando %s", part_path.name)
+        discard_part(part_path)
+        return 0
+    offset = min(int(meta.get("offset") or 0), part_path.stat().st_size)
+    if offset > expected_size:
+        discard_part(part_path)
+        return 0
+    return offset
 
-def download_with_verify(sftp, remote_path: str, local_path: Path, expected_size: int):
+def backoff_delay(attempt: int) -> float:
+    delay = min(BACKOFF_MAX, SLEEP_BETWEEN * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+def stream_download(sftp, remote_path: str, part_path: Path, expected_size: int,
+                    block_size: int = SFTP_BLOCK_SIZE,
+                    max_requests: int = SFTP_PREFETCH_REQUESTS,
+                    offset: int = 0, on_checkpoint=None) -> int:
+    """
+    Baixa remote_path para part_path com leituras pipelined: dispara até
+    max_requests leituras de block_size bytes em paralelo (prefetch) e grava
+    em streaming. Com offset > 0 continua um .part existente a partir desse
+    byte. on_checkpoint(pos) é chamado com o offset já sincronizado em disco
+    a cada CHECKPOINT_BYTES e ao final (inclusive em erro).
+    Retorna o tamanho final do .part.
+    """
+    with sftp.open(remote_path, "rb") as rf:
+        if block_size:
+            rf.MAX_REQUEST_SIZE = block_size  # tamanho de cada READ enviado ao servidor
+        if offset:
+            rf.seek(offset)
+        try:
+            rf.prefetch(expected_size, max_concurrent_requests=max_requests or None)
+        except TypeError:
+            # paramiko < 3.3 não aceita limitar as requisições em voo
+            rf.prefetch(expected_size)
+        with open(part_path, "r+b" if offset else "wb") as lf:
+            if offset:
+                lf.truncate(offset)
+                lf.seek(offset)
+            since_ckpt = 0
+            try:
+                while True:
+                    data = rf.read(max(block_size, 32768) * 8)
+                    if not data:
+                        break
+                    lf.write(data)
+                    since_ckpt += len(data)
+                    if on_checkpoint and since_ckpt >= CHECKPOINT_BYTES:
+                        lf.flush()
+                        os.fsync(lf.fileno())
+                        on_checkpoint(lf.tell())
+                        since_ckpt = 0
+            finally:
+                lf.flush()
+                os.fsync(lf.fileno())
+                if on_checkpoint:
+                    on_checkpoint(lf.tell())
+            return lf.tell()
+
+def download_with_verify(sftp, remote_path: str, local_path: Path, expected_size: int, expected_mtime=None):
     last_err = None
+    part_path = part_path_for(local_path)
+    sidecar = sidecar_path_for_part(part_path)
     for attempt in range(1, RETRIES + 1):
+        offset = resume_offset(part_path, expected_size, expected_mtime)
+        if offset:
+            logging.info("Retomando %s a partir do byte %d de %d", remote_path, offset, expected_size)
+        meta = {"remote_path": remote_path, "size": expected_size, "mtime": expected_mtime, "offset": offset}
+
+        def checkpoint(pos, meta=meta):
+            meta["offset"] = pos
+            write_sidecar(sidecar, meta)
+
         try:
-            sftp.get(remote_path, str(local_path))
-            # valida tamanho
-            if local_path.exists() and local_path.stat().st_size == expected_size:
+            checkpoint(offset)
+            size = stream_download(sftp, remote_path, part_path, expected_size,
+                                   offset=offset, on_checkpoint=checkpoint)
+            # valida tamanho e publica o arquivo com rename atômico
+            if size == expected_size:
+                os.replace(part_path, local_path)
+                sidecar.unlink(missing_ok=True)
                 return True
-            else:
-                # remove corrompido
-                try:
-                    local_path.unlink(missing_ok=True)
-                except Exception:
-                    pass
-                last_err = RuntimeError(f"tamanho divergente: esperado {expected_size} bytes")
+            if size > expected_size:
+                # maior que o remoto: corrompido, recomeça do zero
+                discard_part(part_path)
+            last_err = RuntimeError(f"tamanho divergente: esperado {expected_size} bytes, obtido {size}")
         except Exception as e:
+            # mantém o .part e o sidecar para retomar na próxima tentativa
             last_err = e
-            # remove arquivo parcial se criado
-            try:
-                local_path.unlink(missing_ok=True)
-            except Exception:
-                pass
         if attempt < RETRIES:
-            time.sleep(SLEEP_BETWEEN)
+            time.sleep(backoff_delay(attempt))
     # falhou
     logging.error("Falha ao baixar %s: %s", remote_path, last_err)
     return False
 
+def baixar_arquivo(sftp, f, manifest=None) -> bool:
+    remote_path = f"{SFTP_DIR}/{f.filename}"
+    local_path = DEST_DIR / f.filename
+    t0 = time.perf_counter()
+    ok = download_with_verify(sftp, remote_path, local_path, f.st_size, f.st_mtime)
+    metricas.registrar("sftp_download", time.perf_counter() - t0, arquivo=f.filename,
+                       bytes=f.st_size if ok else 0, falhas=0 if ok else 1)
+    if ok:
+        if manifest is not None:
+            manifest.registrar_download(f.filename, f.st_size, f.st_mtime, str(local_path))
+        logging.info("Copiado: %s  ->  %s (%d bytes)", remote_path, local_path, f.st_size)
+    return ok
+
+def download_parallel(sessions, pendentes, manifest=None, ao_baixar=None):
+    """
+    Distribui os arquivos pendentes (já ordenados) por uma fila de trabalho
+    consumida por uma thread por sessão SFTP. Retorna (novos, bytes).
+    ao_baixar(f), se informado, é chamado assim que cada arquivo fica pronto.
+    """
+    fila = queue.Queue()
+    for f in pendentes:
+        fila.put(f)
+
+    lock = threading.Lock()
+    totais = {"novos": 0, "bytes": 0}
+
+    def worker(sftp):
+        while True:
+            try:
+                f = fila.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                ok = baixar_arquivo(sftp, f, manifest)
+            except Exception as e:
+                logging.error("Falha ao baixar %s/%s: %s", SFTP_DIR, f.filename, e)
+                ok = False
+            if ok:
+                with lock:
+                    totais["novos"] += 1
+                    totais["bytes"] += f.st_size
+                if ao_baixar is not None:
+                    ao_baixar(f)
+
+    threads = [threading.Thread(target=worker, args=(s,), daemon=True) for s in sessions]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return totais["novos"], totais["bytes"]
+
+def log_throughput(n_files: int, n_bytes: int, elapsed: float):
+    if elapsed <= 0:
+        return
+    logging.info(
+        "Throughput: %.2f MB/s | %.2f arquivos/s (%d arquivos, %d bytes em %.2fs)",
+        n_bytes / 1024 / 1024 / elapsed, n_files / elapsed, n_files, n_bytes, elapsed,
+    )
+
+# ===== MODO WATCH =====
+
+class ListagemEstavel:
+    """
+    Diff barato entre listagens: guarda (tamanho, mtime) da anterior e devolve
+    só as entradas que acabaram de ficar estáveis (iguais em duas listagens
+    seguidas). Cada versão de um arquivo é entregue uma única vez; se o
+    download falhar, esquecer(nome) faz ela ser reavaliada.
+    """
+
+    def __init__(self):
+        self.anterior = {}
+        self.entregues = {}
+        self.visto_em = {}
+
+    def atualizar(self, entradas, agora: float):
+        atual = {e.filename: (e.st_size, e.st_mtime) for e in entradas}
+        estaveis = []
+        for e in entradas:
+            attrs = atual[e.filename]
+            if self.anterior.get(e.filename) != attrs:
+                self.visto_em[e.filename] = agora      # novo ou ainda crescendo
+            elif self.entregues.get(e.filename) != attrs:
+                self.entregues[e.filename] = attrs
+                estaveis.append(e)
+        for nome in set(self.anterior) - set(atual):
+            self.entregues.pop(nome, None)
+            self.visto_em.pop(nome, None)
+        self.anterior = atual
+        return estaveis
+
+    def esquecer(self, nome: str):
+        self.entregues.pop(nome, None)
+
+async def _poll(sftp, manifest, listagem: ListagemEstavel, ao_baixar=None) -> dict:
+    """Uma rodada do watch: lista, filtra estáveis e baixa os pendentes."""
+    t0 = time.perf_counter()
+    remotos = await asyncio.to_thread(list_remote_files, sftp, SFTP_DIR)
+    t_lista = time.perf_counter() - t0
+    metricas.registrar("sftp_lista", t_lista, arquivos=len(remotos))
+    estaveis = listagem.atualizar(remotos, t0)
+    pendentes = sorted(manifest.pendentes_download(estaveis), key=lambda x: x.filename) if estaveis else []
+
+    m = {"arquivos": len(remotos), "estaveis": len(estaveis), "baixados": 0, "bytes": 0,
+         "lista_s": t_lista, "latencias": []}
+    for f in pendentes:
+        ok = await asyncio.to_thread(baixar_arquivo, sftp, f, manifest)
+        if not ok:
+            listagem.esquecer(f.filename)
+            continue
+        m["baixados"] += 1
+        m["bytes"] += f.st_size
+        # do momento em que o arquivo apareceu com o tamanho final até estar em novos/
+        m["latencias"].append(time.perf_counter() - listagem.visto_em.get(f.filename, t0))
+        if ao_baixar is not None:
+            ao_baixar(f)
+    m["total_s"] = time.perf_counter() - t0
+    return m
+
+async def watch(manifest, intervalo: float = SFTP_WATCH_INTERVALO, ao_baixar=None, parar: asyncio.Event = None):
+    """Loop do modo watch até `parar` ser sinalizado (ou Ctrl+C)."""
+    parar = parar or asyncio.Event()
+    listagem = ListagemEstavel()
+    tentativa = 0
+    while not parar.is_set():
+        transport = sftp = None
+        try:
+            transport, sftp = await asyncio.to_thread(connect_sftp)
+            transport.set_keepalive(SFTP_KEEPALIVE)
+            logging.info("Watch conectado a %s (intervalo %gs, keepalive %ds)", SFTP_HOST, intervalo, SFTP_KEEPALIVE)
+            tentativa = 0
+            while not parar.is_set():
+                if not transport.is_active():
+                    raise EOFError("conexão SSH encerrada")
+                m = await _poll(sftp, manifest, listagem, ao_baixar)
+                lat = max(m["latencias"]) if m["latencias"] else 0.0
+                logging.log(
+                    logging.INFO if m["baixados"] else logging.DEBUG,
+                    "Watch: arquivos=%d estáveis=%d baixados=%d bytes=%d lista=%.3fs poll=%.3fs latencia_max=%.1fs",
+                    m["arquivos"], m["estaveis"], m["baixados"], m["bytes"], m["lista_s"], m["total_s"], lat,
+                )
+                metricas.registrar("sftp_watch_poll", m["total_s"], baixados=m["baixados"], bytes=m["bytes"],
+                                   latencia_max_s=round(lat, 3))
+                metricas.atual().descarregar()
+                try:
+                    await asyncio.wait_for(parar.wait(), timeout=max(0.0, intervalo - m["total_s"]))
+                except asyncio.TimeoutError:
+                    pass
+        except (paramiko.SSHException, OSError, EOFError) as e:
+            tentativa += 1
+            delay = min(SFTP_RECONEXAO_MAX, SLEEP_BETWEEN * 2 ** (tentativa - 1)) * random.uniform(0.5, 1.0)
+            logging.warning("Watch: conexão perdida (%s). Reconectando em %.1fs", e, delay)
+            metricas.registrar("sftp_reconexao", erro=str(e))
+            try:
+                await asyncio.wait_for(parar.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            close_session_pool([transport] if transport else [], [sftp] if sftp else [])
+
+def semear_manifesto(manifest: Manifest):
+    """Primeira execução com manifesto: adota novos/, lidos/ e erros/ (mesma regra do 02)."""
+    n = manifest.semear_diretorios(DEST_DIR, CFG.arquivos.lidos, CFG.arquivos.erros)
+    if n:
+        logging.info("Manifesto criado a partir de %d arquivos locais existentes", n)
+
+def main_watch():
+    setup_logging()
+    cleanup_part_files()
+    logging.info("Início do modo watch SFTP")
+    metricas.iniciar("01_ingest_sftp_pedidos_watch")
+    manifest = Manifest(str(MANIFEST_PATH))
+    semear_manifesto(manifest)
+    try:
+        asyncio.run(watch(manifest))
+    except KeyboardInterrupt:
+        logging.info("Modo watch interrompido")
+    finally:
+        manifest.close()
+        metricas.atual().fechar()
+
 def main():
     setup_logging()
     cleanup_part_files()
     start = time.time()
     logging.info("Início da ingestão SFTP")
+    metricas.iniciar("01_ingest_sftp_pedidos")
 
-    existing = {p.name for p in DEST_DIR.glob("*.csv")} | {p.name for p in DEST_DIR.glob("*.CSV")}
-    logging.info("Arquivos locais existentes: %d", len(existing))
+    manifest = Manifest(str(MANIFEST_PATH))
+    semear_manifesto(manifest)
 
-    transport = None
-    sftp = None
+    transports = []
+    sessions = []
     new_count = 0
+    new_bytes = 0
     skipped = 0
+    dl_start = dl_end = None
     try:
-        transport, sftp = connect_sftp()
-        logging.info("Conectado ao SFTP %s", SFTP_HOST)
+        with metricas.medir("sftp_conexao", conexoes=SFTP_TRANSPORTS, canais=SFTP_CHANNELS):
+            transports, sessions = open_session_pool(SFTP_TRANSPORTS, SFTP_CHANNELS)
+        sftp = sessions[0]
+        logging.info(
+            "Conectado ao SFTP %s (%d conexões x %d canais)",
+            SFTP_HOST, len(transports), max(1, SFTP_CHANNELS),
+        )
 
-        remote_files = list_remote_files(sftp, SFTP_DIR)
+        with metricas.medir("sftp_lista") as m:
+            remote_files = list_remote_files(sftp, SFTP_DIR)
+            m["arquivos"] = len(remote_files)
         logging.info("Arquivos .CSV no SFTP: %d", len(remote_files))
 
-        for f in sorted(remote_files, key=lambda x: x.filename):
-            fname = f.filename
-            if fname in existing:
-                skipped += 1
-                continue
+        # novos ou alterados no servidor (tamanho/mtime diferentes do manifesto)
+        pendentes = sorted(manifest.pendentes_download(remote_files), key=lambda x: x.filename)
+        skipped = len(remote_files) - len(pendentes)
 
-            remote_path = f"{SFTP_DIR}/{fname}"
-            local_path = DEST_DIR / fname
-
-            ok = download_with_verify(sftp, remote_path, local_path, f.st_size)
-            if ok:
-                new_count += 1
-                logging.info("Copiado: %s  ->  %s (%d bytes)", remote_path, local_path, f.st_size)
+        dl_start = time.time()
+        if len(sessions) > 1:
+            new_count, new_bytes = download_parallel(sessions, pendentes, manifest)
+        else:
+            for f in pendentes:
+                if baixar_arquivo(sftp, f, manifest):
+                    new_count += 1
+                    new_bytes += f.st_size
+        dl_end = time.time()
 
     except Exception as e:
         logging.error("Erro de conexão ou listagem: %s", e)
+        metricas.registrar("sftp_erro", erro=str(e))
         sys.exit(1)
     finally:
-        if sftp:
-            sftp.close()
-        if transport:
-            transport.close()
+        close_session_pool(transports, sessions)
+        manifest.close()
+        metricas.atual().fechar()
 
     elapsed = time.time() - start
     logging.info("Concluído. Novos: %d | Já existiam: %d | Tempo: %.2fs", new_count, skipped, elapsed)
+    if dl_start is not None and new_count:
+        log_throughput(new_count, new_bytes, dl_end - dl_start)
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Ingestão SFTP do rel_83")
+    ap.add_argument("--watch", action="store_true", help="processo contínuo: lista o SFTP a cada SFTP_WATCH_INTERVALO s")
+    if ap.parse_args().watch:
+        main_watch()
+    else:
+        main()
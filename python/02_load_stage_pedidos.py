@@ -1,180 +1,332 @@
 # arquivo: carga_pedidos_csv.py
 import os
 import io
+import re
 import csv
+import gzip
+import time
+import errno
+import struct
+import codecs
+import mmap
+import queue
 import shutil
-from glob import glob
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import chain, islice
+from functools import lru_cache
+from operator import itemgetter
 from typing import List
 import pandas as pd
-import psycopg2
-from dotenv import load_dotenv
 from datetime import datetime
+from pedidos.manifest import Manifest, STATUS_BAIXADO, STATUS_LIDO, STATUS_ERRO, STATUS_DUPLICADO
+from pedidos import tipos, metricas, dedup, config, banco, esquema
 
 # ===== CONFIG =====
-DIR_NOVOS  = r"C:\Users\atend\OneDrive - grupojb.log.br\STORAGE_SFTP\rel_83\novos"
-DIR_LIDOS  = r"C:\Users\atend\OneDrive - grupojb.log.br\STORAGE_SFTP\rel_83\lidos"
-DIR_ERROS  = r"C:\Users\atend\OneDrive - grupojb.log.br\STORAGE_SFTP\rel_83\erros"
+# diretórios, manifesto e credenciais vêm de pedidos/config.py (REL83_STORAGE_DIR, banco.env)
+CFG = config.carregar()
+DIR_NOVOS  = str(CFG.arquivos.novos)
+DIR_LIDOS  = str(CFG.arquivos.lidos)
+DIR_ERROS  = str(CFG.arquivos.erros)
 TABELA_DESTINO = "staging.stg_pedidos"
+# 1 = leitura/COPY em streaming (memória constante); 0 = caminho pandas original
+CARGA_STREAMING = os.getenv("CARGA_STREAMING", "1") == "1"
+COPY_LINHAS_POR_BLOCO = 1000
+# formato do COPY no caminho streaming: csv (QUOTE_ALL, igual ao pandas), text ou binary
+COPY_FORMATO = os.getenv("COPY_FORMATO", "csv").lower()
+# bytes lidos uma única vez para detectar encoding e separador
+DETECCAO_BYTES = 256 * 1024
+# bloco decodificado de uma vez pelos leitores (cortado no fim de linha seguinte)
+LEITURA_BLOCO = 1024 * 1024
+# Carga paralela: processos que fazem parse/mapeamento e conexões que fazem o COPY.
+# Com CARGA_WORKERS = 1 os arquivos são processados em sequência numa conexão.
+CARGA_WORKERS  = int(os.getenv("CARGA_WORKERS", "1"))
+CARGA_CONEXOES = int(os.getenv("CARGA_CONEXOES", "2"))
+# Arquivo único grande (com CARGA_WORKERS > 1): acima de CARGA_FATIA_MB o arquivo
+# é dividido em faixas de bytes de ~CARGA_FATIA_MB, lidas pelos CARGA_WORKERS
+# processos e copiadas pelas CARGA_CONEXOES conexões. 0 = desligado.
+CARGA_FATIA_MB = int(os.getenv("CARGA_FATIA_MB", "0"))
+# 1 = converte datas/números em Python na carga e grava também as colunas
+# tipadas da staging (*_t), lidas pelo caminho rápido do upsert. Usa sempre o
+# streaming com COPY em formato text (único que distingue NULL de vazio aqui).
+CARGA_TIPADA = os.getenv("CARGA_TIPADA", "0") == "1"
+# Deduplicação antes do COPY (pedidos/dedup.py):
+#   CARGA_DEDUP_ARQUIVOS=1 -> arquivo com sha256 de um já carregado não é lido
+#   CARGA_DEDUP_LINHAS=1   -> descarta linhas idênticas a linhas já carregadas
+#                             nos últimos CARGA_DEDUP_DIAS dias (usa o streaming)
+CARGA_DEDUP_ARQUIVOS = os.getenv("CARGA_DEDUP_ARQUIVOS", "1") == "1"
+CARGA_DEDUP_LINHAS = os.getenv("CARGA_DEDUP_LINHAS", "0") == "1"
+CARGA_DEDUP_DIAS = int(os.getenv("CARGA_DEDUP_DIAS", "35"))
+# Destino do arquivo depois da carga (finalizar_arquivo); o manifesto guarda o caminho final:
+#   mover  -> os.replace para lidos/ ou erros/ (mesmo volume: rename, sem cópia)
+#   gzip   -> lidos/AAAA/MM/<nome>.gz (mês do processamento); erros/ movidos sem compactar
+#   copiar -> comportamento antigo: cópia em lidos/ ou erros/, o original fica em novos/
+CARGA_DESTINO = os.getenv("CARGA_DESTINO", "mover").lower()
+CARGA_GZIP_NIVEL = int(os.getenv("CARGA_GZIP_NIVEL", "6"))
 
-# Credenciais via .env (ex.: banco.env no mesmo diretório do script)
-# Carrega .env a partir do diretório do script, não do CWD
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ENV_PATH = os.path.join(BASE_DIR, "banco.env")
-load_dotenv(ENV_PATH)
-
-def _req(key: str) -> str:
-    v = os.getenv(key)
-    if not v:
-        raise RuntimeError(f"Variável de ambiente ausente: {key}. Verifique {ENV_PATH}")
-    return v
-
-DB_CFG = {
-    "host": os.getenv("PGHOST", "localhost"),
-    "user": os.getenv("PGUSER", "postgres"),
-    "password": os.getenv("PGPASSWORD", "admin"),
-    "dbname": os.getenv("PGDATABASE", "banco_prod"),
-    "port": int(os.getenv("PGPORT", "5432")),
-}
-
-COLUNAS_DESTINO = [
-    "id","data_insercao","tipo_entrega","pedido","data_nfe","serie_nfe","numero_nfe","valor_nfe",
-    "qtd_volumes","peso","remessa","nome_destinatario","endereco_completo","cep","cod_cd","cd",
-    "cnpj_cpf_transportadora","transportador","lead_time","data_prev_entrega","status_prazo",
-    "id_ult_ocr","ultima_ocorrencia","chave_ult_ocr","data_ultima_ocr","agrupador",
-    "endereco","numero","bairro","cidades","uf","etiquetas","chegada_transportadora",
-    "cod_vendedor","chave_nfe","qtd_itens","data_prev_entrega_original","cpf_destinatario",
-    "grau_risco","tipo_operacao","arquivo_origem"
-]
-
-DE_PARA = {
-    "ID": "id",
-    "Data Inserção": "data_insercao",
-    "Tipo Entrega": "tipo_entrega",
-    "Pedido": "pedido",
-    "Data Nfe": "data_nfe",
-    "Serie Nfe": "serie_nfe",
-    "Número Nfe": "numero_nfe",
-    "Valor Nfe": "valor_nfe",
-    "Qtd. Volumes": "qtd_volumes",
-    "Peso": "peso",
-    "Remessa": "remessa",
-    "Nome Destinatário": "nome_destinatario",
-    "Endereço Completo": "endereco_completo",
-    "CEP": "cep",
-    "Cód. CD": "cod_cd",
-    "CD": "cd",
-    "CNPJ/CPF Transportadora": "cnpj_cpf_transportadora",
-    "Transportador": "transportador",
-    "Lead Time": "lead_time",
-    "Data Prev. Entrega": "data_prev_entrega",
-    "Status Prazo": "status_prazo",
-    "ID Últ. Ocr.": "id_ult_ocr",
-    "Última Ocorrência": "ultima_ocorrencia",
-    "Chave Últ. Ocr.": "chave_ult_ocr",
-    "Data Última Ocr.": "data_ultima_ocr",
-    "Agrupador": "agrupador",
-    "Endereço": "endereco",
-    "Numero": "numero",
-    "Bairro": "bairro",
-    "Cidades": "cidades",
-    "UF": "uf",
-    "Etiquetas": "etiquetas",
-    "Chegada na Transportadora": "chegada_transportadora",
-    "Cod. Vendedor": "cod_vendedor",
-    "Chave NFe": "chave_nfe",
-    "Qtd. Itens": "qtd_itens",
-    "Data Prev. Entrega Original)": "data_prev_entrega_original",
-    "Data Prev. Entrega (Original)": "data_prev_entrega_original",
-    "Data Prev. Entrega Original": "data_prev_entrega_original",
-    "CPF Destinatário": "cpf_destinatario",
-    "Grau de Risco": "grau_risco",
-    "Tipo de Operação": "tipo_operacao",
-}
+# manifesto compartilhado com 01_ingest_sftp_pedidos.py
+MANIFEST_PATH = str(CFG.arquivos.manifest)
+
+# colunas da staging (ordem do COPY) e cabeçalho do CSV -> coluna: pedidos/esquema.py
+COLUNAS_DESTINO = esquema.COLUNAS
+DE_PARA = esquema.DE_PARA
 
 # ========= UTIL =========
 
-def safe_copy(src: str, dst_dir: str) -> str:
-    os.makedirs(dst_dir, exist_ok=True)
-    base = os.path.basename(src)
-    dst  = os.path.join(dst_dir, base)
+def _destino_livre(dst_dir: str, base: str) -> str:
+    dst = os.path.join(dst_dir, base)
     if os.path.exists(dst):
         ts = datetime.now().strftime("%Y%m%d%H%M%S")
         name, ext = os.path.splitext(base)
         dst = os.path.join(dst_dir, f"{name}__dup_{ts}{ext}")
+    return dst
+
+def safe_copy(src: str, dst_dir: str) -> str:
+    os.makedirs(dst_dir, exist_ok=True)
+    dst = _destino_livre(dst_dir, os.path.basename(src))
     shutil.copy2(src, dst)
     return dst
 
-def listar_csv_novos(dir_novos: str, dir_lidos: str, dir_erros: str) -> List[str]:
+def _copiar_fsync(src: str, dst: str):
+    """copy2 com fsync no handle de escrita (no Windows fsync de descritor só leitura dá EBADF)."""
+    with open(src, "rb") as fi, open(dst, "wb") as fo:
+        shutil.copyfileobj(fi, fo, 1 << 20)
+        fo.flush()
+        os.fsync(fo.fileno())
+    shutil.copystat(src, dst)
+
+def mover_arquivo(src: str, dst_dir: str) -> str:
+    """Rename atômico para dst_dir; entre volumes, cópia completa (.tmp + fsync) antes de apagar a origem."""
+    os.makedirs(dst_dir, exist_ok=True)
+    dst = _destino_livre(dst_dir, os.path.basename(src))
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp = dst + ".tmp"
+        _copiar_fsync(src, tmp)
+        os.replace(tmp, dst)
+        os.remove(src)
+    return dst
+
+def compactar_arquivo(src: str, dst_dir: str, nivel: int = CARGA_GZIP_NIVEL) -> str:
+    """Grava dst_dir/AAAA/MM/<nome>.gz (.tmp + fsync + rename) e só então apaga a origem."""
+    agora = datetime.now()
+    pasta = os.path.join(dst_dir, f"{agora:%Y}", f"{agora:%m}")
+    os.makedirs(pasta, exist_ok=True)
+    base = os.path.basename(src)
+    dst = _destino_livre(pasta, base + ".gz")
+    tmp = dst + ".tmp"
+    with open(src, "rb") as fi, open(tmp, "wb") as fo:
+        with gzip.GzipFile(filename=base, mode="wb", fileobj=fo, compresslevel=nivel,
+                           mtime=int(os.path.getmtime(src))) as gz:
+            shutil.copyfileobj(fi, gz, 1 << 20)
+        fo.flush()
+        os.fsync(fo.fileno())
+    os.replace(tmp, dst)
+    os.remove(src)
+    return dst
+
+def arquivar_arquivo(src: str, dst_dir: str, modo: str = None) -> str:
+    """Leva o arquivo processado para lidos/ ou erros/ conforme CARGA_DESTINO. Retorna o caminho final."""
+    modo = modo or CARGA_DESTINO
+    if modo == "copiar":
+        return safe_copy(src, dst_dir)
+    if modo == "gzip" and dst_dir == DIR_LIDOS:
+        return compactar_arquivo(src, dst_dir)
+    if modo in ("mover", "gzip"):
+        return mover_arquivo(src, dst_dir)
+    raise ValueError(f"CARGA_DESTINO inválido: {modo}")
+
+def listar_csv_novos(dir_novos: str, dir_lidos: str, dir_erros: str, manifest: Manifest) -> List[str]:
+    """Arquivos com status 'baixado' no manifesto que existem em novos/."""
     os.makedirs(dir_lidos, exist_ok=True)
     os.makedirs(dir_erros, exist_ok=True)
-    lidos = {os.path.basename(p).lower() for p in glob(os.path.join(dir_lidos, "*.csv"))}
-    err   = {os.path.basename(p).lower() for p in glob(os.path.join(dir_erros, "*.csv"))}
-    candidatos = glob(os.path.join(dir_novos, "*.csv"))
-    return [p for p in candidatos if os.path.basename(p).lower() not in lidos | err]
-
-def detectar_sep_por_frequencia(caminho: str, encoding: str) -> str:
-    candidatos = [",", ";", "|", "\t"]
-    contagem = {c: 0 for c in candidatos}
-    with open(caminho, "r", encoding=encoding, errors="replace", newline="") as f:
-        for i, linha in enumerate(f):
-            if i > 200:
-                break
-            for c in candidatos:
-                contagem[c] += linha.count(c)
-    return max(contagem, key=contagem.get) or ","
+    manifest.semear_diretorios(dir_novos, dir_lidos, dir_erros)
+    candidatos = (os.path.join(dir_novos, n) for n in manifest.pendentes_carga())
+    return [p for p in candidatos if os.path.exists(p)]
 
-def ler_csv_robusto(caminho: str) -> pd.DataFrame:
-    r"""Tenta cp1252/latin-1/utf-8-sig/utf-8. Detecta separador. Normaliza nº de colunas."""
-    encodings = ["cp1252", "latin-1", "utf-8-sig", "utf-8"]
-    for enc in encodings:
+# ========= LEITURA =========
+
+# separadores que str.splitlines reconhece além de \r e \n
+_OUTRAS_QUEBRAS = ("\v", "\f", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029")
+
+def _quebrar_linhas(texto: str):
+    """Linhas de um bloco como no modo newline="" do open(): só \\r, \\n e \\r\\n quebram linha."""
+    if any(q in texto for q in _OUTRAS_QUEBRAS):
+        return io.StringIO(texto, newline="")
+    return texto.splitlines(True)
+
+class ArquivoMapeado:
+    """
+    Arquivo mapeado em memória (mmap) uma vez e usado pela detecção de formato
+    e pelos leitores: o prefixo sai do mapeamento e as linhas são decodificadas
+    em blocos inteiros, direto do cache de páginas, sem buffer de leitura próprio.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._f = open(caminho, "rb")
+        self.tamanho = os.fstat(self._f.fileno()).st_size
+        # arquivo vazio não pode ser mapeado
+        self.mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if self.tamanho else b""
+
+    def prefixo(self, n: int) -> bytes:
+        return self.mm[:n]
+
+    def inicio_de_linha(self, pos: int) -> int:
+        """Primeiro início de linha em `pos` ou depois (o tamanho do arquivo, se não houver)."""
+        if pos <= 0:
+            return 0
+        if pos >= self.tamanho:
+            return self.tamanho
+        nl = self.mm.find(b"\n", pos - 1)
+        return nl + 1 if nl >= 0 else self.tamanho
+
+    def blocos(self, inicio: int, fim: int = None, tamanho: int = None):
+        """(inicio, fim) de blocos de ~`tamanho` bytes (LEITURA_BLOCO) terminados em fim de linha."""
+        fim = self.tamanho if fim is None else fim
+        tamanho = tamanho or LEITURA_BLOCO
+        pos = inicio
+        while pos < fim:
+            ate = min(self.inicio_de_linha(pos + tamanho), fim)
+            yield pos, ate
+            pos = ate
+
+    def decodificar(self, inicio: int, fim: int, encoding: str) -> str:
+        """Decodifica o trecho em bloco, sem copiar os bytes (memoryview do mapeamento)."""
+        with memoryview(self.mm) as mv, mv[inicio:fim] as trecho:
+            return str(trecho, encoding, "replace")
+
+    def linhas(self, encoding: str):
+        """
+        Linhas do arquivo decodificadas, quebradas como no modo newline=""
+        (\\r, \\n ou \\r\\n). Os blocos terminam em \\n, então nenhum caractere
+        nem \\r\\n fica dividido entre dois blocos.
+        """
+        inicio = 0
+        if encoding == "utf-8-sig":
+            encoding = "utf-8"
+            if self.prefixo(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+                inicio = len(codecs.BOM_UTF8)
+        textos = (self.decodificar(a, b, encoding) for a, b in self.blocos(inicio))
+        # iteração das linhas toda em C: sem frame Python por linha
+        return chain.from_iterable(map(_quebrar_linhas, textos))
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# detecção por padrão de nome de arquivo (dígitos -> '#'), válida no processo
+_CACHE_FORMATO = {}
+
+def padrao_arquivo(caminho: str) -> str:
+    return re.sub(r"\d+", "#", os.path.basename(caminho).upper())
+
+def detectar_encoding(prefixo: bytes) -> str:
+    """BOM -> utf-8-sig; decode estrito utf-8; senão cp1252; em último caso latin-1."""
+    if prefixo.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    for enc in ("utf-8", "cp1252"):
         try:
-            sep = detectar_sep_por_frequencia(caminho, enc)
-            with open(caminho, "r", encoding=enc, errors="replace", newline="") as f:
-                reader = csv.reader(
-                    f, delimiter=sep, quotechar='"', doublequote=True,
-                    escapechar="\\", strict=False
-                )
-                rows = [r for r in reader]
-        except Exception:
+            # incremental: o prefixo pode cortar um caractere multibyte no fim
+            codecs.getincrementaldecoder(enc)().decode(prefixo, final=False)
+            return enc
+        except UnicodeDecodeError:
             continue
+    return "latin-1"
 
-        rows = [r for r in rows if any(str(cell).strip() != "" for cell in r)]
-        if not rows:
-            return pd.DataFrame()  # vazio
+# linhas que entram na contagem do separador
+SEP_LINHAS = 201
 
-        header = [h.strip().replace("\ufeff", "") for h in rows[0]]
-        n_cols = len(header)
-        if n_cols == 0:
-            return pd.DataFrame()
+def detectar_sep(texto: str) -> str:
+    """Separador mais frequente nas primeiras SEP_LINHAS linhas."""
+    trecho = "\n".join(texto.split("\n", SEP_LINHAS)[:SEP_LINHAS])
+    contagem = {c: trecho.count(c) for c in [",", ";", "|", "\t"]}
+    return max(contagem, key=contagem.get) or ","
 
-        norm = []
-        for r in rows[1:]:
-            if len(r) > n_cols:
-                r = r[: n_cols - 1] + [sep.join(r[n_cols - 1 :])]
-            elif len(r) < n_cols:
-                r = r + [""] * (n_cols - len(r))
-            norm.append(r)
+def detectar_formato(caminho: str, arquivo: ArquivoMapeado = None):
+    """
+    Decide (encoding, sep) por um prefixo limitado do arquivo (do mapeamento
+    `arquivo`, quando o chamador já tem um). O resultado fica em cache por
+    padrão de nome; num acerto de cache o encoding e o separador são conferidos
+    nos primeiros 8 KB quando eles já trazem as SEP_LINHAS linhas da contagem
+    (senão, no mesmo prefixo da detecção completa), e qualquer divergência
+    refaz a detecção completa.
+    """
+    t0 = time.perf_counter()
+    if arquivo is None:
+        with ArquivoMapeado(caminho) as arquivo:
+            return detectar_formato(caminho, arquivo)
+    chave = padrao_arquivo(caminho)
+    origem = "cache"
+    formato = _CACHE_FORMATO.get(chave)
+    if formato is not None:
+        inicio = arquivo.prefixo(8192)
+        if inicio.count(b"\n") < SEP_LINHAS:
+            # poucas linhas em 8 KB: a contagem seria outra que a da detecção completa
+            inicio = arquivo.prefixo(DETECCAO_BYTES)
+        if (detectar_encoding(inicio) != formato[0]
+                or detectar_sep(inicio.decode(formato[0], errors="replace")) != formato[1]):
+            formato = None
+    if formato is None:
+        origem = "detectado"
+        prefixo = arquivo.prefixo(DETECCAO_BYTES)
+        enc = detectar_encoding(prefixo)
+        sep = detectar_sep(prefixo.decode(enc, errors="replace"))
+        formato = (enc, sep)
+        if prefixo:
+            _CACHE_FORMATO[chave] = formato
+    dt = time.perf_counter() - t0
+    print(f"Formato: encoding={formato[0]} sep={formato[1]!r} ({origem}, {dt * 1000:.1f} ms)")
+    metricas.registrar("deteccao", dt, arquivo=os.path.basename(caminho), origem=origem,
+                       encoding=formato[0], sep=formato[1])
+    return formato
 
-        df = pd.DataFrame(norm, columns=header, dtype=str).fillna("")
-        return df
+def ler_csv_robusto(caminho: str) -> pd.DataFrame:
+    r"""Detecta encoding/separador num único prefixo, faz uma só leitura e normaliza nº de colunas."""
+    with ArquivoMapeado(caminho) as arquivo:
+        enc, sep = detectar_formato(caminho, arquivo)
+        reader = csv.reader(
+            arquivo.linhas(enc), delimiter=sep, quotechar='"', doublequote=True,
+            escapechar="\\", strict=False
+        )
+        rows = [r for r in reader if "".join(r).strip()]
+    if not rows:
+        return pd.DataFrame()  # vazio
 
-    return pd.DataFrame()
+    plano = compilar_plano(tuple(rows[0]))
+    if plano.n_cols == 0:
+        return pd.DataFrame()
+    norm = list(normalizar_linhas(rows[1:], plano.n_cols, sep))
+    return pd.DataFrame(norm, columns=plano.header, dtype=str).fillna("")
 
 def header_valido(df_original: pd.DataFrame) -> bool:
     if df_original is None or df_original.empty:
         return False
-    presentes = sum(1 for c in df_original.columns if c.strip().replace("\ufeff","") in DE_PARA)
-    return presentes >= 10  # ajuste se necessário
+    return compilar_plano(tuple(df_original.columns)).valido
 
 def aplicar_mapeamento(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas de COLUNAS_DESTINO (sem arquivo_origem) tiradas por posição, pelo plano do cabeçalho."""
     if df.empty:
         return df
-    df.columns = [c.strip().replace("\ufeff", "") for c in df.columns]
-    df = df.rename(columns={c: DE_PARA[c] for c in df.columns if c in DE_PARA})
-    for col in COLUNAS_DESTINO:
-        if col != "arquivo_origem" and col not in df.columns:
-            df[col] = ""
-    return df[[c for c in COLUNAS_DESTINO if c != "arquivo_origem"]]
+    plano = compilar_plano(tuple(df.columns))
+    if plano.erro:
+        raise ValueError(plano.erro)
+    destinos = COLUNAS_DESTINO[:-1]
+    return pd.DataFrame(
+        {c: (df.iloc[:, i] if i >= 0 else "") for c, i in zip(destinos, plano.indices)},
+        index=df.index,
+    )
 
 def inserir_copy(conn, tabela: str, df: pd.DataFrame, arquivo_origem: str) -> int:
     if df.empty:
@@ -195,42 +347,857 @@ def inserir_copy(conn, tabela: str, df: pd.DataFrame, arquivo_origem: str) -> in
     conn.commit()
     return linhas
 
+# ========= MAPEAMENTO =========
+
+HEADER_MIN_COLUNAS = 10  # colunas conhecidas (DE_PARA) para aceitar o cabeçalho
+
+class PlanoCabecalho:
+    """
+    Mapeamento compilado de uma assinatura de cabeçalho (a tupla exata lida do
+    arquivo, antes de strip/BOM): para cada coluna de COLUNAS_DESTINO, o índice
+    da coluna de origem (-1 quando ausente). `extrair` é um itemgetter sobre a
+    linha normalizada com a cauda ("", arquivo_origem): devolve a linha mapeada
+    inteira, arquivo_origem incluído, numa chamada em C.
+    """
+
+    def __init__(self, header_bruto: tuple):
+        self.header = [h.strip().replace("\ufeff", "") for h in header_bruto]
+        self.n_cols = len(self.header)
+        self.presentes = sum(1 for h in self.header if h in DE_PARA)
+        self.valido = self.presentes >= HEADER_MIN_COLUNAS
+        self.erro = None
+        idx = {}
+        for i, h in enumerate(self.header):
+            destino = DE_PARA.get(h)
+            if destino is None:
+                continue
+            if destino in idx:
+                # o caminho pandas geraria colunas duplicadas e o COPY falharia
+                self.erro = f"Cabeçalho com coluna duplicada para '{destino}': {h}"
+                break
+            idx[destino] = i
+        self.indices = [idx.get(c, -1) for c in COLUNAS_DESTINO[:-1]]
+        vazio, origem = self.n_cols, self.n_cols + 1
+        self.extrair = itemgetter(*[i if i >= 0 else vazio for i in self.indices], origem)
+
+@lru_cache(maxsize=256)
+def compilar_plano(header_bruto: tuple) -> PlanoCabecalho:
+    """Plano do cabeçalho, compilado uma vez por assinatura (o fornecedor repete poucas)."""
+    return PlanoCabecalho(header_bruto)
+
+def normalizar_linhas(linhas, n_cols: int, sep: str, cauda=()):
+    """
+    Ajusta cada linha a `n_cols` campos e acrescenta `cauda`: faltando campos,
+    completa com vazios; sobrando, junta o excedente com `sep` no último campo.
+    As listas do csv.reader são alteradas no lugar, sem cópia por linha.
+    """
+    cauda = list(cauda)
+    complementos = [[""] * (n_cols - k) + cauda for k in range(n_cols + 1)]
+    ultimo = n_cols - 1
+    for r in linhas:
+        k = len(r)
+        if k <= n_cols:
+            r += complementos[k]
+        else:
+            r[ultimo:] = [sep.join(r[ultimo:]), *cauda]
+        yield r
+
+# ========= STREAMING =========
+
+class LeitorCsvStream:
+    """
+    Versão em streaming de ler_csv_robusto: mesma detecção de formato, mesmo
+    descarte de linhas vazias e mesma normalização do nº de colunas, mas as
+    linhas são produzidas uma a uma, sem materializar o arquivo.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._arquivo = ArquivoMapeado(caminho)
+        self.encoding, self.sep = detectar_formato(caminho, self._arquivo)
+        reader = csv.reader(
+            self._arquivo.linhas(self.encoding), delimiter=self.sep, quotechar='"', doublequote=True,
+            escapechar="\\", strict=False
+        )
+        self._linhas = (r for r in reader if "".join(r).strip())
+        primeira = next(self._linhas, None)
+        self.plano = compilar_plano(tuple(primeira)) if primeira else None
+        self.header = self.plano.header if self.plano else []
+        # espia a 1ª linha de dados: arquivo só com cabeçalho conta como vazio
+        self._primeira = next(self._linhas, None) if self.header else None
+
+    @property
+    def vazio(self) -> bool:
+        return not self.header or self._primeira is None
+
+    def linhas_brutas(self):
+        """Linhas não vazias como vieram do csv.reader (sem normalizar)."""
+        if self.vazio:
+            return iter(())
+        r, self._primeira = self._primeira, None
+        return self._linhas if r is None else _encadear(r, self._linhas)
+
+    def __iter__(self):
+        return normalizar_linhas(self.linhas_brutas(), len(self.header), self.sep)
+
+    def close(self):
+        self._arquivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _encadear(primeira, resto):
+    yield primeira
+    yield from resto
+
+def header_valido_stream(leitor: LeitorCsvStream) -> bool:
+    return not leitor.vazio and leitor.plano.valido  # mesmo critério de header_valido
+
+def linhas_mapeadas(leitor: LeitorCsvStream, arquivo_origem: str):
+    """Linhas na ordem de COLUNAS_DESTINO, com arquivo_origem no fim."""
+    plano = leitor.plano
+    if plano is None:
+        return iter(())
+    if plano.erro:
+        raise ValueError(plano.erro)
+    cauda = ("", os.path.basename(arquivo_origem))
+    linhas = normalizar_linhas(leitor.linhas_brutas(), plano.n_cols, leitor.sep, cauda)
+    return map(list, map(plano.extrair, linhas))
+
+_PLANO_TIPADO = tipos.plano_tipado(COLUNAS_DESTINO)
+
+def linhas_tipadas(linhas):
+    """Acrescenta a cada linha mapeada os valores de tipos.COLUNAS_TIPADAS."""
+    converter = tipos.converter_linha
+    for linha in linhas:
+        linha.extend(converter(linha, _PLANO_TIPADO))
+        yield linha
+
+def linhas_para_copy(leitor: LeitorCsvStream, arquivo_origem: str, tipada: bool = False,
+                     filtro: dedup.FiltroLinhas = None):
+    linhas = linhas_mapeadas(leitor, arquivo_origem)
+    if filtro is not None:
+        linhas = filtro(linhas)
+    return linhas_tipadas(linhas) if tipada else linhas
+
+def formato_copy(tipada: bool = False) -> str:
+    return "text" if tipada else COPY_FORMATO
+
+def garantir_colunas_tipadas(conn):
+    """Cria as colunas tipadas da staging só quando faltam (ALTER pega lock exclusivo)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = 'staging' AND table_name = 'stg_pedidos' AND column_name = 'tipado'"
+        )
+        if cur.fetchone() is None:
+            cur.execute(tipos.DDL_COLUNAS_TIPADAS)
+    conn.commit()
+
+COPY_FORMATOS = ("csv", "text", "binary")
+
+# cabeçalho e trailer do formato binário do COPY
+_PGCOPY_HEADER  = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_PGCOPY_TRAILER = struct.pack("!h", -1)
+
+def _escapar_text(v: str) -> str:
+    if "\\" in v:
+        v = v.replace("\\", "\\\\")
+    return v.replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+class CopyStream:
+    """
+    Objeto file-like para copy_expert: renderiza as linhas em blocos de
+    COPY_LINHAS_POR_BLOCO no formato pedido:
+      csv    -> QUOTE_ALL, igual ao to_csv do caminho pandas
+      text   -> formato text do PostgreSQL (tab, escapes com barra), sem aspas
+      binary -> formato binário do PostgreSQL (campos texto em `encoding`, o
+                client_encoding da conexão: o servidor converte a partir dele)
+    Em todos os formatos string vazia continua sendo string vazia (não NULL);
+    None vira NULL (\\N) apenas no formato text, usado pela carga tipada.
+    """
+
+    def __init__(self, linhas, formato: str = "csv", encoding: str = "utf-8"):
+        if formato not in COPY_FORMATOS:
+            raise ValueError(f"COPY_FORMATO inválido: {formato}")
+        self.formato = formato
+        self.encoding = encoding
+        self._linhas = iter(linhas)
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf, quoting=csv.QUOTE_ALL, lineterminator="\n")
+        self._fim = False
+        if formato == "binary":
+            self._pendente = _PGCOPY_HEADER
+        else:
+            self._pendente = ""
+        self.linhas = 0
+        # tempo gasto puxando linhas do gerador (leitura + mapeamento + tipos)
+        self.t_linhas = 0.0
+
+    def _bloco_csv(self, linhas) -> str:
+        self._buf.seek(0)
+        self._buf.truncate()
+        for linha in linhas:
+            self._writer.writerow(linha)
+        return self._buf.getvalue()
+
+    @staticmethod
+    def _bloco_text(linhas) -> str:
+        out = []
+        for linha in linhas:
+            if None in linha:
+                out.append("\t".join("\\N" if v is None else _escapar_text(v) for v in linha))
+                continue
+            # \0 não é aceito em text pelo PostgreSQL: serve de separador provisório
+            # para escapar a linha inteira de uma vez
+            bruto = "\0".join(linha)
+            if "\\" in bruto:
+                bruto = bruto.replace("\\", "\\\\")
+            if "\t" in bruto:
+                bruto = bruto.replace("\t", "\\t")
+            if "\n" in bruto or "\r" in bruto:
+                bruto = bruto.replace("\n", "\\n").replace("\r", "\\r")
+            out.append(bruto.replace("\0", "\t"))
+        return "\n".join(out) + "\n" if out else ""
+
+    def _bloco_binary(self, linhas) -> bytes:
+        pack_h = struct.Struct("!h").pack
+        pack_i = struct.Struct("!i").pack
+        enc = self.encoding
+        out = []
+        for linha in linhas:
+            out.append(pack_h(len(linha)))
+            for v in linha:
+                b = v.encode(enc)
+                out.append(pack_i(len(b)))
+                out.append(b)
+        return b"".join(out)
+
+    def _proximo_bloco(self):
+        t0 = time.perf_counter()
+        lote = list(islice(self._linhas, COPY_LINHAS_POR_BLOCO))
+        self.t_linhas += time.perf_counter() - t0
+        self.linhas += len(lote)
+        if self.formato == "binary":
+            if not lote:
+                if self._fim:
+                    return b""
+                self._fim = True
+                return _PGCOPY_TRAILER
+            return self._bloco_binary(lote)
+        if not lote:
+            return ""
+        if self.formato == "text":
+            return self._bloco_text(lote)
+        return self._bloco_csv(lote)
+
+    def read(self, size: int = -1):
+        if size is None or size < 0:
+            size = 1 << 20
+        while len(self._pendente) < size:
+            bloco = self._proximo_bloco()
+            if not bloco:
+                break
+            self._pendente += bloco
+        out, self._pendente = self._pendente[:size], self._pendente[size:]
+        return out
+
+    readline = read
+
+def colunas_copy(tipada: bool = False) -> list:
+    return COLUNAS_DESTINO + esquema.COLUNAS_TIPADAS if tipada else COLUNAS_DESTINO
+
+def sql_copy(tabela: str, formato: str = "csv", tipada: bool = False, encoding: str = None) -> str:
+    """`encoding`: encoding dos bytes enviados, quando não é o client_encoding (só csv/text)."""
+    cols_sql = esquema.lista(colunas_copy(tipada))
+    opcoes = f"FORMAT {formato}"
+    if encoding and formato != "binary":
+        opcoes += f", ENCODING '{encoding}'"
+    return f"COPY {tabela} ({cols_sql}) FROM STDIN WITH ({opcoes})"
+
+def _taxa(linhas: int, segundos: float):
+    return round(linhas / segundos) if segundos > 0 else None
+
+def inserir_copy_stream(conn, tabela: str, linhas, formato: str = None, tipada: bool = False) -> int:
+    formato = formato or formato_copy(tipada)
+    enc = banco.codec_cliente(conn) if formato == "binary" else "utf-8"
+    stream = CopyStream(linhas, formato, enc)
+    t0 = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.copy_expert(sql_copy(tabela, formato, tipada), stream)
+    conn.commit()
+    dt = time.perf_counter() - t0
+    metricas.registrar("parse_mapeamento", stream.t_linhas, linhas=stream.linhas, caminho="plano",
+                       linhas_por_s=_taxa(stream.linhas, stream.t_linhas))
+    t_copy = dt - stream.t_linhas
+    metricas.registrar("copy", t_copy, linhas=stream.linhas, formato=formato,
+                       linhas_por_s=_taxa(stream.linhas, t_copy))
+    return stream.linhas
+
 # ========= PIPELINE =========
 
-def processar():
-    novos = listar_csv_novos(DIR_NOVOS, DIR_LIDOS, DIR_ERROS)
-    if not novos:
-        print("Nenhum arquivo novo para processar.")
-        return
+def carregar_arquivo(conn, caminho: str, filtro: dedup.FiltroLinhas = None):
+    """
+    Carrega um arquivo na staging. Retorna nº de linhas ou None se cabeçalho inválido.
+    Com `filtro`, linhas repetidas são descartadas (filtro.repetidas) e os hashes
+    novos ficam em filtro.novas até o chamador confirmar.
+    """
+    with metricas.perfil(caminho), metricas.medir("carga", arquivo=os.path.basename(caminho)) as m:
+        inseridas = _carregar_arquivo(conn, caminho, filtro)
+        m["linhas"] = inseridas or 0
+        if filtro is not None:
+            m["linhas_repetidas"] = filtro.repetidas
+    return inseridas
+
+def _carregar_arquivo(conn, caminho: str, filtro: dedup.FiltroLinhas = None):
+    if CARGA_STREAMING or CARGA_TIPADA or filtro is not None:
+        with LeitorCsvStream(caminho) as leitor:
+            if not header_valido_stream(leitor):
+                return None
+            linhas = linhas_para_copy(leitor, caminho, CARGA_TIPADA, filtro)
+            return inserir_copy_stream(conn, TABELA_DESTINO, linhas, tipada=CARGA_TIPADA)
+
+    t0 = time.perf_counter()
+    with metricas.medir("parse") as m:
+        df_raw = ler_csv_robusto(caminho)
+        m["linhas"] = len(df_raw)
+    if not header_valido(df_raw):
+        return None
+    with metricas.medir("mapeamento"):
+        df = aplicar_mapeamento(df_raw)
+    dt = time.perf_counter() - t0
+    metricas.registrar("parse_mapeamento", dt, linhas=len(df), caminho="pandas",
+                       linhas_por_s=_taxa(len(df), dt))
+    with metricas.medir("copy", formato="csv") as m:
+        m["linhas"] = inserir_copy(conn, TABELA_DESTINO, df, caminho)
+    return m["linhas"]
 
-    with psycopg2.connect(**DB_CFG) as conn:
+def finalizar_arquivo(manifest: Manifest, caminho: str, inseridas, erro: Exception = None,
+                      repetidas: int = 0, duplicado_de: str = None):
+    """Roteia o arquivo para lidos/ ou erros/ e registra o resultado no manifesto."""
+    nome = os.path.basename(caminho)
+    if erro is not None:
+        print(f"Falha ao processar {nome}. Enviando para 'erros'. Motivo: {erro}")
+        destino, status = DIR_ERROS, STATUS_ERRO
+    elif duplicado_de is not None:
+        print(f"{nome}: conteúdo idêntico a {duplicado_de}, já carregado. Enviando para 'lidos'.")
+        destino, status = DIR_LIDOS, STATUS_DUPLICADO
+    elif inseridas == 0 and repetidas:
+        print(f"{nome}: todas as {repetidas} linhas já estavam carregadas. Enviando para 'lidos'.")
+        destino, status = DIR_LIDOS, STATUS_DUPLICADO
+    elif inseridas is None:
+        print(f"{nome}: arquivo vazio ou cabeçalho inesperado. Enviando para 'erros'.")
+        destino, status = DIR_ERROS, STATUS_ERRO
+    elif inseridas == 0:
+        print(f"{nome}: 0 linhas inseridas. Enviando para 'erros'.")
+        destino, status = DIR_ERROS, STATUS_ERRO
+    else:
+        extra = f" (repetidas descartadas: {repetidas})" if repetidas else ""
+        print(f"{nome}: linhas inseridas: {inseridas}{extra}")
+        destino, status = DIR_LIDOS, STATUS_LIDO
+    if destino == DIR_LIDOS and duplicado_de is None:
+        manifest.registrar_conteudo(manifest.sha256_local(nome, caminho), nome, os.path.getsize(caminho))
+    dst = arquivar_arquivo(caminho, destino)
+    manifest.registrar_carga(nome, status, dst)
+    print(f"{'Copiado' if CARGA_DESTINO == 'copiar' else 'Movido'} para {os.path.basename(destino)}: {dst}")
+
+def arquivo_duplicado(manifest: Manifest, caminho: str):
+    """Nome do arquivo já carregado com o mesmo sha256, ou None."""
+    if not CARGA_DEDUP_ARQUIVOS:
+        return None
+    return manifest.conteudo_carregado(manifest.sha256_local(os.path.basename(caminho), caminho))
+
+def pular_duplicado(manifest: Manifest, caminho: str, evitados: dedup.Evitados = None) -> bool:
+    """Se o conteúdo já foi carregado, roteia o arquivo como duplicado sem lê-lo."""
+    original = arquivo_duplicado(manifest, caminho)
+    if original is None:
+        return False
+    tamanho = os.path.getsize(caminho)
+    if evitados is not None:
+        evitados.arquivo(tamanho)
+    metricas.registrar("dedup_arquivo", bytes=tamanho, arquivo=os.path.basename(caminho))
+    finalizar_arquivo(manifest, caminho, None, duplicado_de=original)
+    return True
+
+def processar_arquivo(conn, manifest: Manifest, caminho: str, evitados: dedup.Evitados = None):
+    """Deduplicação, carga e roteamento de um arquivo. Retorna linhas inseridas (None se não carregou)."""
+    if pular_duplicado(manifest, caminho, evitados):
+        return None
+    filtro = dedup.FiltroLinhas(manifest) if CARGA_DEDUP_LINHAS else None
+    inseridas = None
+    try:
+        inseridas = carregar_arquivo(conn, caminho, filtro)
+        repetidas = 0
+        if filtro is not None:
+            # COPY já commitado: só agora as linhas passam a contar como carregadas
+            filtro.confirmar()
+            repetidas = filtro.repetidas
+            if evitados is not None:
+                evitados.somar_linhas(repetidas)
+        finalizar_arquivo(manifest, caminho, inseridas, repetidas=repetidas)
+    except Exception as e:
+        # COPY interrompido deixa a transação abortada
+        conn.rollback()
+        finalizar_arquivo(manifest, caminho, None, e)
+        inseridas = None
+    return inseridas
+
+def imprimir_resumo(tempos, inicio: float, evitados: dedup.Evitados = None):
+    """tempos: lista de (nome, linhas, seg_parse, seg_copy, seg_total); parse/copy None no modo sequencial."""
+    total = time.perf_counter() - inicio
+    linhas = sum(t[1] or 0 for t in tempos)
+    print("===== RESUMO =====")
+    for nome, n, t_parse, t_copy, t_total in tempos:
+        detalhe = f" parse={t_parse:.2f}s copy={t_copy:.2f}s" if t_parse is not None else ""
+        print(f"{nome}: linhas={n or 0}{detalhe} total={t_total:.2f}s")
+    taxa = linhas / total if total > 0 else 0
+    print(f"Arquivos: {len(tempos)} | Linhas: {linhas} | Tempo total: {total:.2f}s | {taxa:.0f} linhas/s")
+    if evitados is not None:
+        print(evitados.resumo())
+
+def processar_sequencial(manifest: Manifest, novos: List[str], evitados: dedup.Evitados = None):
+    tempos = []
+    with banco.conexao() as conn:
         for caminho in novos:
+            t0 = time.perf_counter()
+            print(f"Lendo: {caminho}")
+            inseridas = processar_arquivo(conn, manifest, caminho, evitados)
+            dt = time.perf_counter() - t0
+            tempos.append((os.path.basename(caminho), inseridas, None, None, dt))
+    return tempos
+
+# ========= CARGA PARALELA =========
+
+def gravar_payload(res: dict, linhas, formato: str, encoding: str) -> int:
+    """Grava o COPY das linhas num arquivo temporário (res["tmp"]). Retorna o nº de linhas."""
+    fd, res["tmp"] = tempfile.mkstemp(prefix="stg_", suffix=".csv")
+    stream = CopyStream(linhas, formato, encoding)
+    if formato == "binary":
+        out = os.fdopen(fd, "wb")
+    else:
+        out = os.fdopen(fd, "w", encoding="utf-8", newline="")
+    with out:
+        shutil.copyfileobj(stream, out, 1 << 20)
+    return stream.linhas
+
+def remover_payload(res: dict):
+    if res.get("tmp"):
+        try:
+            os.remove(res["tmp"])
+        except OSError:
+            pass
+        res["tmp"] = None
+
+def copiar_payload(cur, res: dict, tabela: str, formato: str, tipada: bool = False):
+    """
+    COPY do payload gravado por gravar_payload. Os bytes vão para o servidor
+    como estão, em blocos de 1 MB: csv/text foram gravados em utf-8 e o COPY
+    declara ENCODING 'UTF8'; o binário foi gravado no client_encoding
+    (banco.codec_cliente), que é de onde o servidor converte os campos texto.
+    """
+    with open(res["tmp"], "rb") as f:
+        cur.copy_expert(sql_copy(tabela, formato, tipada, encoding="UTF8"), f, size=1 << 20)
+
+def preparar_arquivo(caminho: str, formato: str = "csv", encoding: str = "utf-8",
+                     tipada: bool = False, manifest_dedup: str = None) -> dict:
+    """
+    Executa num processo do pool: lê, valida e mapeia o arquivo e grava o
+    payload do COPY (no formato pedido) num arquivo temporário (memória constante).
+    Com `manifest_dedup` (caminho do manifesto), descarta linhas já carregadas;
+    os hashes novos voltam em res["hashes"] para o registro após o commit.
+    """
+    t0 = time.perf_counter()
+    res = {"caminho": caminho, "valido": False, "tmp": None, "linhas": 0, "erro": None,
+           "hashes": [], "repetidas": 0}
+    manifest = Manifest(manifest_dedup) if manifest_dedup else None
+    try:
+        filtro = dedup.FiltroLinhas(manifest) if manifest is not None else None
+        with LeitorCsvStream(caminho) as leitor:
+            if header_valido_stream(leitor):
+                linhas = linhas_para_copy(leitor, caminho, tipada, filtro)
+                res["linhas"] = gravar_payload(res, linhas, formato, encoding)
+                res["valido"] = True
+                if filtro is not None:
+                    res["hashes"], res["repetidas"] = filtro.novas, filtro.repetidas
+    except Exception as e:
+        res["erro"] = str(e)
+    finally:
+        if manifest is not None:
+            manifest.close()
+    res["t_parse"] = time.perf_counter() - t0
+    return res
+
+def copiar_preparado(manifest: Manifest, res: dict,
+                     formato: str = "csv", tipada: bool = False, evitados: dedup.Evitados = None):
+    """Executa numa thread: COPY do payload preparado numa transação própria."""
+    caminho = res["caminho"]
+    t0 = time.perf_counter()
+    inseridas = None
+    try:
+        if res["erro"]:
+            raise RuntimeError(res["erro"])
+        if res["valido"]:
+            with banco.conexao() as conn:
+                # erro no COPY: banco.conexao() desfaz a transação na devolução
+                with conn.cursor() as cur:
+                    copiar_payload(cur, res, TABELA_DESTINO, formato, tipada)
+                conn.commit()
+            inseridas = res["linhas"]
+            if res["hashes"]:
+                manifest.registrar_linhas(res["hashes"])
+            if evitados is not None:
+                evitados.somar_linhas(res["repetidas"])
+            metricas.registrar("parse_mapeamento", res["t_parse"], linhas=inseridas,
+                               linhas_repetidas=res["repetidas"], arquivo=os.path.basename(caminho),
+                               caminho="plano", linhas_por_s=_taxa(inseridas, res["t_parse"]))
+            metricas.registrar("copy", time.perf_counter() - t0, linhas=inseridas, formato=formato)
+        finalizar_arquivo(manifest, caminho, inseridas, repetidas=res["repetidas"])
+    except Exception as e:
+        finalizar_arquivo(manifest, caminho, None, e)
+    finally:
+        remover_payload(res)
+    t_copy = time.perf_counter() - t0
+    return (os.path.basename(caminho), inseridas, res["t_parse"], t_copy, res["t_parse"] + t_copy)
+
+def processar_paralelo(manifest: Manifest, novos: List[str], workers: int, conexoes: int,
+                       evitados: dedup.Evitados = None):
+    """
+    Parse/mapeamento em CARGA_WORKERS processos; cada arquivo pronto entra
+    numa fila de COPY atendida por CARGA_CONEXOES conexões. Cada arquivo
+    mantém sua própria transação e seu roteamento lidos/erros.
+    Arquivos com o mesmo conteúdo de outro do lote ficam para o fim, em
+    sequência: só são pulados se o primeiro tiver sido carregado. A
+    deduplicação de linhas compara com o que já estava commitado quando o
+    processo começou o arquivo; arquivos do mesmo lote não se enxergam.
+    """
+    print(f"Carga paralela: {workers} processos, {conexoes} conexões")
+    tempos, lote, adiados, shas = [], [], [], set()
+    for caminho in novos:
+        if pular_duplicado(manifest, caminho, evitados):
+            tempos.append((os.path.basename(caminho), None, None, None, 0.0))
+            continue
+        sha = manifest.sha256_local(os.path.basename(caminho), caminho) if CARGA_DEDUP_ARQUIVOS else caminho
+        (adiados if sha in shas else lote).append(caminho)
+        shas.add(sha)
+    manifest_dedup = manifest.caminho if CARGA_DEDUP_LINHAS else None
+    banco.pool(minimo=conexoes)
+    formato = formato_copy(CARGA_TIPADA)
+    with banco.conexao() as conn:
+        enc = banco.codec_cliente(conn)
+    with ProcessPoolExecutor(max_workers=workers) as procs, \
+         ThreadPoolExecutor(max_workers=conexoes) as copiadores:
+        preparos = [procs.submit(preparar_arquivo, c, formato, enc, CARGA_TIPADA, manifest_dedup)
+                    for c in lote]
+        copias = []
+        for fut in as_completed(preparos):
+            copias.append(copiadores.submit(
+                copiar_preparado, manifest, fut.result(), formato, CARGA_TIPADA, evitados
+            ))
+        tempos += [c.result() for c in copias]
+    if adiados:
+        with banco.conexao() as conn:
+            for caminho in adiados:
+                t0 = time.perf_counter()
+                inseridas = processar_arquivo(conn, manifest, caminho, evitados)
+                tempos.append((os.path.basename(caminho), inseridas, None, None, time.perf_counter() - t0))
+    return tempos
+
+# ========= CARGA FATIADA =========
+#
+# Um arquivo grande é cortado em faixas de bytes [inicio, fim). Os cortes são
+# só candidatos (início de linha), escolhidos sem ler o arquivo: um campo
+# entre aspas com quebra de linha (endereco_completo, nome_destinatario) pode
+# atravessar o corte. Cada processo lê sua faixa com o mesmo dialeto do
+# csv.reader e informa onde o último registro terminou de fato (fim_real).
+# As faixas são conferidas em ordem: se o início de uma não é o fim_real da
+# anterior, ela é lida de novo a partir do ponto certo. As linhas resultantes
+# são as mesmas da leitura sequencial.
+
+FATIA_BLOCO = 4 * 1024 * 1024
+# quanto o último registro de uma faixa pode passar do corte antes de a faixa
+# ser dada como mal cortada (e refeita a partir do fim real da anterior)
+FATIA_EXCEDENTE_MAX = 8 * 1024 * 1024
+
+class LeitorFatia:
+    """
+    Leitor da faixa de bytes [inicio, fim) de um arquivo, com a interface de
+    LeitorCsvStream usada por linhas_mapeadas (plano, sep, linhas_brutas).
+    `inicio` deve ser início de registro. Produz os registros que começam antes
+    de `fim`; o último pode terminar depois, e `fim_real` guarda esse ponto.
+    """
+
+    def __init__(self, caminho: str, inicio: int, fim: int, encoding: str, sep: str,
+                 header_bruto: tuple = None, excedente_max: int = None):
+        self.caminho = caminho
+        self.encoding = encoding
+        if encoding == "utf-8-sig":
+            # o BOM só existe no início do arquivo: é pulado lá e as faixas são utf-8
+            self.encoding = "utf-8"
+            if inicio == 0:
+                inicio = len(codecs.BOM_UTF8)
+        self.inicio, self.fim = inicio, fim
+        self.sep = sep
+        self.plano = compilar_plano(header_bruto) if header_bruto is not None else None
+        self.excedente_max = excedente_max
+        self.pos = inicio
+        self.fim_real = None
+        self._arquivo = ArquivoMapeado(caminho)
+
+    def _linhas(self):
+        """
+        Linhas decodificadas a partir de `inicio`, quebradas como no modo
+        newline="" (\\r, \\n ou \\r\\n); `pos` avança a cada linha entregue.
+        Decodificadas uma a uma: o offset em bytes de cada linha é o que
+        confirma os cortes.
+        """
+        mm = self._arquivo.mm
+        for a, b in self._arquivo.blocos(self.inicio, tamanho=FATIA_BLOCO):
+            for linha in mm[a:b].splitlines(True):
+                self.pos += len(linha)
+                if self.excedente_max is not None and self.pos - self.fim > self.excedente_max:
+                    raise ValueError(f"Registro passa mais de {self.excedente_max} bytes do fim da fatia")
+                yield linha.decode(self.encoding, "replace")
+
+    def linhas_brutas(self):
+        """Linhas não vazias que começam na faixa, como vieram do csv.reader."""
+        reader = csv.reader(
+            self._linhas(), delimiter=self.sep, quotechar='"', doublequote=True,
+            escapechar="\\", strict=False
+        )
+        while self.pos < self.fim:
+            r = next(reader, None)
+            if r is None:
+                break
+            if "".join(r).strip():
+                yield r
+        self.fim_real = self.pos
+
+    def close(self):
+        self._arquivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def fatiar_arquivo(caminho: str) -> bool:
+    """Se o arquivo vai pela carga fatiada (a deduplicação de linhas e o caminho pandas não são fatiados)."""
+    if CARGA_FATIA_MB <= 0 or CARGA_WORKERS <= 1 or CARGA_DEDUP_LINHAS:
+        return False
+    if not (CARGA_STREAMING or CARGA_TIPADA):
+        return False
+    return os.path.getsize(caminho) > CARGA_FATIA_MB * 1024 * 1024
+
+def cortes_fatias(arquivo: ArquivoMapeado, inicio: int, tamanho_fatia: int) -> List[int]:
+    """[inicio, c1, ..., tamanho do arquivo]: cada corte é o primeiro início de linha a partir de inicio + k * tamanho_fatia."""
+    return [inicio] + [b for _, b in arquivo.blocos(inicio, tamanho=tamanho_fatia)]
+
+def preparar_fatia(caminho: str, inicio: int, fim: int, encoding_arquivo: str, sep: str,
+                   header_bruto: tuple, formato: str = "csv", encoding: str = "utf-8",
+                   tipada: bool = False, excedente_max: int = None) -> dict:
+    """Executa num processo do pool: lê e mapeia uma faixa e grava o payload do COPY."""
+    t0 = time.perf_counter()
+    res = {"caminho": caminho, "inicio": inicio, "fim": fim, "fim_real": None,
+           "tmp": None, "linhas": 0, "erro": None}
+    try:
+        with LeitorFatia(caminho, inicio, fim, encoding_arquivo, sep, header_bruto, excedente_max) as leitor:
+            res["linhas"] = gravar_payload(res, linhas_para_copy(leitor, caminho, tipada), formato, encoding)
+            res["fim_real"] = leitor.fim_real
+    except Exception as e:
+        remover_payload(res)
+        res["erro"] = str(e)
+    res["t_parse"] = time.perf_counter() - t0
+    return res
+
+def cabecalho_arquivo(caminho: str, encoding: str, sep: str):
+    """(cabeçalho bruto, offset da primeira linha de dados) ou (None, None) se o arquivo não tem registros."""
+    with LeitorFatia(caminho, 0, os.path.getsize(caminho), encoding, sep) as leitor:
+        header = next(leitor.linhas_brutas(), None)
+        return (tuple(header), leitor.pos) if header is not None else (None, None)
+
+def criar_rascunho(tabela: str, tipada: bool = False) -> str:
+    """Tabela UNLOGGED só com as colunas do COPY, sem constraints nem defaults. Retorna o nome."""
+    nome = f"{tabela}_fatias_{uuid.uuid4().hex[:8]}"
+    with banco.conexao() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE UNLOGGED TABLE {nome} AS "
+                        f"SELECT {esquema.lista(colunas_copy(tipada))} FROM {tabela} WITH NO DATA")
+        conn.commit()
+    return nome
+
+def publicar_rascunho(rascunho: str, tabela: str, tipada: bool = False) -> int:
+    """Move tudo do rascunho para a tabela num único INSERT ... SELECT (uma transação)."""
+    cols_sql = esquema.lista(colunas_copy(tipada))
+    with banco.conexao() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"INSERT INTO {tabela} ({cols_sql}) SELECT {cols_sql} FROM {rascunho}")
+            n = cur.rowcount
+        conn.commit()
+    return n
+
+def descartar_rascunho(rascunho: str):
+    with banco.conexao() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {rascunho}")
+        conn.commit()
+
+def carregar_fatiado(caminho: str, workers: int, conexoes: int, tabela: str = TABELA_DESTINO):
+    """
+    Carga de um arquivo em fatias paralelas. As conexões copiam as fatias para
+    uma tabela de rascunho (criar_rascunho), e só com todas copiadas as linhas
+    vão para a staging num único INSERT ... SELECT: ou o arquivo entra inteiro,
+    ou nada entra. Retorna nº de linhas ou None se o arquivo está vazio ou o
+    cabeçalho é inválido.
+    """
+    nome = os.path.basename(caminho)
+    with ArquivoMapeado(caminho) as arquivo:
+        encoding, sep = detectar_formato(caminho, arquivo)
+        header, inicio = cabecalho_arquivo(caminho, encoding, sep)
+        plano = compilar_plano(header) if header is not None else None
+        if plano is None or not plano.valido:
+            return None
+        if plano.erro:
+            raise ValueError(plano.erro)
+        cortes = cortes_fatias(arquivo, inicio, CARGA_FATIA_MB * 1024 * 1024)
+    n_fatias = len(cortes) - 1
+    print(f"{nome}: {n_fatias} fatias de ~{CARGA_FATIA_MB} MB, {workers} processos, {conexoes} conexões")
+
+    formato = formato_copy(CARGA_TIPADA)
+    banco.pool(minimo=conexoes)
+    conns, livres = [], queue.Queue()
+
+    def copiar(res):
+        try:
+            if not res["linhas"]:
+                return 0
+            conn = livres.get()
+            try:
+                with conn.cursor() as cur:
+                    copiar_payload(cur, res, rascunho, formato, CARGA_TIPADA)
+            finally:
+                livres.put(conn)
+            return res["linhas"]
+        finally:
+            remover_payload(res)
+
+    preparos, refeitas, t_parse = [], 0, 0.0
+    t0 = time.perf_counter()
+    # rascunho antes de tirar as conexões das cópias: com CARGA_CONEXOES >= PG_POOL_MAX
+    # o pool não teria uma conexão a mais (ThreadedConnectionPool não espera)
+    rascunho = criar_rascunho(tabela, CARGA_TIPADA)
+    try:
+        for _ in range(conexoes):
+            conns.append(banco.obter())
+            livres.put(conns[-1])
+        enc = banco.codec_cliente(conns[0])
+        with ProcessPoolExecutor(max_workers=workers) as procs, \
+             ThreadPoolExecutor(max_workers=conexoes) as copiadores:
+            def preparar(ini, fim, excedente_max):
+                fut = procs.submit(preparar_fatia, caminho, ini, fim, encoding, sep, header,
+                                   formato, enc, CARGA_TIPADA, excedente_max)
+                preparos.append(fut)
+                return fut
+
+            futs = [preparar(a, b, FATIA_EXCEDENTE_MAX) for a, b in zip(cortes, cortes[1:])]
+            copias, esperado = [], inicio
             try:
-                print(f"Lendo: {caminho}")
-                df_raw = ler_csv_robusto(caminho)
-
-                if not header_valido(df_raw):
-                    print("Arquivo vazio ou cabeçalho inesperado. Enviando para 'erros'.")
-                    dst = safe_copy(caminho, DIR_ERROS)
-                    print(f"Copiado para erros: {dst}")
-                    continue
-
-                df = aplicar_mapeamento(df_raw)
-                inseridas = inserir_copy(conn, TABELA_DESTINO, df, caminho)
-                print(f"Linhas inseridas: {inseridas}")
-
-                if inseridas > 0:
-                    dst = safe_copy(caminho, DIR_LIDOS)
-                    print(f"Copiado para lidos: {dst}")
-                else:
-                    print("0 linhas inseridas. Enviando para 'erros'.")
-                    dst = safe_copy(caminho, DIR_ERROS)
-                    print(f"Copiado para erros: {dst}")
-
-            except Exception as e:
-                print(f"Falha ao processar. Enviando para 'erros'. Motivo: {e}")
-                dst = safe_copy(caminho, DIR_ERROS)
-                print(f"Copiado para erros: {dst}")
+                for fut in futs:
+                    res = fut.result()
+                    t_parse += res["t_parse"]
+                    if res["erro"] or res["inicio"] != esperado:
+                        # o corte caiu dentro de um registro: relê a faixa do fim real da anterior
+                        remover_payload(res)
+                        refeitas += 1
+                        res = preparar(esperado, res["fim"], None).result()
+                        t_parse += res["t_parse"]
+                        if res["erro"]:
+                            raise ValueError(res["erro"])
+                    esperado = res["fim_real"]
+                    copias.append(copiadores.submit(copiar, res))
+                inseridas = sum(c.result() for c in copias)
+            finally:
+                for fut in preparos:
+                    fut.cancel()
+        for conn in conns:
+            conn.commit()
+        for conn in conns:
+            banco.devolver(conn)
+        conns = []
+        inseridas = publicar_rascunho(rascunho, tabela, CARGA_TIPADA)
+    finally:
+        for fut in preparos:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                remover_payload(fut.result())
+        # transação ainda aberta (falha antes do commit) é desfeita na devolução
+        for conn in conns:
+            banco.devolver(conn)
+        descartar_rascunho(rascunho)
+    dt = time.perf_counter() - t0
+    if refeitas:
+        print(f"{nome}: {refeitas} fatia(s) relida(s) a partir do fim real da anterior")
+    metricas.registrar("parse_mapeamento", t_parse, linhas=inseridas, caminho="fatias",
+                       linhas_por_s=_taxa(inseridas, t_parse), arquivo=nome)
+    metricas.registrar("carga_fatiada", dt, linhas=inseridas, arquivo=nome, fatias=n_fatias,
+                       refeitas=refeitas, processos=workers, conexoes=conexoes,
+                       linhas_por_s=_taxa(inseridas, dt))
+    return inseridas or None
+
+def processar_fatiado(manifest: Manifest, caminho: str, workers: int, conexoes: int,
+                      evitados: dedup.Evitados = None):
+    """Deduplicação, carga fatiada e roteamento de um arquivo grande."""
+    t0 = time.perf_counter()
+    print(f"Lendo em fatias: {caminho}")
+    inseridas = None
+    if not pular_duplicado(manifest, caminho, evitados):
+        try:
+            with metricas.perfil(caminho), metricas.medir("carga", arquivo=os.path.basename(caminho)) as m:
+                inseridas = carregar_fatiado(caminho, workers, conexoes)
+                m["linhas"] = inseridas or 0
+            finalizar_arquivo(manifest, caminho, inseridas)
+        except Exception as e:
+            finalizar_arquivo(manifest, caminho, None, e)
+            inseridas = None
+    return (os.path.basename(caminho), inseridas, None, None, time.perf_counter() - t0)
+
+def processar():
+    inicio = time.perf_counter()
+    metricas.iniciar("02_load_stage_pedidos")
+    try:
+        _processar(inicio)
+    finally:
+        banco.fechar()
+        metricas.atual().fechar()
+
+def _processar(inicio: float):
+    with Manifest(MANIFEST_PATH) as manifest:
+        novos = listar_csv_novos(DIR_NOVOS, DIR_LIDOS, DIR_ERROS, manifest)
+        if not novos:
+            print("Nenhum arquivo novo para processar.")
+            return
+
+        if CARGA_TIPADA:
+            with banco.conexao() as conn:
+                garantir_colunas_tipadas(conn)
+
+        if CARGA_DEDUP_LINHAS:
+            podadas = manifest.podar_linhas(CARGA_DEDUP_DIAS)
+            if podadas:
+                print(f"Hashes de linha com mais de {CARGA_DEDUP_DIAS} dias removidos: {podadas}")
+
+        evitados = dedup.Evitados()
+        grandes = [c for c in novos if fatiar_arquivo(c)]
+        tempos = [processar_fatiado(manifest, c, CARGA_WORKERS, max(1, CARGA_CONEXOES), evitados)
+                  for c in grandes]
+        novos = [c for c in novos if c not in grandes]
+        if CARGA_WORKERS > 1 and len(novos) > 1:
+            tempos += processar_paralelo(manifest, novos, CARGA_WORKERS, max(1, CARGA_CONEXOES), evitados)
+        elif novos:
+            tempos += processar_sequencial(manifest, novos, evitados)
+    imprimir_resumo(tempos, inicio, evitados)
 
 if __name__ == "__main__":
     processar()
@@ -1,273 +1,418 @@
 # upsert_dw.py
-import os, sys, psycopg2
-from dotenv import load_dotenv
+import os, sys, time, queue, threading
+from pedidos import metricas, banco, esquema
 
-ENV_PATH = r"C:\Users\atend\OneDrive\Área de Trabalho\git_jb\sftp-data-ingestion\.env\banco.env"
-
-def load_env():
-    ok = load_dotenv(ENV_PATH, override=True)
-    if not ok:
-        raise RuntimeError(f"Não encontrei o .env em: {ENV_PATH}")
-    required = ["PGHOST","PGUSER","PGPASSWORD","PGDATABASE","PGPORT"]
-    missing = [k for k in required if not os.getenv(k)]
-    if missing:
-        raise RuntimeError(f"Variáveis ausentes: {', '.join(missing)}")
+# 1 = processa só as linhas da staging carregadas desde o último upsert bem-sucedido
+UPSERT_INCREMENTAL = os.getenv("UPSERT_INCREMENTAL", "1") == "1"
+# Upsert fatiado: nº aproximado de linhas da staging por fatia (0 = um único
+# comando) e nº de conexões que executam fatias em paralelo.
+UPSERT_FATIA_LINHAS = int(os.getenv("UPSERT_FATIA_LINHAS", "0"))
+UPSERT_CONEXOES     = int(os.getenv("UPSERT_CONEXOES", "1"))
+# 1 = usa o caminho rápido (colunas tipadas) quando todas as linhas do
+# intervalo vieram da carga tipada; senão converte o texto no SQL
+UPSERT_TIPADO = os.getenv("UPSERT_TIPADO", "1") == "1"
 
 CREATE_UNIQUE = r"""
 CREATE UNIQUE INDEX IF NOT EXISTS ux_fat_pedidos_chave_nfe
   ON dw.fat_pedidos (chave_nfe);
 """
 
-UPSERT_SQL = r"""
+# Estrutura de controle do upsert incremental (executada só quando ausente):
+# - stg_seq: sequência de carga preenchida por default a cada linha copiada
+# - dw.ctl_upsert_pedidos: uma linha por execução, com a marca d'água (seq_ate);
+#   só execuções concluídas contam para a marca d'água
+# - dw.ctl_upsert_fatias: progresso de cada fatia no modo fatiado (retomada)
+# - hash_conteudo: hash da última linha aplicada a cada chave do DW
+SETUP_SQL = CREATE_UNIQUE + r"""
+ALTER TABLE staging.stg_pedidos ADD COLUMN IF NOT EXISTS stg_seq bigserial;
+CREATE INDEX IF NOT EXISTS ix_stg_pedidos_stg_seq ON staging.stg_pedidos (stg_seq);
+
+CREATE TABLE IF NOT EXISTS dw.ctl_upsert_pedidos (
+  run_id          bigserial PRIMARY KEY,
+  iniciado_em     timestamptz NOT NULL DEFAULT now(),
+  concluido_em    timestamptz,
+  modo            text        NOT NULL,
+  seq_de          bigint      NOT NULL,
+  seq_ate         bigint      NOT NULL,
+  linhas_staging  bigint,
+  inseridas       bigint,
+  atualizadas     bigint,
+  duracao_ms      bigint
+);
+ALTER TABLE dw.ctl_upsert_pedidos ADD COLUMN IF NOT EXISTS n_fatias int;
+
+CREATE TABLE IF NOT EXISTS dw.ctl_upsert_fatias (
+  run_id          bigint      NOT NULL REFERENCES dw.ctl_upsert_pedidos (run_id),
+  fatia           int         NOT NULL,
+  status          text        NOT NULL DEFAULT 'pendente',
+  linhas_staging  bigint,
+  inseridas       bigint,
+  atualizadas     bigint,
+  duracao_ms      bigint,
+  concluido_em    timestamptz,
+  PRIMARY KEY (run_id, fatia)
+);
+
+ALTER TABLE dw.fat_pedidos ADD COLUMN IF NOT EXISTS hash_conteudo bytea;
+ALTER TABLE dw.ctl_upsert_pedidos ADD COLUMN IF NOT EXISTS ignoradas bigint;
+ALTER TABLE dw.ctl_upsert_fatias ADD COLUMN IF NOT EXISTS ignoradas bigint;
+"""
+
+# coluna mais recente de SETUP_SQL: se existe, a estrutura está atualizada
+SETUP_SENTINELA = ("dw.ctl_upsert_fatias", "ignoradas")
+
+# Fecha o intervalo da execução: o lock SHARE espera os COPY em andamento
+# terminarem, então toda linha com stg_seq <= max já está visível.
+SQL_INTERVALO = r"""
+LOCK TABLE staging.stg_pedidos IN SHARE MODE;
+SELECT
+  COALESCE((SELECT max(seq_ate) FROM dw.ctl_upsert_pedidos WHERE concluido_em IS NOT NULL), 0),
+  COALESCE((SELECT max(stg_seq) FROM staging.stg_pedidos), 0);
+"""
+
+SQL_REGISTRA_EXECUCAO = r"""
+INSERT INTO dw.ctl_upsert_pedidos
+  (iniciado_em, concluido_em, modo, seq_de, seq_ate, linhas_staging, inseridas, atualizadas,
+   ignoradas, duracao_ms)
+VALUES (%(iniciado_em)s, now(), %(modo)s, %(seq_de)s, %(seq_ate)s, %(linhas_staging)s,
+        %(inseridas)s, %(atualizadas)s, %(ignoradas)s, %(duracao_ms)s);
+"""
+
+FILTRO_INCREMENTAL = "WHERE s.stg_seq > %(seq_de)s AND s.stg_seq <= %(seq_ate)s"
+
+# Fatia por hash da chave normalizada: todas as ocorrências de uma chave caem
+# na mesma fatia, então o ranking por chave continua correto e fatias
+# paralelas nunca disputam a mesma linha do DW.
+FILTRO_FATIA = r"""
+    AND mod(hashtext(regexp_replace(s.chave_nfe,'\D','','g'))::bigint + 2147483648, %(n_fatias)s) = %(fatia)s"""
+
+SQL_TEM_TIPADAS = r"""
+SELECT 1 FROM information_schema.columns
+WHERE table_schema = 'staging' AND table_name = 'stg_pedidos' AND column_name = 'tipado';
+"""
+
+SQL_INTERVALO_NAO_TIPADO = r"""
+SELECT EXISTS (
+  SELECT 1 FROM staging.stg_pedidos s
+  WHERE s.stg_seq > %(seq_de)s AND s.stg_seq <= %(seq_ate)s AND NOT s.tipado
+);
+"""
+
+SQL_CONTA_INTERVALO = r"""
+SELECT count(*) FROM staging.stg_pedidos s
+WHERE s.stg_seq > %(seq_de)s AND s.stg_seq <= %(seq_ate)s;
+"""
+
+SQL_RUN_PENDENTE = r"""
+SELECT run_id, modo, seq_de, seq_ate, n_fatias
+FROM dw.ctl_upsert_pedidos
+WHERE concluido_em IS NULL AND n_fatias IS NOT NULL
+ORDER BY run_id
+LIMIT 1;
+"""
+
+SQL_ABRE_RUN = r"""
+INSERT INTO dw.ctl_upsert_pedidos (modo, seq_de, seq_ate, n_fatias)
+VALUES (%(modo)s, %(seq_de)s, %(seq_ate)s, %(n_fatias)s)
+RETURNING run_id;
+"""
+
+SQL_ABRE_FATIAS = r"""
+INSERT INTO dw.ctl_upsert_fatias (run_id, fatia)
+SELECT %(run_id)s, g FROM generate_series(0, %(n_fatias)s - 1) g;
+"""
+
+SQL_FATIAS_PENDENTES = r"""
+SELECT fatia FROM dw.ctl_upsert_fatias
+WHERE run_id = %(run_id)s AND status <> 'ok'
+ORDER BY fatia;
+"""
+
+SQL_FATIA_OK = r"""
+UPDATE dw.ctl_upsert_fatias
+SET status = 'ok', linhas_staging = %(linhas_staging)s, inseridas = %(inseridas)s,
+    atualizadas = %(atualizadas)s, ignoradas = %(ignoradas)s, duracao_ms = %(duracao_ms)s,
+    concluido_em = now()
+WHERE run_id = %(run_id)s AND fatia = %(fatia)s;
+"""
+
+SQL_FECHA_RUN = r"""
+UPDATE dw.ctl_upsert_pedidos r
+SET concluido_em   = now(),
+    linhas_staging = f.linhas_staging,
+    inseridas      = f.inseridas,
+    atualizadas    = f.atualizadas,
+    ignoradas      = f.ignoradas,
+    duracao_ms     = %(duracao_ms)s
+FROM (
+  SELECT COALESCE(sum(linhas_staging), 0) AS linhas_staging,
+         COALESCE(sum(inseridas), 0)      AS inseridas,
+         COALESCE(sum(atualizadas), 0)    AS atualizadas,
+         COALESCE(sum(ignoradas), 0)      AS ignoradas
+  FROM dw.ctl_upsert_fatias
+  WHERE run_id = %(run_id)s
+) f
+WHERE r.run_id = %(run_id)s
+RETURNING r.linhas_staging, r.inseridas, r.atualizadas, r.ignoradas;
+"""
+
+# As listas de colunas, as conversões de cada coluna (caminho texto e
+# tipado), o hash e o SET do ON CONFLICT são gerados de pedidos/esquema.py;
+# aqui fica só o que não depende das colunas: ranking por chave, filtro e
+# contagens.
+UPSERT_TEMPLATE = r"""
 WITH src AS (
   SELECT
-    NULLIF(TRIM(s.id),'')                              AS id,
-    NULLIF(TRIM(s.pedido),'')                          AS pedido,
-    CASE WHEN length(regexp_replace(s.chave_nfe,'\D','','g'))=44
-         THEN regexp_replace(s.chave_nfe,'\D','','g')  ELSE NULL END AS chave_nfe,
-
-    /* ---- DATE ---- */
-    CASE
-      WHEN btrim(s.data_nfe) IN ('', '00/00/0000', '00/00/0000 00:00:00', '0000-00-00') THEN NULL
-      WHEN btrim(s.data_nfe) ~ '^\d{2}/\d{2}/\d{4}( \d{2}:\d{2}:\d{2})?$'
-        THEN to_timestamp(CASE WHEN position(' ' in btrim(s.data_nfe))>0 THEN btrim(s.data_nfe) ELSE btrim(s.data_nfe)||' 00:00:00' END,'DD/MM/YYYY HH24:MI:SS')::date
-      WHEN btrim(s.data_nfe) ~ '^\d{2}-\d{2}-\d{4}$' THEN to_date(s.data_nfe,'DD-MM-YYYY')
-      WHEN btrim(s.data_nfe) ~ '^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$'
-        THEN to_timestamp(replace(btrim(s.data_nfe),'T',' '),'YYYY-MM-DD HH24:MI:SS')::date
-      WHEN btrim(s.data_nfe) ~ '^\d{8}$' THEN to_date(s.data_nfe,'YYYYMMDD')
-      ELSE NULL
-    END AS data_nfe,
-
-    CASE
-      WHEN btrim(s.data_prev_entrega) IN ('', '00/00/0000', '00/00/0000 00:00:00', '0000-00-00') THEN NULL
-      WHEN btrim(s.data_prev_entrega) ~ '^\d{2}/\d{2}/\d{4}( \d{2}:\d{2}:\d{2})?$'
-        THEN to_timestamp(CASE WHEN position(' ' in btrim(s.data_prev_entrega))>0 THEN btrim(s.data_prev_entrega) ELSE btrim(s.data_prev_entrega)||' 00:00:00' END,'DD/MM/YYYY HH24:MI:SS')::date
-      WHEN btrim(s.data_prev_entrega) ~ '^\d{2}-\d{2}-\d{4}$' THEN to_date(s.data_prev_entrega,'DD-MM-YYYY')
-      WHEN btrim(s.data_prev_entrega) ~ '^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$'
-        THEN to_timestamp(replace(btrim(s.data_prev_entrega),'T',' '),'YYYY-MM-DD HH24:MI:SS')::date
-      WHEN btrim(s.data_prev_entrega) ~ '^\d{8}$' THEN to_date(s.data_prev_entrega,'YYYYMMDD')
-      ELSE NULL
-    END AS data_prev_entrega,
-
-    CASE
-      WHEN btrim(s.data_prev_entrega_original) IN ('', '00/00/0000', '00/00/0000 00:00:00', '0000-00-00') THEN NULL
-      WHEN btrim(s.data_prev_entrega_original) ~ '^\d{2}/\d{2}/\d{4}( \d{2}:\d{2}:\d{2})?$'
-        THEN to_timestamp(CASE WHEN position(' ' in btrim(s.data_prev_entrega_original))>0 THEN btrim(s.data_prev_entrega_original) ELSE btrim(s.data_prev_entrega_original)||' 00:00:00' END,'DD/MM/YYYY HH24:MI:SS')::date
-      WHEN btrim(s.data_prev_entrega_original) ~ '^\d{2}-\d{2}-\d{4}$' THEN to_date(s.data_prev_entrega_original,'DD-MM-YYYY')
-      WHEN btrim(s.data_prev_entrega_original) ~ '^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$'
-        THEN to_timestamp(replace(btrim(s.data_prev_entrega_original),'T',' '),'YYYY-MM-DD HH24:MI:SS')::date
-      WHEN btrim(s.data_prev_entrega_original) ~ '^\d{8}$' THEN to_date(s.data_prev_entrega_original,'YYYYMMDD')
-      ELSE NULL
-    END AS data_prev_entrega_original,
-
-    /* ---- TIMESTAMP ---- */
-    CASE
-      WHEN btrim(s.data_ultima_ocr) ~ '^\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}$'
-        THEN to_timestamp(btrim(s.data_ultima_ocr),'DD/MM/YYYY HH24:MI:SS')
-      WHEN btrim(s.data_ultima_ocr) ~ '^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2})?(\.\d+)?(Z|[+-]\d{2}:?\d{2})?$'
-        THEN to_timestamp(replace(btrim(s.data_ultima_ocr),'T',' '),'YYYY-MM-DD HH24:MI:SS')
-      WHEN btrim(s.data_ultima_ocr) ~ '^\d{2}/\d{2}/\d{4}$'
-        THEN to_timestamp(btrim(s.data_ultima_ocr)||' 00:00:00','DD/MM/YYYY HH24:MI:SS')
-      ELSE NULL
-    END                                               AS data_ultima_ocr_ts,
-
-    CASE
-      WHEN btrim(s.chegada_transportadora) ~ '^\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}$'
-        THEN to_timestamp(btrim(s.chegada_transportadora),'DD/MM/YYYY HH24:MI:SS')
-      WHEN btrim(s.chegada_transportadora) ~ '^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2})?$'
-        THEN to_timestamp(replace(btrim(s.chegada_transportadora),'T',' '),'YYYY-MM-DD HH24:MI:SS')
-      WHEN btrim(s.chegada_transportadora) ~ '^\d{2}/\d{2}/\d{4}$'
-        THEN to_timestamp(btrim(s.chegada_transportadora)||' 00:00:00','DD/MM/YYYY HH24:MI:SS')
-      ELSE NULL
-    END                                               AS chegada_transportadora,
-
-    NULLIF(TRIM(s.data_ultima_ocr),'')                AS data_ultima_ocr_raw,
-
-    /* ---- NUMÉRICOS ---- */
-    -- valor_nfe
-    CASE
-      WHEN s.valor_nfe IS NULL OR btrim(s.valor_nfe) = '' THEN NULL
-      WHEN btrim(s.valor_nfe) ~ '^[+-]?\d{1,3}(\.\d{3})+,\d{1,2}$'
-        THEN replace(replace(btrim(s.valor_nfe),'.',''),',','.')::numeric(15,2)
-      WHEN btrim(s.valor_nfe) ~ '^[+-]?\d{1,3}(,\d{3})+\.\d{1,2}$'
-        THEN replace(btrim(s.valor_nfe),',','')::numeric(15,2)
-      WHEN btrim(s.valor_nfe) ~ '^[+-]?\d+,\d{1,2}$'
-        THEN replace(btrim(s.valor_nfe),',','.')::numeric(15,2)
-      WHEN btrim(s.valor_nfe) ~ '^[+-]?\d+\.\d{1,2}$'
-        THEN btrim(s.valor_nfe)::numeric(15,2)
-      WHEN btrim(s.valor_nfe) ~ '^[+-]?\d{1,3}(\.\d{3})+$'
-        THEN replace(btrim(s.valor_nfe),'.','')::numeric(15,2)
-      WHEN btrim(s.valor_nfe) ~ '^[+-]?\d{1,3}(,\d{3})+$'
-        THEN replace(btrim(s.valor_nfe),',','')::numeric(15,2)
-      WHEN btrim(s.valor_nfe) ~ '^[+-]?\d+$'
-        THEN btrim(s.valor_nfe)::numeric(15,2)
-      ELSE CAST(replace(replace(regexp_replace(s.valor_nfe,'[^0-9,.-]','','g'),'.',''),',','.') AS numeric(15,2))
-    END                                               AS valor_nfe,
-
-    -- peso (corrigido)
-    CASE
-      WHEN s.peso IS NULL OR btrim(s.peso) = '' THEN NULL
-      WHEN btrim(s.peso) ~ '^[+-]?\d{1,3}(\.\d{3})+,\d{1,3}$'
-        THEN replace(replace(btrim(s.peso),'.',''),',','.')::numeric(12,3)
-      WHEN btrim(s.peso) ~ '^[+-]?\d{1,3}(,\d{3})+\.\d{1,3}$'
-        THEN replace(btrim(s.peso),',','')::numeric(12,3)
-      WHEN btrim(s.peso) ~ '^[+-]?\d+,\d{1,3}$'
-        THEN replace(btrim(s.peso),',','.')::numeric(12,3)
-      WHEN btrim(s.peso) ~ '^[+-]?\d+\.\d{1,3}$'
-        THEN btrim(s.peso)::numeric(12,3)
-      WHEN btrim(s.peso) ~ '^[+-]?\d{1,3}(\.\d{3})+$'
-        THEN replace(btrim(s.peso),'.','')::numeric(12,3)
-      WHEN btrim(s.peso) ~ '^[+-]?\d{1,3}(,\d{3})+$'
-        THEN replace(btrim(s.peso),',','')::numeric(12,3)
-      WHEN btrim(s.peso) ~ '^[+-]?\d+$'
-        THEN btrim(s.peso)::numeric(12,3)
-      ELSE CAST(replace(replace(regexp_replace(s.peso,'[^0-9,.-]','','g'),'.',''),',','.') AS numeric(12,3))
-    END                                               AS peso,
-
-    NULLIF(regexp_replace(s.qtd_volumes,'\D','','g'),'')::int AS qtd_volumes,
-    NULLIF(regexp_replace(s.cod_cd,'\D','','g'),'')::int AS cod_cd,
-
-    /* ---- TEXTOS ---- */
-    NULLIF(TRIM(s.serie_nfe),'')                      AS serie_nfe,
-    NULLIF(TRIM(s.numero_nfe),'')                     AS numero_nfe,
-    NULLIF(TRIM(s.remessa),'')                        AS remessa,
-    NULLIF(TRIM(s.nome_destinatario),'')              AS nome_destinatario,
-    NULLIF(TRIM(s.endereco_completo),'')              AS endereco_completo,
-    NULLIF(TRIM(s.cep),'')                            AS cep,
-    NULLIF(TRIM(s.cd),'')                             AS cd,
-    NULLIF(TRIM(regexp_replace(s.cnpj_cpf_transportadora,'\D','','g')),'') AS cnpj_cpf_transportadora,
-    NULLIF(TRIM(s.transportador),'')                  AS transportador,
-    NULLIF(TRIM(s.lead_time),'')                      AS lead_time,
-    NULLIF(TRIM(s.status_prazo),'')                   AS status_prazo,
-    NULLIF(TRIM(s.id_ult_ocr),'')                     AS id_ult_ocr,
-    NULLIF(TRIM(s.ultima_ocorrencia),'')              AS ultima_ocorrencia,
-    NULLIF(TRIM(s.chave_ult_ocr),'')                  AS chave_ult_ocr,
-    NULLIF(TRIM(s.tipo_entrega),'')                   AS tipo_entrega,
-    NULLIF(TRIM(s.agrupador),'')                      AS agrupador,
-    NULLIF(TRIM(s.endereco),'')                       AS endereco,
-    NULLIF(TRIM(s.numero),'')                         AS numero,
-    NULLIF(TRIM(s.bairro),'')                         AS bairro,
-    NULLIF(TRIM(s.cidades),'')                        AS cidades,
-    CASE WHEN length(upper(regexp_replace(s.uf,'[^A-Za-z]','','g'))) BETWEEN 2 AND 3
-         THEN upper(regexp_replace(s.uf,'[^A-Za-z]','','g')) ELSE NULL END AS uf,
-    NULLIF(TRIM(s.etiquetas),'')                      AS etiquetas,
-    NULLIF(TRIM(s.cod_vendedor),'')                   AS cod_vendedor,
-    NULLIF(TRIM(s.qtd_itens),'')                      AS qtd_itens,
-    NULLIF(TRIM(regexp_replace(s.cpf_destinatario,'\D','','g')),'') AS cpf_destinatario,
-    NULLIF(TRIM(s.grau_risco),'')                     AS grau_risco,
-    NULLIF(TRIM(s.tipo_operacao),'')                  AS tipo_operacao,
-    NULLIF(TRIM(s.arquivo_origem),'')                 AS arquivo_origem,
-
-    /* ---- CONTROLE ---- */
-    COALESCE(
-      CASE
-        WHEN btrim(s.data_insercao) ~ '^\d{2}/\d{2}/\d{4}( \d{2}:\d{2}:\d{2})?$'
-          THEN to_timestamp(CASE WHEN position(' ' in btrim(s.data_insercao))>0 THEN btrim(s.data_insercao) ELSE btrim(s.data_insercao)||' 00:00:00' END,'DD/MM/YYYY HH24:MI:SS')
-        WHEN btrim(s.data_insercao) ~ '^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$'
-          THEN to_timestamp(replace(btrim(s.data_insercao),'T',' '),'YYYY-MM-DD HH24:MI:SS')
-        ELSE NULL END,
-      now()
-    )                                                 AS data_insercao
+/*COLUNAS*/
   FROM staging.stg_pedidos s
+  /*FILTRO*/
 ),
 ranked AS (
   SELECT s.*,
          row_number() OVER (
            PARTITION BY s.chave_nfe
-           ORDER BY s.data_ultima_ocr_ts DESC NULLS LAST,
-                    s.data_insercao     DESC NULLS LAST
+           ORDER BY s.data_ultima_ocr DESC NULLS LAST,
+                    s.data_insercao   DESC NULLS LAST
          ) AS rn
   FROM src s
-)
-INSERT INTO dw.fat_pedidos (
-  id, data_insercao, tipo_entrega, pedido, data_nfe, serie_nfe, numero_nfe, valor_nfe,
-  qtd_volumes, peso, remessa, nome_destinatario, endereco_completo, cep, cod_cd, cd,
-  cnpj_cpf_transportadora, transportador, lead_time, data_prev_entrega, status_prazo,
-  id_ult_ocr, ultima_ocorrencia, chave_ult_ocr, data_ultima_ocr, agrupador, endereco,
-  numero, bairro, cidades, uf, etiquetas, chegada_transportadora, cod_vendedor,
-  chave_nfe, qtd_itens, data_prev_entrega_original, cpf_destinatario, grau_risco,
-  tipo_operacao, arquivo_origem
-)
+),
+up AS (
+INSERT INTO dw.fat_pedidos (/*INSERT*/, hash_conteudo)
 SELECT
-  r.id, r.data_insercao, r.tipo_entrega, r.pedido, r.data_nfe, r.serie_nfe, r.numero_nfe, r.valor_nfe,
-  r.qtd_volumes, r.peso, r.remessa, r.nome_destinatario, r.endereco_completo, r.cep, r.cod_cd, r.cd,
-  r.cnpj_cpf_transportadora, r.transportador, r.lead_time, r.data_prev_entrega, r.status_prazo,
-  r.id_ult_ocr, r.ultima_ocorrencia, r.chave_ult_ocr, r.data_ultima_ocr_ts, r.agrupador, r.endereco,
-  r.numero, r.bairro, r.cidades, r.uf, r.etiquetas, r.chegada_transportadora, r.cod_vendedor,
-  r.chave_nfe, r.qtd_itens, r.data_prev_entrega_original, r.cpf_destinatario, r.grau_risco,
-  r.tipo_operacao, r.arquivo_origem
+  /*SELECT*/,
+  -- tudo o que o merge abaixo usa, exceto a chave e os campos tratados à parte
+  -- (arquivo_origem só muda junto com data_ultima_ocr; data_insercao no WHERE)
+  decode(md5(ROW(/*HASH*/)::text), 'hex')
 FROM ranked r
 WHERE r.chave_nfe IS NOT NULL
   AND r.rn = 1
 ON CONFLICT (chave_nfe) DO UPDATE
 SET
-  data_ultima_ocr = CASE
-    WHEN EXCLUDED.data_ultima_ocr > dw.fat_pedidos.data_ultima_ocr THEN EXCLUDED.data_ultima_ocr
-    ELSE dw.fat_pedidos.data_ultima_ocr END,
-
-  data_prev_entrega = CASE WHEN EXCLUDED.data_ultima_ocr > dw.fat_pedidos.data_ultima_ocr THEN EXCLUDED.data_prev_entrega ELSE dw.fat_pedidos.data_prev_entrega END,
-  status_prazo      = CASE WHEN EXCLUDED.data_ultima_ocr > dw.fat_pedidos.data_ultima_ocr THEN EXCLUDED.status_prazo      ELSE dw.fat_pedidos.status_prazo      END,
-  id_ult_ocr        = CASE WHEN EXCLUDED.data_ultima_ocr > dw.fat_pedidos.data_ultima_ocr THEN EXCLUDED.id_ult_ocr        ELSE dw.fat_pedidos.id_ult_ocr        END,
-  ultima_ocorrencia = CASE WHEN EXCLUDED.data_ultima_ocr > dw.fat_pedidos.data_ultima_ocr THEN EXCLUDED.ultima_ocorrencia ELSE dw.fat_pedidos.ultima_ocorrencia END,
-  chave_ult_ocr     = CASE WHEN EXCLUDED.data_ultima_ocr > dw.fat_pedidos.data_ultima_ocr THEN EXCLUDED.chave_ult_ocr     ELSE dw.fat_pedidos.chave_ult_ocr     END,
-  chegada_transportadora = CASE WHEN EXCLUDED.data_ultima_ocr > dw.fat_pedidos.data_ultima_ocr THEN EXCLUDED.chegada_transportadora ELSE dw.fat_pedidos.chegada_transportadora END,
-  arquivo_origem    = CASE WHEN EXCLUDED.data_ultima_ocr > dw.fat_pedidos.data_ultima_ocr THEN EXCLUDED.arquivo_origem    ELSE dw.fat_pedidos.arquivo_origem    END,
-
-  data_insercao = GREATEST(dw.fat_pedidos.data_insercao, EXCLUDED.data_insercao),
-  valor_nfe     = COALESCE(EXCLUDED.valor_nfe, dw.fat_pedidos.valor_nfe),
-  qtd_volumes   = COALESCE(EXCLUDED.qtd_volumes, dw.fat_pedidos.qtd_volumes),
-  peso          = COALESCE(EXCLUDED.peso, dw.fat_pedidos.peso),
-  cod_cd        = COALESCE(EXCLUDED.cod_cd, dw.fat_pedidos.cod_cd),
-
-  id                  = COALESCE(EXCLUDED.id, dw.fat_pedidos.id),
-  tipo_entrega        = COALESCE(EXCLUDED.tipo_entrega, dw.fat_pedidos.tipo_entrega),
-  pedido              = COALESCE(EXCLUDED.pedido, dw.fat_pedidos.pedido),
-  serie_nfe           = COALESCE(EXCLUDED.serie_nfe, dw.fat_pedidos.serie_nfe),
-  numero_nfe          = COALESCE(EXCLUDED.numero_nfe, dw.fat_pedidos.numero_nfe),
-  remessa             = COALESCE(EXCLUDED.remessa, dw.fat_pedidos.remessa),
-  nome_destinatario   = COALESCE(EXCLUDED.nome_destinatario, dw.fat_pedidos.nome_destinatario),
-  endereco_completo   = COALESCE(EXCLUDED.endereco_completo, dw.fat_pedidos.endereco_completo),
-  cep                 = COALESCE(EXCLUDED.cep, dw.fat_pedidos.cep),
-  cd                  = COALESCE(EXCLUDED.cd, dw.fat_pedidos.cd),
-  cnpj_cpf_transportadora = COALESCE(EXCLUDED.cnpj_cpf_transportadora, dw.fat_pedidos.cnpj_cpf_transportadora),
-  transportador       = COALESCE(EXCLUDED.transportador, dw.fat_pedidos.transportador),
-  lead_time           = COALESCE(EXCLUDED.lead_time, dw.fat_pedidos.lead_time),
-  agrupador           = COALESCE(EXCLUDED.agrupador, dw.fat_pedidos.agrupador),
-  endereco            = COALESCE(EXCLUDED.endereco, dw.fat_pedidos.endereco),
-  numero              = COALESCE(EXCLUDED.numero, dw.fat_pedidos.numero),
-  bairro              = COALESCE(EXCLUDED.bairro, dw.fat_pedidos.bairro),
-  cidades             = COALESCE(EXCLUDED.cidades, dw.fat_pedidos.cidades),
-  uf                  = COALESCE(EXCLUDED.uf, dw.fat_pedidos.uf),
-  etiquetas           = COALESCE(EXCLUDED.etiquetas, dw.fat_pedidos.etiquetas),
-  cod_vendedor        = COALESCE(EXCLUDED.cod_vendedor, dw.fat_pedidos.cod_vendedor),
-  qtd_itens           = COALESCE(EXCLUDED.qtd_itens, dw.fat_pedidos.qtd_itens),
-  cpf_destinatario    = COALESCE(EXCLUDED.cpf_destinatario, dw.fat_pedidos.cpf_destinatario),
-  grau_risco          = COALESCE(EXCLUDED.grau_risco, dw.fat_pedidos.grau_risco),
-  tipo_operacao       = COALESCE(EXCLUDED.tipo_operacao, dw.fat_pedidos.tipo_operacao)
-;
+/*SET*/,
+  hash_conteudo = EXCLUDED.hash_conteudo
+-- Reaplicar a mesma linha não muda nada (máximos e COALESCE são idempotentes):
+-- com o hash igual ao da última linha aplicada, só data_insercao pode mudar.
+WHERE dw.fat_pedidos.hash_conteudo IS DISTINCT FROM EXCLUDED.hash_conteudo
+   OR GREATEST(dw.fat_pedidos.data_insercao, EXCLUDED.data_insercao)
+      IS DISTINCT FROM dw.fat_pedidos.data_insercao
+RETURNING (xmax = 0) AS inserida
+)
+SELECT
+  (SELECT count(*) FROM src)                       AS linhas_staging,
+  count(*) FILTER (WHERE inserida)                 AS inseridas,
+  count(*) FILTER (WHERE NOT inserida)             AS atualizadas,
+  (SELECT count(*) FROM ranked WHERE chave_nfe IS NOT NULL AND rn = 1) - count(*) AS ignoradas
+FROM up;
 """
 
-def run_upsert():
-    load_env()
-    conn = psycopg2.connect(
-        host=os.getenv("PGHOST"),
-        user=os.getenv("PGUSER"),
-        password=os.getenv("PGPASSWORD"),
-        dbname=os.getenv("PGDATABASE"),
-        port=os.getenv("PGPORT"),
-        options="-c search_path=public,staging,dw"
+def _gerar_upsert(tipado: bool) -> str:
+    return (UPSERT_TEMPLATE
+            .replace("/*COLUNAS*/", esquema.sql_select_staging(tipado))
+            .replace("/*INSERT*/", esquema.lista())
+            .replace("/*SELECT*/", esquema.lista(prefixo="r."))
+            .replace("/*HASH*/", esquema.sql_hash("r"))
+            .replace("/*SET*/", esquema.sql_set_conflito()))
+
+# Caminho texto: datas e números convertidos com CASE/regex a cada execução.
+# Caminho rápido: linhas gravadas pela carga tipada (CARGA_TIPADA=1 no 02)
+# já trazem as colunas convertidas. Os dois rodam como prepared statements
+# (banco.executar): o texto longo é analisado uma vez por conexão.
+UPSERT_SQL        = _gerar_upsert(tipado=False)
+UPSERT_SQL_TIPADO = _gerar_upsert(tipado=True)
+
+def upsert_sql(incremental: bool, fatiado: bool = False, tipado: bool = False) -> str:
+    # o caminho tipado sempre filtra pelo intervalo verificado (no modo
+    # completo seq_de = 0): linhas copiadas depois podem não ser tipadas
+    filtro = FILTRO_INCREMENTAL if incremental or fatiado or tipado else ""
+    if fatiado:
+        filtro += FILTRO_FATIA
+    sql = UPSERT_SQL_TIPADO if tipado else UPSERT_SQL
+    return sql.replace("/*FILTRO*/", filtro)
+
+def garantir_estrutura(cur):
+    """Cria índice único, stg_seq, hash_conteudo e tabelas de controle apenas quando faltam."""
+    cur.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_attribute "
+        "WHERE attrelid = to_regclass(%s) AND attname = %s AND NOT attisdropped)",
+        SETUP_SENTINELA,
     )
+    if not cur.fetchone()[0]:
+        cur.execute(SETUP_SQL)
+
+def intervalo_tipado(cur, seq_de: int, seq_ate: int) -> bool:
+    """True quando todas as linhas do intervalo têm as colunas tipadas preenchidas."""
+    if not UPSERT_TIPADO:
+        return False
+    cur.execute(SQL_TEM_TIPADAS)
+    if cur.fetchone() is None:
+        return False
+    cur.execute(SQL_INTERVALO_NAO_TIPADO, {"seq_de": seq_de, "seq_ate": seq_ate})
+    return not cur.fetchone()[0]
+
+def executar_fatia(conn, run: dict, fatia: int) -> dict:
+    """Upsert de uma fatia numa transação curta, registrando o resultado."""
+    t0 = time.perf_counter()
+    params = dict(run, fatia=fatia)
+    with conn, conn.cursor() as cur:
+        banco.executar(cur, upsert_sql(True, fatiado=True, tipado=run["tipado"]), params)
+        linhas, ins, upd, ign = cur.fetchone()
+        params.update(
+            linhas_staging=linhas, inseridas=ins, atualizadas=upd, ignoradas=ign,
+            duracao_ms=int((time.perf_counter() - t0) * 1000),
+        )
+        cur.execute(SQL_FATIA_OK, params)
+    metricas.registrar("upsert_fatia", params["duracao_ms"] / 1000, fatia=fatia, linhas_staging=linhas,
+                       inseridas=ins, atualizadas=upd, ignoradas=ign)
+    return params
+
+def run_upsert_fatiado(conn, modo: str, seq_de: int, seq_ate: int,
+                       fatia_linhas: int, conexoes: int) -> dict:
+    """
+    Upsert em fatias por hash de chave_nfe, cada uma na sua transação.
+    Se existir uma execução fatiada inacabada, ela é retomada (só as fatias
+    pendentes) antes de qualquer dado novo.
+    """
+    t0 = time.perf_counter()
+    with conn, conn.cursor() as cur:
+        cur.execute(SQL_RUN_PENDENTE)
+        pendente = cur.fetchone()
+        if pendente:
+            run_id, modo, seq_de, seq_ate, n_fatias = pendente
+            print(f"Retomando execução {run_id} (stg_seq {seq_de}..{seq_ate}, {n_fatias} fatias)")
+        else:
+            cur.execute(SQL_CONTA_INTERVALO, {"seq_de": seq_de, "seq_ate": seq_ate})
+            linhas = cur.fetchone()[0]
+            n_fatias = max(1, -(-linhas // fatia_linhas)) if linhas else 0
+            cur.execute(SQL_ABRE_RUN, {"modo": modo, "seq_de": seq_de, "seq_ate": seq_ate, "n_fatias": n_fatias})
+            run_id = cur.fetchone()[0]
+            cur.execute(SQL_ABRE_FATIAS, {"run_id": run_id, "n_fatias": n_fatias})
+        cur.execute(SQL_FATIAS_PENDENTES, {"run_id": run_id})
+        fatias = [r[0] for r in cur.fetchall()]
+        tipado = intervalo_tipado(cur, seq_de, seq_ate)
+
+    run = {"run_id": run_id, "seq_de": seq_de, "seq_ate": seq_ate, "n_fatias": n_fatias, "tipado": tipado}
+    fila = queue.Queue()
+    for f in fatias:
+        fila.put(f)
+    erros = []
+    lock = threading.Lock()
+
+    def worker(c):
+        while not erros:
+            try:
+                f = fila.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                r = executar_fatia(c, run, f)
+            except Exception as e:
+                with lock:
+                    erros.append((f, e))
+                return
+            with lock:
+                print(
+                    f"Fatia {f + 1}/{n_fatias}: staging={r['linhas_staging']} "
+                    f"inseridas={r['inseridas']} atualizadas={r['atualizadas']} "
+                    f"ignoradas={r['ignoradas']} tempo={r['duracao_ms'] / 1000:.2f}s"
+                )
+
+    n_conns = max(1, min(conexoes, len(fatias)))
+    # conexões extras vêm do pool compartilhado e voltam para ele
+    conns = [conn]
+    try:
+        conns += [banco.obter() for _ in range(n_conns - 1)]
+        threads = [threading.Thread(target=worker, args=(c,), daemon=True) for c in conns]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        for c in conns[1:]:
+            banco.devolver(c)
+
+    if erros:
+        f, e = erros[0]
+        raise RuntimeError(f"Falha na fatia {f + 1}/{n_fatias} da execução {run_id}; rode novamente para retomar: {e}")
+
+    with conn, conn.cursor() as cur:
+        cur.execute(SQL_FECHA_RUN, {"run_id": run_id, "duracao_ms": int((time.perf_counter() - t0) * 1000)})
+        linhas, ins, upd, ign = cur.fetchone()
+    stats = dict(
+        run, modo=modo, linhas_staging=linhas, inseridas=ins, atualizadas=upd, ignoradas=ign,
+        duracao_ms=int((time.perf_counter() - t0) * 1000),
+    )
+    _registrar_metricas(stats)
+    return stats
+
+def _registrar_metricas(st: dict):
+    metricas.registrar(
+        "upsert", st["duracao_ms"] / 1000, modo=st["modo"], caminho="tipado" if st["tipado"] else "texto",
+        linhas_staging=st["linhas_staging"] or 0, inseridas=st["inseridas"] or 0,
+        atualizadas=st["atualizadas"] or 0, ignoradas=st["ignoradas"] or 0,
+    )
+
+def run_upsert(incremental: bool = UPSERT_INCREMENTAL,
+               fatia_linhas: int = UPSERT_FATIA_LINHAS,
+               conexoes: int = UPSERT_CONEXOES,
+               conn=None) -> dict:
+    """Upsert staging -> DW. Sem `conn`, usa uma conexão do pool compartilhado (pedidos/banco.py)."""
+    propria = conn is None
+    if propria:
+        banco.pool(minimo=conexoes)
+        conn = banco.obter()
     try:
         with conn, conn.cursor() as cur:
-            cur.execute(CREATE_UNIQUE)
-            cur.execute(UPSERT_SQL)
+            garantir_estrutura(cur)
+            cur.execute(SQL_INTERVALO)
+            seq_de, seq_ate = cur.fetchone()
+        if not incremental:
+            seq_de = 0
+        modo = "incremental" if incremental else "completo"
+
+        if fatia_linhas > 0:
+            return run_upsert_fatiado(conn, modo, seq_de, seq_ate, fatia_linhas, conexoes)
+
+        stats = {
+            "modo": modo,
+            "seq_de": seq_de,
+            "seq_ate": seq_ate,
+            "tipado": False,
+            "linhas_staging": 0,
+            "inseridas": 0,
+            "atualizadas": 0,
+            "ignoradas": 0,
+        }
+        t0 = time.perf_counter()
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT now()")
+            stats["iniciado_em"] = cur.fetchone()[0]
+            if seq_ate > seq_de or not incremental:
+                stats["tipado"] = intervalo_tipado(cur, seq_de, seq_ate)
+                banco.executar(cur, upsert_sql(incremental, tipado=stats["tipado"]),
+                               {"seq_de": seq_de, "seq_ate": seq_ate})
+                linhas, ins, upd, ign = cur.fetchone()
+                stats.update(linhas_staging=linhas, inseridas=ins, atualizadas=upd, ignoradas=ign)
+            stats["duracao_ms"] = int((time.perf_counter() - t0) * 1000)
+            cur.execute(SQL_REGISTRA_EXECUCAO, stats)
+        _registrar_metricas(stats)
+        return stats
     finally:
-        conn.close()
+        if propria:
+            banco.devolver(conn)
 
 if __name__ == "__main__":
+    metricas.iniciar("03_upsert_dw_pedidos")
     try:
-        run_upsert()
-        print("Upsert concluído.")
+        st = run_upsert()
+        print(
+            f"Upsert concluído ({st['modo']}, stg_seq {st['seq_de']}..{st['seq_ate']}, "
+            f"caminho {'tipado' if st['tipado'] else 'texto'}). "
+            f"staging={st['linhas_staging']} inseridas={st['inseridas']} "
+            f"atualizadas={st['atualizadas']} ignoradas={st['ignoradas']} tempo={st['duracao_ms'] / 1000:.2f}s"
+        )
     except Exception as e:
         print(f"Erro ao executar upsert: {e}", file=sys.stderr)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+    finally:
+        banco.fechar()
+        metricas.atual().fechar()
@@ -1,47 +1,47 @@
 # move_staging_to_archive_safe.py
 import os, sys, uuid, time
-import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
 from psycopg2.extras import DictCursor
-from dotenv import load_dotenv
-
-ENV_PATH = r"C:\Users\atend\OneDrive\Área de Trabalho\git_jb\sftp-data-ingestion\.env\banco.env"
-
-def load_env():
-    ok = load_dotenv(ENV_PATH, override=True)
-    if not ok:
-        raise RuntimeError(f"Não encontrei o .env em: {ENV_PATH}")
-    required = ["PGHOST","PGUSER","PGPASSWORD","PGDATABASE","PGPORT"]
-    missing = [k for k in required if not os.getenv(k)]
-    if missing:
-        raise RuntimeError(f"Variáveis ausentes: {', '.join(missing)}")
-
-COLS = [
-    "id","data_insercao","tipo_entrega","pedido","data_nfe","serie_nfe","numero_nfe",
-    "valor_nfe","qtd_volumes","peso","remessa","nome_destinatario","endereco_completo",
-    "cep","cod_cd","cd","cnpj_cpf_transportadora","transportador","lead_time",
-    "data_prev_entrega","status_prazo","id_ult_ocr","ultima_ocorrencia","chave_ult_ocr",
-    "data_ultima_ocr","agrupador","endereco","numero","bairro","cidades","uf","etiquetas",
-    "chegada_transportadora","cod_vendedor","chave_nfe","qtd_itens","data_prev_entrega_original",
-    "cpf_destinatario","grau_risco","tipo_operacao","arquivo_origem"
-]
-COL_LIST = ", ".join(COLS)
-SRC_LIST = ", ".join(f"s.{c}" for c in COLS)
+from pedidos import particoes, metricas, banco, esquema
 
+# Modo de movimentação staging -> hist:
+#   atomico -> um INSERT ... SELECT e um DELETE no mesmo snapshot (tudo ou nada)
+#   lotes   -> faixas de stg_seq, um commit por lote (retomável, transações curtas)
+#   ctid    -> laço original de lotes por ctid numa única transação
+ARCHIVE_MODO = os.getenv("ARCHIVE_MODO", "atomico").lower()
+ARCHIVE_LOTE_LINHAS = int(os.getenv("ARCHIVE_LOTE_LINHAS", "50000"))
+ARCHIVE_STATEMENT_TIMEOUT_MS = int(os.getenv("ARCHIVE_STATEMENT_TIMEOUT_MS", "900000"))
+# 1 = só move linhas já processadas pelo upsert (stg_seq <= marca d'água do 03)
+ARCHIVE_SO_PROCESSADAS = os.getenv("ARCHIVE_SO_PROCESSADAS", "1") == "1"
+# hist particionada por mês: partições criadas com antecedência antes de mover
+ARCHIVE_MESES_A_FRENTE = int(os.getenv("ARCHIVE_MESES_A_FRENTE", "2"))
+
+TABELA_STAGING = "staging.stg_pedidos"
+TABELA_HIST    = "hist.archive_pedidos"
+ADVISORY_KEY   = "move_staging_to_archive"
+
+# mesmas colunas na staging e na hist (pedidos/esquema.py)
+COLS = esquema.COLUNAS
+COL_LIST = esquema.lista()
+SRC_LIST = esquema.lista(prefixo="s.")
+
+# /*FILTRO*/: limite da marca d'água do upsert (vazio = staging inteira)
 SQL_BATCH_MOVE_WITH_CTRL = f"""
 WITH to_move AS (
   SELECT ctid
-  FROM staging.stg_pedidos
+  FROM {{origem}} s
+  /*FILTRO*/
   LIMIT %(batch_size)s
 ),
 ins AS (
-  INSERT INTO hist.archive_pedidos (processed_ts, batch_id, {COL_LIST})
+  INSERT INTO {{destino}} (processed_ts, batch_id, {COL_LIST})
   SELECT now(), %(batch_id)s, {SRC_LIST}
-  FROM staging.stg_pedidos s
+  FROM {{origem}} s
   JOIN to_move t ON t.ctid = s.ctid
   RETURNING 1
 ),
 del AS (
-  DELETE FROM staging.stg_pedidos s
+  DELETE FROM {{origem}} s
   USING to_move t
   WHERE s.ctid = t.ctid
   RETURNING 1
@@ -50,62 +50,196 @@ SELECT (SELECT count(*) FROM ins) AS inserted,
        (SELECT count(*) FROM del) AS deleted;
 """
 
-def move_to_archive_safe(batch_size=5000, use_control_columns=True, lock_wait_ms=3000, stmt_timeout_ms=900000):
+# Movimentação por conjunto: uma passada de INSERT ... SELECT e uma de DELETE
+# com o mesmo filtro, sem laço sobre a staging. Rodam em REPEATABLE READ, então
+# enxergam exatamente as mesmas linhas. (Um DELETE ... RETURNING dentro de CTE
+# faz o mesmo num comando, mas materializa todas as linhas devolvidas e foi
+# ~40% mais lento no bench/bench_archive_staging.py.) Os dois são prepared
+# statements (banco.executar); o ::uuid fixa o tipo do parâmetro no PREPARE.
+SQL_INSERE_HIST = f"""
+INSERT INTO {{destino}} (processed_ts, batch_id, {COL_LIST})
+SELECT now(), %(batch_id)s::uuid, {SRC_LIST}
+FROM {{origem}} s
+/*FILTRO*/;
+"""
+
+SQL_APAGA_STAGING = """
+DELETE FROM {origem} s
+/*FILTRO*/;
+"""
+
+FILTRO_LIMITE = "WHERE s.stg_seq <= %(limite)s"
+FILTRO_FAIXA  = "WHERE s.stg_seq > %(de)s AND s.stg_seq <= %(ate)s"
+
+# fim do próximo lote: o batch_size-ésimo stg_seq depois de `de` (via índice)
+SQL_FIM_LOTE = """
+SELECT stg_seq FROM {origem}
+WHERE stg_seq > %(de)s AND stg_seq <= %(limite)s
+ORDER BY stg_seq
+OFFSET %(batch_size)s - 1 LIMIT 1;
+"""
+
+def sql_tabelas(sql: str, origem: str, destino: str, filtro: str = "") -> str:
+    return sql.replace("{origem}", origem).replace("{destino}", destino).replace("/*FILTRO*/", filtro)
+
+def limite_processadas(cur, origem: str = TABELA_STAGING):
     """
-    Move staging -> hist em lotes. Retorna (total_inserted, total_deleted, batch_id).
-    - lock não bloqueante
-    - lock_timeout e statement_timeout configurados
+    Maior stg_seq já aplicado ao DW pelo upsert (execuções concluídas).
+    None quando a tabela de controle não existe: a staging inteira é movida.
     """
-    load_env()
-    conn = psycopg2.connect(
-        host=os.getenv("PGHOST"),
-        user=os.getenv("PGUSER"),
-        password=os.getenv("PGPASSWORD"),
-        dbname=os.getenv("PGDATABASE"),
-        port=os.getenv("PGPORT"),
-        options="-c search_path=public,staging,hist"
-    )
+    cur.execute("SELECT to_regclass('dw.ctl_upsert_pedidos') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return None
+    cur.execute("SELECT COALESCE(max(seq_ate), 0) FROM dw.ctl_upsert_pedidos WHERE concluido_em IS NOT NULL")
+    return cur.fetchone()[0]
+
+def _mover_ctid(cur, batch_id, batch_size, limite, origem, destino):
+    filtro = FILTRO_LIMITE if limite is not None else ""
+    sql = sql_tabelas(SQL_BATCH_MOVE_WITH_CTRL, origem, destino, filtro)
+    total_ins = total_del = 0
+    while True:
+        cur.execute(sql, {"batch_id": batch_id, "batch_size": batch_size, "limite": limite})
+        inserted, deleted = cur.fetchone()
+        total_ins += int(inserted or 0)
+        total_del += int(deleted or 0)
+
+        if inserted == 0 and deleted == 0:
+            break  # staging esvaziada
+    return total_ins, total_del
+
+def _mover_set(cur, params: dict, origem: str, destino: str, filtro: str):
+    banco.executar(cur, sql_tabelas(SQL_INSERE_HIST, origem, destino, filtro), params)
+    inserted = cur.rowcount
+    banco.executar(cur, sql_tabelas(SQL_APAGA_STAGING, origem, destino, filtro), params)
+    deleted = cur.rowcount
+    if inserted != deleted:
+        raise RuntimeError(f"Divergência na movimentação: inserted={inserted}, deleted={deleted}. Revertido.")
+    return inserted, deleted
+
+def _mover_atomico(cur, batch_id, limite, origem, destino):
+    filtro = FILTRO_LIMITE if limite is not None else ""
+    return _mover_set(cur, {"batch_id": batch_id, "limite": limite}, origem, destino, filtro)
+
+def _configurar(cur, lock_wait_ms, stmt_timeout_ms):
+    """Identificação e timeouts só da transação corrente (a conexão volta ao pool intacta)."""
+    cur.execute("SET LOCAL application_name = 'move_staging_to_archive_safe'")
+    cur.execute("SET LOCAL lock_timeout = %s", (f"{lock_wait_ms}ms",))
+    cur.execute("SET LOCAL statement_timeout = %s", (f"{stmt_timeout_ms}ms",))
+
+def _mover_lotes(conn, cur, batch_id, batch_size, limite, origem, destino, lock_wait_ms, stmt_timeout_ms):
+    """Um commit por faixa de stg_seq; interrompido, o que já foi commitado fica consistente."""
+    if limite is None:
+        cur.execute(f"SELECT COALESCE(max(stg_seq), 0) FROM {origem}")
+        limite = cur.fetchone()[0]
+        conn.commit()
+        _configurar(cur, lock_wait_ms, stmt_timeout_ms)
+    sql_fim = sql_tabelas(SQL_FIM_LOTE, origem, destino)
+    total = 0
+    de = 0
+    while de < limite:
+        cur.execute(sql_fim, {"de": de, "limite": limite, "batch_size": batch_size})
+        r = cur.fetchone()
+        ate = r[0] if r else limite
+        t0 = time.perf_counter()
+        n, _ = _mover_set(cur, {"batch_id": batch_id, "de": de, "ate": ate}, origem, destino, FILTRO_FAIXA)
+        conn.commit()
+        _configurar(cur, lock_wait_ms, stmt_timeout_ms)
+        metricas.registrar("arquivamento_lote", time.perf_counter() - t0, linhas=n, ate=ate)
+        total += n
+        de = ate
+    return total, total
+
+def mover(conn, modo: str = ARCHIVE_MODO, batch_size: int = ARCHIVE_LOTE_LINHAS,
+          lock_wait_ms: int = 3000, stmt_timeout_ms: int = ARCHIVE_STATEMENT_TIMEOUT_MS,
+          so_processadas: bool = ARCHIVE_SO_PROCESSADAS,
+          origem: str = TABELA_STAGING, destino: str = TABELA_HIST):
+    """
+    Move staging -> hist na conexão dada. Retorna (total_inserted, total_deleted, batch_id).
+    Nos modos atomico e ctid tudo acontece numa transação (tudo ou nada); no
+    modo lotes cada lote é commitado. Timeouts e application_name são SET LOCAL,
+    reaplicados a cada transação.
+    """
+    if modo not in ("atomico", "lotes", "ctid"):
+        raise ValueError(f"ARCHIVE_MODO inválido: {modo}")
     batch_id = str(uuid.uuid4())
+    t0 = time.perf_counter()
 
-    try:
-        with conn:
-            with conn.cursor(cursor_factory=DictCursor) as cur:
-                # Identificação e timeouts
-                cur.execute("SET application_name = 'move_staging_to_archive_safe'")
-                cur.execute("SET LOCAL lock_timeout = %s", (f"{lock_wait_ms}ms",))
-                cur.execute("SET LOCAL statement_timeout = %s", (f"{stmt_timeout_ms}ms",))
-
-                # Tenta lock advisory sem bloquear indefinidamente
-                cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('move_staging_to_archive'))")
-                got = cur.fetchone()[0]
-                if not got:
-                    raise RuntimeError("Outro processo está movendo staging -> histórico. Abortado sem aguardar.")
-
-                total_ins = total_del = 0
-                while True:
-                    if use_control_columns:
-                        cur.execute(SQL_BATCH_MOVE_WITH_CTRL, {
-                            "batch_id": batch_id,
-                            "batch_size": batch_size
-                        })
-                    else:
-                        # Se sua hist NÃO tiver processed_ts/batch_id, adapte a SQL removendo essas colunas
-                        raise NotImplementedError("Ajuste a SQL para cenário sem colunas de controle.")
-
-                    inserted, deleted = cur.fetchone()
-                    total_ins += int(inserted or 0)
-                    total_del += int(deleted or 0)
-
-                    if inserted == 0 and deleted == 0:
-                        break  # staging esvaziada
-                return total_ins, total_del, batch_id
-    finally:
-        conn.close()
+    # Partições do mês corrente e seguintes, numa transação própria e curta
+    # (nada a fazer se a hist não for particionada ou já estiverem criadas)
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = %s", (f"{lock_wait_ms}ms",))
+        criadas = particoes.garantir(cur, destino, ARCHIVE_MESES_A_FRENTE)
+    conn.commit()
+    if criadas:
+        print(f"Partições criadas: {', '.join(criadas)}")
+
+    isolamento = conn.isolation_level
+    if modo != "ctid":
+        conn.rollback()
+        conn.isolation_level = ISOLATION_LEVEL_REPEATABLE_READ
+    with conn.cursor(cursor_factory=DictCursor) as cur:
+        try:
+            _configurar(cur, lock_wait_ms, stmt_timeout_ms)
+
+            # Tenta lock advisory sem bloquear indefinidamente (no modo lotes o
+            # lock é de sessão, para atravessar os commits)
+            if modo == "lotes":
+                cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (ADVISORY_KEY,))
+            else:
+                cur.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", (ADVISORY_KEY,))
+            got = cur.fetchone()[0]
+            if not got:
+                raise RuntimeError("Outro processo está movendo staging -> histórico. Abortado sem aguardar.")
+
+            try:
+                limite = limite_processadas(cur, origem) if so_processadas else None
+                if modo == "lotes":
+                    ins, dele = _mover_lotes(conn, cur, batch_id, batch_size, limite, origem, destino,
+                                             lock_wait_ms, stmt_timeout_ms)
+                elif modo == "atomico":
+                    ins, dele = _mover_atomico(cur, batch_id, limite, origem, destino)
+                else:
+                    ins, dele = _mover_ctid(cur, batch_id, batch_size, limite, origem, destino)
+            finally:
+                if modo == "lotes":
+                    conn.rollback()
+                    cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (ADVISORY_KEY,))
+                    conn.commit()
+            conn.commit()
+            metricas.registrar("arquivamento", time.perf_counter() - t0, modo=modo, linhas=ins, batch_id=batch_id)
+            return ins, dele, batch_id
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.isolation_level = isolamento
+
+def move_to_archive_safe(batch_size=ARCHIVE_LOTE_LINHAS, use_control_columns=True, lock_wait_ms=3000,
+                         stmt_timeout_ms=ARCHIVE_STATEMENT_TIMEOUT_MS, modo=ARCHIVE_MODO):
+    """
+    Move staging -> hist. Retorna (total_inserted, total_deleted, batch_id).
+    - lock não bloqueante
+    - lock_timeout e statement_timeout configurados
+    - modo: atomico (padrão), lotes ou ctid (ver ARCHIVE_MODO)
+    """
+    if not use_control_columns:
+        # Se sua hist NÃO tiver processed_ts/batch_id, adapte a SQL removendo essas colunas
+        raise NotImplementedError("Ajuste a SQL para cenário sem colunas de controle.")
+    with banco.conexao() as conn:
+        return mover(conn, modo, batch_size, lock_wait_ms, stmt_timeout_ms)
 
 if __name__ == "__main__":
+    metricas.iniciar("04_archive_pedidos")
     try:
+        t0 = time.perf_counter()
         ins, dele, bid = move_to_archive_safe()
-        print(f"OK. inserted={ins}, deleted={dele}, batch_id={bid}")
+        dt = time.perf_counter() - t0
+        taxa = ins / dt if dt > 0 else 0
+        print(f"OK. modo={ARCHIVE_MODO} inserted={ins}, deleted={dele}, batch_id={bid} "
+              f"tempo={dt:.2f}s ({taxa:.0f} linhas/s)")
     except Exception as e:
         print(f"Falha: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        banco.fechar()
+        metricas.atual().fechar()
@@ -0,0 +1,98 @@
+# retenção e manutenção das partições de hist.archive_pedidos
+#
+#   python 05_retencao_hist_pedidos.py listar
+#   python 05_retencao_hist_pedidos.py migrar            # tabela comum -> particionada
+#   python 05_retencao_hist_pedidos.py criar              # partições dos próximos meses
+#   python 05_retencao_hist_pedidos.py reter --acao exportar --meses 24 [--executar]
+#
+# reter só lista o que faria, a menos que --executar seja passado. Ações:
+#   desanexar -> DETACH PARTITION; a tabela continua existindo fora da hist
+#   apagar    -> DETACH + DROP TABLE
+#   exportar  -> DETACH + COPY para HIST_EXPORT_DIR/<partição>.csv.gz + DROP TABLE
+import os, sys, time
+import argparse
+from pedidos import particoes, banco
+
+TABELA_HIST = "hist.archive_pedidos"
+ADVISORY_KEY = "move_staging_to_archive"   # o mesmo do 04: não mexe durante um arquivamento
+HIST_RETENCAO_MESES = int(os.getenv("HIST_RETENCAO_MESES", "24"))
+HIST_MESES_A_FRENTE = int(os.getenv("ARCHIVE_MESES_A_FRENTE", "2"))
+HIST_EXPORT_DIR = os.getenv("HIST_EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "export_hist"))
+LOCK_TIMEOUT_MS = int(os.getenv("HIST_LOCK_TIMEOUT_MS", "5000"))
+
+def listar(conn):
+    with conn.cursor() as cur:
+        if not particoes.particionada(cur, TABELA_HIST):
+            print(f"{TABELA_HIST} não é particionada (rode 'migrar').")
+            return
+        for nome, limites, _, _ in particoes.listar(cur, TABELA_HIST):
+            cur.execute("SELECT pg_total_relation_size(%s::regclass)", (nome,))
+            print(f"{nome:<45} {cur.fetchone()[0] / 1024**2:>10.1f} MB  {limites}")
+    conn.rollback()
+
+def reter(conn, acao: str, meses: int, executar: bool):
+    with conn.cursor() as cur:
+        alvo = particoes.vencidas(cur, TABELA_HIST, meses)
+    conn.rollback()
+    if not alvo:
+        print(f"Nenhuma partição anterior aos últimos {meses} meses.")
+        return
+    if not executar:
+        print(f"[simulação] {acao}: {', '.join(alvo)}")
+        return
+    if acao == "exportar":
+        os.makedirs(HIST_EXPORT_DIR, exist_ok=True)
+
+    for nome in alvo:
+        t0 = time.perf_counter()
+        # DETACH em transação curta; export e DROP já fora da hist
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL lock_timeout = %s", (f"{LOCK_TIMEOUT_MS}ms",))
+            cur.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", (ADVISORY_KEY,))
+            if not cur.fetchone()[0]:
+                raise RuntimeError("Arquivamento em andamento. Abortado sem aguardar.")
+            particoes.desanexar(cur, TABELA_HIST, nome)
+        conn.commit()
+
+        extra = ""
+        if acao in ("apagar", "exportar"):
+            with conn.cursor() as cur:
+                if acao == "exportar":
+                    caminho = os.path.join(HIST_EXPORT_DIR, f"{nome.split('.')[-1]}.csv.gz")
+                    tam = particoes.exportar(cur, nome, caminho)
+                    extra = f" -> {caminho} ({tam / 1024**2:.1f} MB)"
+                particoes.apagar(cur, nome)
+            conn.commit()
+        print(f"{acao}: {nome}{extra} em {time.perf_counter() - t0:.2f}s")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=f"Partições e retenção de {TABELA_HIST}")
+    ap.add_argument("comando", choices=["listar", "migrar", "criar", "reter"])
+    ap.add_argument("--acao", choices=["desanexar", "apagar", "exportar"], default="exportar")
+    ap.add_argument("--meses", type=int, default=HIST_RETENCAO_MESES, help="meses mantidos, incluindo o corrente")
+    ap.add_argument("--executar", action="store_true", help="sem isto, reter só lista as partições")
+    args = ap.parse_args()
+
+    try:
+        with banco.conexao() as conn:
+            if args.comando == "listar":
+                listar(conn)
+            elif args.comando == "migrar":
+                feitas = particoes.migrar_para_particionada(
+                    conn, TABELA_HIST, HIST_MESES_A_FRENTE, LOCK_TIMEOUT_MS, ADVISORY_KEY)
+                print(f"OK. {TABELA_HIST} particionada; partições novas: {', '.join(feitas) or 'nenhuma'}")
+            elif args.comando == "criar":
+                with conn.cursor() as cur:
+                    cur.execute("SET LOCAL lock_timeout = %s", (f"{LOCK_TIMEOUT_MS}ms",))
+                    criadas = particoes.garantir(cur, TABELA_HIST, HIST_MESES_A_FRENTE)
+                conn.commit()
+                print(f"OK. Partições criadas: {', '.join(criadas) or 'nenhuma'}")
+            else:
+                if args.meses < 1:
+                    raise ValueError("--meses deve ser >= 1")
+                reter(conn, args.acao, args.meses, args.executar)
+    except Exception as e:
+        print(f"Falha: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        banco.fechar()
@@ -0,0 +1,110 @@
+# benchmark do arquivamento staging -> hist (04_archive_pedidos.py)
+#
+# Mede linhas/s de cada ARCHIVE_MODO para staging de vários tamanhos:
+#   ctid    -> laço original (SELECT ctid ... LIMIT) numa transação
+#   atomico -> INSERT ... SELECT + DELETE no mesmo snapshot (REPEATABLE READ)
+#   lotes   -> faixas de stg_seq com commit por lote
+#
+# Usa tabelas de rascunho (LIKE staging.stg_pedidos / hist.archive_pedidos),
+# preenchidas com generate_series. Conexão via PGHOST/PGPORT/PGUSER/PGPASSWORD/PGDATABASE.
+# 50M linhas ocupam dezenas de GB entre staging, histórico e WAL.
+#
+# uso:
+#   python bench_archive_staging.py --linhas 1000000,10000000,50000000
+#   python bench_archive_staging.py --linhas 200000 --modos atomico,lotes --lote 20000
+
+import os
+import sys
+import time
+import argparse
+import importlib.util
+from pathlib import Path
+import psycopg2
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+STG_BENCH  = "staging.stg_pedidos_bench_arch"
+HIST_BENCH = "hist.archive_pedidos_bench"
+
+def load_archive_module():
+    spec = importlib.util.spec_from_file_location("archive", BASE_DIR / "04_archive_pedidos.py")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def expr_coluna(c: str) -> str:
+    if c == "chave_nfe":
+        return "lpad(g::text, 44, '0')"
+    if c.startswith("data_") or c == "chegada_transportadora":
+        return "to_char(timestamp '2025-01-01' + mod(g, 100000) * interval '1 minute', 'DD/MM/YYYY HH24:MI:SS')"
+    if c in ("valor_nfe", "peso"):
+        return "(mod(g, 100000)::text || ',' || lpad(mod(g, 100)::text, 2, '0'))"
+    if c == "arquivo_origem":
+        return "'rel_83_' || (g / 100000)::text || '.csv'"
+    return f"'{c[:6]} ' || mod(g, 5000)::text"
+
+def preparar(conn, archive, n: int, unlogged: bool):
+    cols = archive.COLS
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {STG_BENCH}, {HIST_BENCH}")
+        cur.execute(f"DROP SEQUENCE IF EXISTS {HIST_BENCH}_seq")
+        tipo = "UNLOGGED " if unlogged else ""
+        # stg_seq vem do generate_series: o default da sequência real não é usado
+        cur.execute(f"CREATE {tipo}TABLE {STG_BENCH} (LIKE staging.stg_pedidos INCLUDING DEFAULTS)")
+        cur.execute(f"CREATE {tipo}TABLE {HIST_BENCH} (LIKE hist.archive_pedidos INCLUDING DEFAULTS INCLUDING INDEXES)")
+        # sequência própria: não consome a do histórico real
+        cur.execute(f"CREATE SEQUENCE {HIST_BENCH}_seq")
+        cur.execute(f"ALTER TABLE {HIST_BENCH} ALTER COLUMN hist_id SET DEFAULT nextval('{HIST_BENCH}_seq')")
+        selects = ", ".join(expr_coluna(c) for c in cols)
+        cur.execute(
+            f"INSERT INTO {STG_BENCH} ({', '.join(cols)}, stg_seq) "
+            f"SELECT {selects}, g FROM generate_series(1, %s) g",
+            (n,),
+        )
+        cur.execute(f"CREATE INDEX ON {STG_BENCH} (stg_seq)")
+        cur.execute(f"ANALYZE {STG_BENCH}")
+    conn.commit()
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do arquivamento staging -> hist")
+    ap.add_argument("--linhas", default="1000000,10000000,50000000")
+    ap.add_argument("--modos", default="ctid,atomico,lotes")
+    ap.add_argument("--lote", type=int, default=50000, help="linhas por lote (ctid e lotes)")
+    ap.add_argument("--unlogged", action="store_true", help="tabelas de rascunho sem WAL")
+    args = ap.parse_args()
+
+    archive = load_archive_module()
+    conn = psycopg2.connect(
+        host=os.getenv("PGHOST", "localhost"),
+        user=os.getenv("PGUSER", "postgres"),
+        password=os.getenv("PGPASSWORD", ""),
+        dbname=os.getenv("PGDATABASE", "postgres"),
+        port=int(os.getenv("PGPORT", "5432")),
+    )
+    try:
+        print(f"{'modo':>8} {'linhas':>10} {'preparo':>8} {'seg':>8} {'linhas/s':>10}")
+        for n in [int(x) for x in args.linhas.split(",") if x.strip()]:
+            for modo in args.modos.split(","):
+                t0 = time.perf_counter()
+                preparar(conn, archive, n, args.unlogged)
+                t_prep = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                ins, dele, _ = archive.mover(
+                    conn, modo, args.lote, stmt_timeout_ms=0, so_processadas=False,
+                    origem=STG_BENCH, destino=HIST_BENCH,
+                )
+                secs = time.perf_counter() - t0
+                if ins != n or dele != n:
+                    print(f"contagem divergente: inserted={ins} deleted={dele} esperado={n}", file=sys.stderr)
+                print(f"{modo:>8} {n:>10} {t_prep:>8.1f} {secs:>8.2f} {n / secs:>10.0f}")
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {STG_BENCH}, {HIST_BENCH}")
+            cur.execute(f"DROP SEQUENCE IF EXISTS {HIST_BENCH}_seq")
+        conn.commit()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
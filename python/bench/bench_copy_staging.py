@@ -0,0 +1,150 @@
+# benchmark da carga na staging (02_load_stage_pedidos.py)
+#
+# Compara linhas/s de ponta a ponta (leitura + mapeamento + COPY) para:
+#   pandas -> ler_csv_robusto + aplicar_mapeamento + inserir_copy (to_csv QUOTE_ALL)
+#   csv    -> streaming com CopyStream em CSV
+#   text   -> streaming com CopyStream no formato text do PostgreSQL
+#   binary -> streaming com CopyStream no formato binário do PostgreSQL
+#
+# Usa um arquivo rel_83 sintético e uma tabela de rascunho criada com
+# LIKE staging.stg_pedidos. Conexão via PGHOST/PGPORT/PGUSER/PGPASSWORD/PGDATABASE.
+#
+# caminho "fatias": carga fatiada de um único arquivo (carregar_fatiado), com
+# --processos processos e fatias de --fatia-mb MB; cada fatia copiada por uma
+# das CARGA_CONEXOES conexões do pool de pedidos/banco.py.
+#
+# --so-parse mede só leitura + mapeamento, sem banco:
+#   pandas -> ler_csv_robusto + aplicar_mapeamento (DataFrame)
+#   plano  -> LeitorCsvStream + linhas_mapeadas (plano compilado do cabeçalho)
+#
+# uso:
+#   python bench_copy_staging.py --linhas 200000 --repeat 3
+#   python bench_copy_staging.py --linhas 1000000 --so-parse
+#   python bench_copy_staging.py --linhas 2000000 --caminhos csv,fatias --processos 8 --fatia-mb 32
+
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import tempfile
+import importlib.util
+from pathlib import Path
+import psycopg2
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+TABELA_BENCH = "staging.stg_pedidos_bench"
+
+def load_stage_module():
+    spec = importlib.util.spec_from_file_location("load_stage", BASE_DIR / "02_load_stage_pedidos.py")
+    mod = importlib.util.module_from_spec(spec)
+    # registrado para os processos do caminho fatias acharem as funções no pickle
+    sys.modules["load_stage"] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+def gerar_rel83(caminho: str, n_linhas: int, header, seed: int = 42):
+    """Arquivo cp1252 separado por ';' com valores no formato do fornecedor."""
+    rnd = random.Random(seed)
+    with open(caminho, "w", encoding="cp1252", newline="") as f:
+        w = csv.writer(f, delimiter=";", lineterminator="\r\n")
+        w.writerow(header)
+        for i in range(n_linhas):
+            linha = []
+            for j, h in enumerate(header):
+                if "Data" in h or "Chegada" in h:
+                    linha.append(f"{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/2025 {rnd.randint(0, 23):02d}:15:00")
+                elif "Valor" in h or h == "Peso":
+                    linha.append(f"{rnd.randint(1, 99999)},{rnd.randint(0, 99):02d}")
+                elif h == "Chave NFe":
+                    linha.append("".join(rnd.choice("0123456789") for _ in range(44)))
+                elif "Endereço" in h:
+                    linha.append(f"Rua São João, {rnd.randint(1, 999)}; apto \"{j}\"")
+                else:
+                    linha.append(f"{h[:4]}{i}")
+            w.writerow(linha)
+
+def medir_parse(stage, arquivo: str, repeat: int):
+    print(f"{'caminho':>8} {'linhas':>9} {'seg':>8} {'linhas/s':>10}")
+    for caminho in ("pandas", "plano"):
+        tempos = []
+        for _ in range(repeat):
+            stage._CACHE_FORMATO.clear()
+            stage.compilar_plano.cache_clear()
+            t0 = time.perf_counter()
+            if caminho == "pandas":
+                n = len(stage.aplicar_mapeamento(stage.ler_csv_robusto(arquivo)))
+            else:
+                with stage.LeitorCsvStream(arquivo) as leitor:
+                    n = sum(1 for _ in stage.linhas_mapeadas(leitor, arquivo))
+            tempos.append(time.perf_counter() - t0)
+        secs = min(tempos)
+        print(f"{caminho:>8} {n:>9} {secs:>8.2f} {n / secs:>10.0f}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de COPY na staging")
+    ap.add_argument("--linhas", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--caminhos", default="pandas,csv,text,binary")
+    ap.add_argument("--processos", type=int, default=os.cpu_count() or 1, help="processos do caminho fatias")
+    ap.add_argument("--fatia-mb", type=int, default=16, help="tamanho das fatias do caminho fatias")
+    ap.add_argument("--so-parse", action="store_true", help="só leitura + mapeamento (pandas x plano), sem banco")
+    args = ap.parse_args()
+
+    stage = load_stage_module()
+    header = [h for h in stage.DE_PARA if h not in ("Data Prev. Entrega Original)", "Data Prev. Entrega Original")]
+    tmp = tempfile.mkdtemp(prefix="bench_copy_")
+    arquivo = os.path.join(tmp, "rel_83_bench.csv")
+    gerar_rel83(arquivo, args.linhas, header)
+    print(f"Arquivo: {arquivo} ({os.path.getsize(arquivo) / 1024 / 1024:.1f} MB, {args.linhas} linhas)")
+    if args.so_parse:
+        medir_parse(stage, arquivo, args.repeat)
+        return
+
+    conn = psycopg2.connect(
+        host=os.getenv("PGHOST", "localhost"),
+        user=os.getenv("PGUSER", "postgres"),
+        password=os.getenv("PGPASSWORD", ""),
+        dbname=os.getenv("PGDATABASE", "postgres"),
+        port=int(os.getenv("PGPORT", "5432")),
+    )
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {TABELA_BENCH}")
+            cur.execute(f"CREATE UNLOGGED TABLE {TABELA_BENCH} (LIKE staging.stg_pedidos INCLUDING DEFAULTS)")
+        conn.commit()
+
+        print(f"{'caminho':>8} {'linhas':>9} {'seg':>8} {'linhas/s':>10}")
+        for caminho in args.caminhos.split(","):
+            tempos = []
+            for _ in range(args.repeat):
+                with conn.cursor() as cur:
+                    cur.execute(f"TRUNCATE {TABELA_BENCH}")
+                conn.commit()
+                t0 = time.perf_counter()
+                if caminho == "pandas":
+                    df = stage.aplicar_mapeamento(stage.ler_csv_robusto(arquivo))
+                    n = stage.inserir_copy(conn, TABELA_BENCH, df, arquivo)
+                elif caminho == "fatias":
+                    stage.CARGA_FATIA_MB = args.fatia_mb
+                    n = stage.carregar_fatiado(arquivo, args.processos, max(1, stage.CARGA_CONEXOES), TABELA_BENCH)
+                else:
+                    with stage.LeitorCsvStream(arquivo) as leitor:
+                        n = stage.inserir_copy_stream(
+                            conn, TABELA_BENCH, stage.linhas_mapeadas(leitor, arquivo), caminho
+                        )
+                tempos.append(time.perf_counter() - t0)
+            secs = min(tempos)
+            print(f"{caminho:>8} {n:>9} {secs:>8.2f} {n / secs:>10.0f}")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {TABELA_BENCH}")
+        conn.commit()
+        conn.close()
+        stage.banco.fechar()
+
+if __name__ == "__main__":
+    main()
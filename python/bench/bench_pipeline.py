@@ -0,0 +1,276 @@
+# benchmark reprodutível da pipeline rel_83 (01 -> 02 -> 03 -> 04)
+#
+# Para cada tamanho em --linhas:
+#   1. gera --arquivos arquivos sintéticos (gerador_rel83.py), alternando
+#      encoding (cp1252 / utf-8-sig), separador (; / ,) e variante de cabeçalho,
+#      com chaves repetidas dentro e entre arquivos; ficam em cache em --dados
+#   2. recria os esquemas staging/dw/hist no banco --banco a partir de sql/
+#   3. mede cada etapa com os módulos reais:
+#        sftp        download_with_verify de um servidor SFTP local (paramiko)
+#        carga       carregar_arquivo (02) de cada arquivo baixado
+#        upsert      run_upsert (03) staging -> dw.fat_pedidos
+#        arquivamento mover (04) staging -> hist.archive_pedidos
+# O resultado vai para bench/resultados/<data>_<commit>.json, com commit,
+# máquina, versões e os parâmetros (variáveis de ambiente) da execução.
+#
+# --comparar base.json aponta, por (linhas, etapa), as etapas com linhas/s
+# abaixo da base além de --tolerancia e termina com código 2 se houver alguma.
+#
+# Conexão via PGHOST/PGPORT/PGUSER/PGPASSWORD; o banco --banco é criado se
+# não existir e seus esquemas staging/dw/hist são APAGADOS a cada tamanho.
+#
+# uso:
+#   python bench_pipeline.py --linhas 10000,100000,1000000
+#   python bench_pipeline.py --linhas 10000000 --arquivos 8
+#   python bench_pipeline.py --linhas 100000 --comparar resultados/base.json --tolerancia 0.10
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import platform
+import argparse
+import subprocess
+import tempfile
+import importlib.util
+from datetime import datetime
+from pathlib import Path
+import paramiko
+import psycopg2
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import gerador_rel83
+import bench_sftp_download
+
+SQL_DIR = BASE_DIR.parent / "sql"
+DDLS = ("ddl_stg_pedidos", "ddl_fat_pedidos", "ddl_ctl_upsert_pedidos", "ddl_hist_pedidos")
+RESULTADOS_DIR = Path(__file__).resolve().parent / "resultados"
+# banco usado só para criar o --banco (PGDATABASE é trocado em main)
+BANCO_ADMIN = os.getenv("PGDATABASE", "postgres")
+
+# combinações que cada arquivo de um tamanho recebe, em rodízio
+VARIANTES = (
+    {"encoding": "cp1252", "sep": ";", "variante": 0},
+    {"encoding": "utf-8-sig", "sep": ",", "variante": 1},
+    {"encoding": "cp1252", "sep": ",", "variante": 2},
+    {"encoding": "utf-8-sig", "sep": ";", "variante": 0},
+)
+
+# variáveis que mudam o caminho medido; vão para o JSON
+PARAMETROS_ENV = (
+    "CARGA_STREAMING", "CARGA_TIPADA", "COPY_FORMATO", "UPSERT_INCREMENTAL", "UPSERT_FATIA_LINHAS",
+    "UPSERT_TIPADO", "ARCHIVE_MODO", "ARCHIVE_LOTE_LINHAS", "SFTP_PREFETCH_REQUESTS",
+    "SFTP_WINDOW_SIZE", "SFTP_BLOCK_SIZE",
+)
+
+def _modulo(arquivo: str, nome: str):
+    spec = importlib.util.spec_from_file_location(nome, BASE_DIR / arquivo)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def _cfg(dbname: str) -> dict:
+    return {
+        "host": os.getenv("PGHOST", "localhost"),
+        "user": os.getenv("PGUSER", "postgres"),
+        "password": os.getenv("PGPASSWORD"),
+        "port": int(os.getenv("PGPORT", "5432")),
+        "dbname": dbname,
+    }
+
+def preparar_banco(banco: str):
+    """Cria o banco se preciso e recria staging/dw/hist a partir dos DDLs do repositório."""
+    adm = psycopg2.connect(**_cfg(BANCO_ADMIN))
+    adm.autocommit = True
+    with adm.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (banco,))
+        if not cur.fetchone():
+            cur.execute(f'CREATE DATABASE "{banco}"')
+    adm.close()
+
+    conn = psycopg2.connect(**_cfg(banco), options="-c search_path=public,staging,dw,hist")
+    with conn, conn.cursor() as cur:
+        cur.execute("DROP SCHEMA IF EXISTS staging, dw, hist CASCADE")
+        cur.execute("CREATE SCHEMA staging; CREATE SCHEMA dw; CREATE SCHEMA hist")
+        for ddl in DDLS:
+            cur.execute((SQL_DIR / ddl).read_text(encoding="utf-8"))
+    return conn
+
+def gerar_arquivos(dados: Path, linhas: int, n_arquivos: int, seed: int, fracao_dup: float):
+    """Divide `linhas` entre os arquivos; chaves sorteadas do mesmo universo para repetir entre arquivos."""
+    chaves = max(1, int(linhas * (1 - fracao_dup)))
+    de_para = gerador_rel83.carregar_de_para()
+    arquivos = []
+    for i in range(n_arquivos):
+        n = linhas // n_arquivos + (1 if i < linhas % n_arquivos else 0)
+        v = VARIANTES[i % len(VARIANTES)]
+        nome = f"rel_83_{linhas}_{i:02d}_s{seed}.CSV"
+        caminho = dados / nome
+        if not caminho.exists():
+            gerador_rel83.gerar(str(caminho), n, seed=seed + i, encoding=v["encoding"], sep=v["sep"],
+                                variante=v["variante"], chaves_distintas=chaves, de_para=de_para)
+        arquivos.append(caminho)
+    return arquivos
+
+def _conectar_sftp(porta: int):
+    t = paramiko.Transport(("127.0.0.1", porta))
+    t.connect(username="bench", password="bench")
+    return t, paramiko.SFTPClient.from_transport(t)
+
+def medir_tamanho(linhas: int, arquivos, porta: int, banco: str, mods: dict) -> list:
+    ingest, carga, upsert, archive = mods["ingest"], mods["carga"], mods["upsert"], mods["archive"]
+    resultados = []
+    total_bytes = sum(a.stat().st_size for a in arquivos)
+
+    def registrar(etapa, segundos, n_linhas=None, n_bytes=None, **extra):
+        r = {"linhas": linhas, "etapa": etapa, "segundos": round(segundos, 4)}
+        if n_linhas is not None:
+            r["linhas_por_s"] = round(n_linhas / segundos, 1) if segundos > 0 else None
+        if n_bytes is not None:
+            r["mb_por_s"] = round(n_bytes / 1024**2 / segundos, 2) if segundos > 0 else None
+        r.update(extra)
+        resultados.append(r)
+        taxa = f"{r['linhas_por_s']:>12,.0f} linhas/s" if r.get("linhas_por_s") else ""
+        print(f"  {etapa:<13} {segundos:9.2f}s {taxa} {r.get('mb_por_s') or '':>8}")
+
+    conn = preparar_banco(banco)
+    destino = Path(tempfile.mkdtemp(prefix="bench_rel83_"))
+    try:
+        # ===== 01: download =====
+        transport, sftp = _conectar_sftp(porta)
+        try:
+            t0 = time.perf_counter()
+            for a in arquivos:
+                if not ingest.download_with_verify(sftp, a.name, destino / a.name, a.stat().st_size):
+                    raise RuntimeError(f"download falhou: {a.name}")
+            registrar("sftp", time.perf_counter() - t0, n_bytes=total_bytes)
+        finally:
+            sftp.close()
+            transport.close()
+
+        # ===== 02: carga =====
+        if carga.CARGA_TIPADA:
+            carga.garantir_colunas_tipadas(conn)
+        t0 = time.perf_counter()
+        carregadas = 0
+        for a in arquivos:
+            carregadas += carga.carregar_arquivo(conn, str(destino / a.name)) or 0
+        registrar("carga", time.perf_counter() - t0, carregadas, total_bytes, linhas_staging=carregadas)
+
+        # ===== 03: upsert =====
+        t0 = time.perf_counter()
+        st = upsert.run_upsert(conn=conn)
+        registrar("upsert", time.perf_counter() - t0, st["linhas_staging"],
+                  inseridas=st["inseridas"], atualizadas=st["atualizadas"], ignoradas=st["ignoradas"])
+
+        # ===== 04: arquivamento =====
+        t0 = time.perf_counter()
+        movidas, _, _ = archive.mover(conn, so_processadas=True)
+        registrar("arquivamento", time.perf_counter() - t0, movidas)
+    finally:
+        conn.close()
+        for p in destino.iterdir():
+            p.unlink()
+        destino.rmdir()
+    return resultados
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "desconhecido"
+
+def _versao_pg(banco: str) -> str:
+    conn = psycopg2.connect(**_cfg(banco))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SHOW server_version")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+def comparar(atual: dict, base: dict, tolerancia: float) -> list:
+    """[(linhas, etapa, taxa_base, taxa_atual, variação)] das etapas abaixo da base além da tolerância."""
+    ref = {(r["linhas"], r["etapa"]): r for r in base["resultados"]}
+    regressoes = []
+    print(f"===== COMPARAÇÃO com {base.get('commit')} ({base.get('inicio')}) =====")
+    for r in atual["resultados"]:
+        b = ref.get((r["linhas"], r["etapa"]))
+        campo = "linhas_por_s" if r.get("linhas_por_s") else "mb_por_s"
+        if not b or not b.get(campo) or not r.get(campo):
+            continue
+        var = r[campo] / b[campo] - 1
+        marca = "REGRESSÃO" if var < -tolerancia else ""
+        print(f"{r['linhas']:>10} {r['etapa']:<13} {b[campo]:>12,.1f} -> {r[campo]:>12,.1f} {var:+7.1%} {marca}")
+        if marca:
+            regressoes.append((r["linhas"], r["etapa"], b[campo], r[campo], var))
+    return regressoes
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark da pipeline rel_83 com dados sintéticos")
+    ap.add_argument("--linhas", default="10000,100000,1000000")
+    ap.add_argument("--arquivos", type=int, default=4, help="arquivos por tamanho")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--dup", type=float, default=0.3, help="fração aproximada de chave_nfe repetidas")
+    ap.add_argument("--banco", default="rel83_bench")
+    ap.add_argument("--dados", default=os.path.join(tempfile.gettempdir(), "rel83_bench_dados"),
+                    help="cache dos arquivos gerados")
+    ap.add_argument("--saida", default=str(RESULTADOS_DIR))
+    ap.add_argument("--comparar", help="JSON de uma execução anterior")
+    ap.add_argument("--tolerancia", type=float, default=0.10)
+    args = ap.parse_args()
+    # o servidor local reclama de cada conexão encerrada pelo cliente
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+    # os módulos leem PGDATABASE no import (conexões próprias do upsert fatiado)
+    os.environ["PGDATABASE"] = args.banco
+    mods = {
+        "ingest": _modulo("01_ingest_sftp_pedidos.py", "ingest_sftp_pedidos"),
+        "carga": _modulo("02_load_stage_pedidos.py", "load_stage_pedidos"),
+        "upsert": _modulo("03_upsert_dw_pedidos.py", "upsert_dw_pedidos"),
+        "archive": _modulo("04_archive_pedidos.py", "archive_pedidos"),
+    }
+    dados = Path(args.dados)
+    dados.mkdir(parents=True, exist_ok=True)
+    porta = bench_sftp_download.start_local_server(str(dados))
+
+    execucao = {
+        "inicio": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "maquina": {"host": socket.gethostname(), "cpus": os.cpu_count(), "sistema": platform.platform(),
+                    "python": platform.python_version()},
+        "postgres": None,
+        "parametros": {"arquivos": args.arquivos, "seed": args.seed, "dup": args.dup,
+                       **{k: os.getenv(k) for k in PARAMETROS_ENV if os.getenv(k) is not None}},
+        "resultados": [],
+    }
+    for n in [int(x) for x in args.linhas.split(",") if x.strip()]:
+        t0 = time.perf_counter()
+        arquivos = gerar_arquivos(dados, n, args.arquivos, args.seed, args.dup)
+        mb = sum(a.stat().st_size for a in arquivos) / 1024**2
+        print(f"===== {n:,} linhas ({len(arquivos)} arquivos, {mb:.1f} MB, gerados em {time.perf_counter() - t0:.1f}s) =====")
+        execucao["resultados"] += medir_tamanho(n, arquivos, porta, args.banco, mods)
+    execucao["postgres"] = _versao_pg(args.banco)
+
+    os.makedirs(args.saida, exist_ok=True)
+    caminho = os.path.join(args.saida, f"{datetime.now():%Y%m%d_%H%M%S}_{execucao['commit']}.json")
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(execucao, f, ensure_ascii=False, indent=2)
+    print(f"Resultados em {caminho}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        regressoes = comparar(execucao, base, args.tolerancia)
+        if regressoes:
+            print(f"{len(regressoes)} etapa(s) abaixo da base além de {args.tolerancia:.0%}", file=sys.stderr)
+            sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# benchmark do download SFTP (01_ingest_sftp_pedidos.py)
+#
+# Mede MB/s de stream_download para uma grade de configurações
+# (requisições em voo x tamanho de bloco x janela do canal).
+#
+# Sem --host, sobe um servidor SFTP local (paramiko) servindo um arquivo
+# sintético. Para simular o link do fornecedor em Linux, aplique latência na
+# loopback, ex.: `tc qdisc add dev lo root netem delay 40ms`.
+#
+# uso:
+#   python bench_sftp_download.py --size-mb 200
+#   python bench_sftp_download.py --host sftp.fornecedor --user u --password p --remote /out/rel_83.CSV
+
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import importlib.util
+from pathlib import Path
+import paramiko
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+def load_ingest_module():
+    spec = importlib.util.spec_from_file_location("ingest_sftp", BASE_DIR / "01_ingest_sftp_pedidos.py")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+# ===== SERVIDOR SFTP LOCAL =====
+
+class _Server(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+class _Handle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+class _SFTPRoot(paramiko.SFTPServerInterface):
+    ROOT = "."
+
+    def _real(self, path):
+        return os.path.join(self.ROOT, self.canonicalize(path).lstrip("/"))
+
+    def canonicalize(self, path):
+        return os.path.normpath("/" + path).replace("\\", "/")
+
+    def list_folder(self, path):
+        real = self._real(path)
+        out = []
+        for name in os.listdir(real):
+            attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(real, name)))
+            attr.filename = name
+            out.append(attr)
+        return out
+
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(self._real(path)))
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        f = open(self._real(path), "rb")
+        h = _Handle(flags)
+        h.filename = self._real(path)
+        h.readfile = f
+        return h
+
+def start_local_server(root: str):
+    """Sobe o servidor em 127.0.0.1 numa porta livre. Retorna a porta."""
+    _SFTPRoot.ROOT = root
+    host_key = paramiko.RSAKey.generate(2048)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+
+    def serve(conn):
+        t = paramiko.Transport(conn)
+        t.add_server_key(host_key)
+        t.set_subsystem_handler("sftp", paramiko.SFTPServer, _SFTPRoot)
+        t.start_server(server=_Server())
+        while t.is_active():
+            time.sleep(0.2)
+
+    def accept_loop():
+        while True:
+            conn, _ = sock.accept()
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return sock.getsockname()[1]
+
+def make_synthetic_file(root: str, size_mb: int) -> str:
+    name = "rel_83_bench.CSV"
+    path = os.path.join(root, name)
+    linha = (";".join(["1234567890"] * 41) + "\r\n").encode("cp1252")
+    alvo = size_mb * 1024 * 1024
+    with open(path, "wb") as f:
+        escrito = 0
+        bloco = linha * 1000
+        while escrito < alvo:
+            f.write(bloco)
+            escrito += len(bloco)
+    return "/" + name
+
+# ===== BENCH =====
+
+def parse_int_list(s: str):
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de download SFTP pipelined")
+    ap.add_argument("--host")
+    ap.add_argument("--port", type=int, default=22)
+    ap.add_argument("--user", default="bench")
+    ap.add_argument("--password", default="bench")
+    ap.add_argument("--remote", help="arquivo remoto (obrigatório com --host)")
+    ap.add_argument("--size-mb", type=int, default=100, help="tamanho do arquivo sintético local")
+    ap.add_argument("--requests", default="32,64,128,256", help="requisições em voo")
+    ap.add_argument("--blocks", default="32768,65536,262144", help="tamanhos de bloco (bytes)")
+    ap.add_argument("--windows", default="0,8388608", help="janela do canal (bytes, 0 = padrão)")
+    ap.add_argument("--repeat", type=int, default=1)
+    args = ap.parse_args()
+
+    ingest = load_ingest_module()
+    # servidor local loga "connection reset" a cada desconexão do cliente
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+    tmp = tempfile.mkdtemp(prefix="bench_sftp_")
+    if args.host:
+        if not args.remote:
+            ap.error("--remote é obrigatório com --host")
+        host, port, remote = args.host, args.port, args.remote
+    else:
+        remote = make_synthetic_file(tmp, args.size_mb)
+        host, port = "127.0.0.1", start_local_server(tmp)
+
+    part = Path(tmp) / "download.part"
+    print(f"{'req':>5} {'bloco':>8} {'janela':>9} {'MB':>8} {'seg':>7} {'MB/s':>8}")
+    for window in parse_int_list(args.windows):
+        for block in parse_int_list(args.blocks):
+            for reqs in parse_int_list(args.requests):
+                transport, sftp = ingest.connect_sftp(
+                    host, port, args.user, args.password,
+                    window_size=window, max_packet_size=0,
+                )
+                try:
+                    size = sftp.stat(remote).st_size
+                    melhores = []
+                    for _ in range(args.repeat):
+                        t0 = time.perf_counter()
+                        n = ingest.stream_download(sftp, remote, part, size, block_size=block, max_requests=reqs)
+                        melhores.append(time.perf_counter() - t0)
+                        if n != size:
+                            print(f"tamanho divergente: {n} != {size}", file=sys.stderr)
+                    secs = min(melhores)
+                    mb = size / 1024 / 1024
+                    print(f"{reqs:>5} {block:>8} {window:>9} {mb:>8.1f} {secs:>7.2f} {mb / secs:>8.1f}")
+                finally:
+                    sftp.close()
+                    transport.close()
+                    part.unlink(missing_ok=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# gerador de arquivos rel_83 sintéticos (benchmarks e testes de carga)
+#
+# Reproduz o que o fornecedor manda de verdade:
+#   - variantes de cabeçalho do DE_PARA (ex.: "Data Prev. Entrega (Original)")
+#   - cp1252 ou utf-8-sig, separador ';' ou ','
+#   - números e datas no formato brasileiro (1.234,56 / 31/12/2025 23:59:00),
+#     com vazios e alguns ISO no meio
+#   - textos com acento, aspas e o próprio separador dentro do campo
+#   - linhas irregulares (campos a mais ou a menos) e linhas em branco
+#   - chave_nfe repetida dentro do arquivo e entre arquivos (mesma semente de chaves)
+# Determinístico pela semente. Os valores saem de pools pré-gerados e as
+# linhas são escritas em blocos, então 10M linhas levam minutos, não horas.
+#
+# uso:
+#   python gerador_rel83.py saida.csv --linhas 1000000 --encoding utf-8-sig --sep ,
+
+import os
+import sys
+import csv
+import random
+import argparse
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+BLOCO = 10000
+POOL = 4096
+
+# variantes de cabeçalho para a mesma coluna de destino
+VARIANTES_ORIGINAL = (
+    "Data Prev. Entrega (Original)",
+    "Data Prev. Entrega Original)",
+    "Data Prev. Entrega Original",
+)
+
+def carregar_de_para():
+    from pedidos import esquema
+    return esquema.DE_PARA
+
+def header_rel83(de_para: dict, variante: int = 0):
+    """Uma coluna por destino, usando a variante pedida para as que têm mais de uma."""
+    header, vistos = [], set()
+    for h, destino in de_para.items():
+        if destino in vistos:
+            continue
+        vistos.add(destino)
+        header.append(VARIANTES_ORIGINAL[variante % len(VARIANTES_ORIGINAL)]
+                      if destino == "data_prev_entrega_original" else h)
+    return header
+
+def _br_numero(v: float, casas: int = 2) -> str:
+    s = f"{v:,.{casas}f}"
+    return s.replace(",", "_").replace(".", ",").replace("_", ".")
+
+def _pools(rnd: random.Random):
+    def data_hora():
+        d, m, a = rnd.randint(1, 28), rnd.randint(1, 12), rnd.choice((2024, 2025))
+        h, mi, s = rnd.randint(0, 23), rnd.randint(0, 59), rnd.randint(0, 59)
+        return rnd.choices(
+            (f"{d:02d}/{m:02d}/{a} {h:02d}:{mi:02d}:{s:02d}", f"{d:02d}/{m:02d}/{a}",
+             f"{a}-{m:02d}-{d:02d} {h:02d}:{mi:02d}:{s:02d}", ""),
+            weights=(70, 15, 10, 5),
+        )[0]
+
+    def valor():
+        v = rnd.uniform(0, 250000)
+        return rnd.choices((_br_numero(v), f"{v:.2f}".replace(".", ","), ""), weights=(60, 35, 5))[0]
+
+    def peso():
+        return rnd.choices((_br_numero(rnd.uniform(0, 5000), 3), ""), weights=(95, 5))[0]
+
+    nomes = ("José da Silva", "Ana Conceição", "João Araújo", "Márcia Gonçalves", "Luís Antônio")
+    ruas = ("Rua São João", "Av. Brasil", "Travessa Ipê", "Rodovia BR-116")
+    cidades = ("São Paulo", "Curitiba", "Goiânia", "Maceió", "Belém", "Florianópolis")
+    status = ("No prazo", "Atrasado", "Entregue", "Em trânsito")
+    ocorrencias = ("Entrega realizada", "Em rota de entrega", "Destinatário ausente", "Avaria; devolução")
+    return {
+        "data": [data_hora() for _ in range(POOL)],
+        "valor": [valor() for _ in range(POOL)],
+        "peso": [peso() for _ in range(POOL)],
+        "inteiro": [str(rnd.randint(0, 120)) if rnd.random() > .03 else "" for _ in range(POOL)],
+        "uf": ["SP", "RJ", "MG", "PR", "SC", "GO", "AL", "PA", "", "sp"],
+        "nome": [f"{rnd.choice(nomes)} {i}" for i in range(POOL)],
+        "endereco": [f'{rnd.choice(ruas)}, {rnd.randint(1, 9999)}; bloco "{rnd.choice("ABC")}"' for _ in range(POOL)],
+        "cidade": list(cidades),
+        "status": list(status),
+        "ocorrencia": list(ocorrencias),
+        "cep": [f"{rnd.randint(1000, 99999):05d}-{rnd.randint(0, 999):03d}" for _ in range(POOL)],
+        "doc": [f"{rnd.randint(10**13, 10**14 - 1)}" for _ in range(POOL)],
+        "texto": [f"x{rnd.randint(0, 99999)}" for _ in range(POOL)],
+    }
+
+TIPO_COLUNA = {
+    "data_insercao": "data", "data_nfe": "data", "data_prev_entrega": "data", "data_ultima_ocr": "data",
+    "chegada_transportadora": "data", "data_prev_entrega_original": "data",
+    "valor_nfe": "valor", "peso": "peso", "qtd_volumes": "inteiro", "cod_cd": "inteiro", "qtd_itens": "inteiro",
+    "lead_time": "inteiro", "uf": "uf", "nome_destinatario": "nome", "transportador": "nome",
+    "endereco_completo": "endereco", "endereco": "endereco", "cidades": "cidade", "status_prazo": "status",
+    "ultima_ocorrencia": "ocorrencia", "cep": "cep", "cnpj_cpf_transportadora": "doc", "cpf_destinatario": "doc",
+}
+
+def gerar(caminho: str, linhas: int, seed: int = 42, encoding: str = "cp1252", sep: str = ";",
+          variante: int = 0, fracao_dup: float = 0.3, fracao_irregular: float = 0.001,
+          chaves_distintas: int = None, de_para: dict = None) -> dict:
+    """
+    Grava `linhas` linhas em `caminho`. Chaves NFe são sorteadas entre
+    `chaves_distintas` (padrão: linhas * (1 - fracao_dup)); use o mesmo valor
+    em vários arquivos para ter repetição entre arquivos.
+    Retorna {"linhas", "bytes", "encoding", "sep", "header"}.
+    """
+    de_para = de_para or carregar_de_para()
+    rnd = random.Random(seed)
+    header = header_rel83(de_para, variante)
+    destinos = [de_para[h] for h in header]
+    pools = _pools(random.Random(1234))   # pools iguais entre arquivos, só o sorteio muda
+    n_chaves = chaves_distintas or max(1, int(linhas * (1 - fracao_dup)))
+
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding=encoding, errors="replace", newline="") as f:
+        w = csv.writer(f, delimiter=sep, lineterminator="\r\n")
+        w.writerow(header)
+        feitas = 0
+        seq_ocr = seed * 10**9
+        while feitas < linhas:
+            k = min(BLOCO, linhas - feitas)
+            colunas = []
+            for destino in destinos:
+                tipo = TIPO_COLUNA.get(destino)
+                if destino == "chave_nfe":
+                    colunas.append([f"3525{rnd.randrange(n_chaves):040d}" for _ in range(k)])
+                elif destino == "id_ult_ocr":
+                    # cresce ao longo do arquivo: a linha mais nova vence no upsert
+                    colunas.append([str(seq_ocr + feitas + i) for i in range(k)])
+                elif destino in ("id", "pedido", "numero_nfe", "remessa"):
+                    colunas.append([str(seed * 10**8 + feitas + i) for i in range(k)])
+                elif tipo is not None:
+                    colunas.append(rnd.choices(pools[tipo], k=k))
+                else:
+                    colunas.append(rnd.choices(pools["texto"], k=k))
+            bloco = [list(r) for r in zip(*colunas)]
+            for _ in range(int(k * fracao_irregular) or (1 if rnd.random() < k * fracao_irregular else 0)):
+                r = bloco[rnd.randrange(k)]
+                tipo = rnd.random()
+                if tipo < 0.4:
+                    del r[-rnd.randint(1, 3):]          # campos a menos
+                elif tipo < 0.8:
+                    r.append("sobra")                   # campo a mais (vai para a última coluna)
+                else:
+                    r[:] = [""] * len(r)                # linha em branco
+            w.writerows(bloco)
+            feitas += k
+    os.replace(tmp, caminho)
+    return {"linhas": linhas, "bytes": os.path.getsize(caminho), "encoding": encoding, "sep": sep,
+            "header": header}
+
+def main():
+    ap = argparse.ArgumentParser(description="Gera um arquivo rel_83 sintético")
+    ap.add_argument("saida")
+    ap.add_argument("--linhas", type=int, default=100000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--encoding", default="cp1252", choices=["cp1252", "utf-8-sig", "utf-8"])
+    ap.add_argument("--sep", default=";", choices=[";", ","])
+    ap.add_argument("--variante", type=int, default=0, help="variante do cabeçalho (0..2)")
+    ap.add_argument("--dup", type=float, default=0.3, help="fração aproximada de chave_nfe repetidas")
+    args = ap.parse_args()
+    info = gerar(args.saida, args.linhas, args.seed, args.encoding, args.sep, args.variante, args.dup)
+    print(f"{args.saida}: {info['linhas']} linhas, {info['bytes'] / 1024**2:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Módulos compartilhados entre os scripts da pipeline rel_83.
@@ -0,0 +1,141 @@
+# conexões PostgreSQL compartilhadas pelas etapas da pipeline rel_83
+#
+# Um pool por processo (ThreadedConnectionPool), criado no primeiro uso com
+# config.ConfigBanco: search_path, application_name e timeouts vão no
+# startup de cada conexão, então não há SET por uso. Quando as etapas rodam
+# no mesmo processo (pipeline_pedidos.py) elas dividem o mesmo pool, e uma
+# execução completa abre no máximo PG_POOL_MAX conexões.
+#
+#   with banco.conexao() as conn:
+#       ...                       # commit/rollback ficam com quem usa
+#
+# Na devolução, transação aberta é desfeita, SETs de sessão e locks advisory
+# de sessão são desfeitos (RESET ALL volta às options do startup) e conexão
+# quebrada é descartada.
+#
+# executar() roda os comandos gerados do esquema (upsert, arquivamento) como
+# prepared statements: o PREPARE acontece uma vez por conexão e as execuções
+# seguintes na mesma conexão (ciclos da pipeline, fatias) só mandam EXECUTE.
+# PG_PREPARAR=0 desliga (ex.: pgbouncer em modo transaction).
+
+import re
+import hashlib
+import threading
+import weakref
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from pedidos import config
+
+_lock = threading.Lock()
+_pool = None
+_pool_max = 0
+# conexão -> {sql: (nome do prepared statement, nomes dos parâmetros na ordem $1..$n)}
+_preparados = weakref.WeakKeyDictionary()
+_RE_PARAMETRO = re.compile(r"%\((\w+)\)s")
+
+def conectar(cfg: config.ConfigBanco = None):
+    """Conexão avulsa (fora do pool), com os mesmos parâmetros de sessão."""
+    cfg = cfg or config.validar("banco").banco
+    return psycopg2.connect(**cfg.parametros())
+
+def pool(minimo: int = 1) -> ThreadedConnectionPool:
+    """
+    Pool do processo. Criado com max(PG_POOL_MAX, minimo) conexões; quem
+    precisa de N conexões simultâneas (ex.: threads de carga) pede minimo=N
+    antes do primeiro uso.
+    """
+    global _pool, _pool_max
+    with _lock:
+        if _pool is None:
+            cfg = config.validar("banco").banco
+            _pool_max = max(cfg.pool_max, minimo)
+            _pool = ThreadedConnectionPool(1, _pool_max, **cfg.parametros())
+        elif minimo > _pool_max:
+            raise RuntimeError(
+                f"Pool de conexões já criado com {_pool_max} conexões; {minimo} pedidas (ajuste PG_POOL_MAX)"
+            )
+        return _pool
+
+def obter():
+    return pool().getconn()
+
+def devolver(conn):
+    """
+    Devolve ao pool limpa: transação aberta é desfeita, SETs de sessão voltam aos
+    valores do startup e locks advisory de sessão são soltos; conexão quebrada é fechada.
+    """
+    p = pool()
+    if conn.closed:
+        p.putconn(conn, close=True)
+        return
+    try:
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("RESET ALL; SELECT pg_advisory_unlock_all()")
+        conn.commit()
+        if conn.autocommit:
+            conn.autocommit = False
+    except psycopg2.Error:
+        p.putconn(conn, close=True)
+        return
+    p.putconn(conn)
+
+@contextmanager
+def conexao():
+    conn = obter()
+    try:
+        yield conn
+    finally:
+        devolver(conn)
+
+def codec_cliente(conn) -> str:
+    """
+    Codec python do client_encoding da conexão: o servidor converte a partir
+    dele o COPY csv/text sem ENCODING e também os campos texto do COPY binário.
+    SQL_ASCII não converte nada, e os bytes vão em utf-8.
+    """
+    nome = conn.get_parameter_status("client_encoding") or "UTF8"
+    return "utf-8" if nome == "SQL_ASCII" else extensions.encodings[nome]
+
+def fechar():
+    """Fecha o pool (fim do processo)."""
+    global _pool, _pool_max
+    with _lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool, _pool_max = None, 0
+
+def _preparar(cur, sql: str):
+    nomes = []
+
+    def numerar(m):
+        if m.group(1) not in nomes:
+            nomes.append(m.group(1))
+        return f"${nomes.index(m.group(1)) + 1}"
+
+    corpo = _RE_PARAMETRO.sub(numerar, sql).replace("%%", "%").strip().rstrip(";")
+    nome = "rel83_" + hashlib.md5(sql.encode("utf-8")).hexdigest()[:16]
+    cur.execute(f"PREPARE {nome} AS {corpo}")
+    return nome, nomes
+
+def executar(cur, sql: str, params: dict = None):
+    """
+    cur.execute(sql, params) via prepared statement da conexão (um único
+    comando SQL, parâmetros %(nome)s). O PREPARE sobrevive a rollback, então
+    o cache só é perdido com a conexão.
+    """
+    if not config.carregar().banco.preparar:
+        cur.execute(sql, params)
+        return
+    cache = _preparados.setdefault(cur.connection, {})
+    preparado = cache.get(sql)
+    if preparado is None:
+        preparado = cache[sql] = _preparar(cur, sql)
+    nome, nomes = preparado
+    if nomes:
+        cur.execute(f"EXECUTE {nome} ({', '.join(['%s'] * len(nomes))})", [params[n] for n in nomes])
+    else:
+        cur.execute(f"EXECUTE {nome}")
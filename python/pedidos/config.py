@@ -0,0 +1,159 @@
+# configuração compartilhada da pipeline rel_83 (01..05, pipeline_pedidos.py)
+#
+# Os arquivos .env são lidos uma vez, no import deste módulo, antes das
+# constantes de cada script (CARGA_*, UPSERT_*, ...). Variáveis já definidas
+# no ambiente têm precedência sobre os arquivos. Procurados, nesta ordem:
+#   REL83_ENV_DIR/{banco,sftp}.env      (se definido)
+#   python/{banco,sftp}.env             (ao lado dos scripts)
+#   python/.env/{banco,sftp}.env
+#   ENV_DIR_LEGADO/{banco,sftp}.env     (caminho antigo do 03/04)
+#
+# carregar() devolve a Config tipada (em cache no processo); validar() é
+# chamado por quem vai conectar e falha listando todas as variáveis ausentes.
+
+import os
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from dotenv import load_dotenv
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ENV_DIR_LEGADO = Path(r"C:\Users\atend\OneDrive\Área de Trabalho\git_jb\sftp-data-ingestion\.env")
+STORAGE_PADRAO = r"C:\Users\atend\OneDrive - grupojb.log.br\STORAGE_SFTP\rel_83"
+
+def _diretorios_env():
+    dirs = [os.getenv("REL83_ENV_DIR"), BASE_DIR, BASE_DIR / ".env", ENV_DIR_LEGADO]
+    return [Path(d) for d in dirs if d]
+
+def _carregar_env() -> list:
+    """Carrega banco.env e sftp.env do primeiro diretório que tiver cada um. Retorna os lidos."""
+    lidos = []
+    for nome in ("banco.env", "sftp.env"):
+        for d in _diretorios_env():
+            caminho = d / nome
+            if caminho.is_file():
+                load_dotenv(caminho, override=False)
+                lidos.append(caminho)
+                break
+    return lidos
+
+ENV_LIDOS = _carregar_env()
+
+@dataclass(frozen=True)
+class ConfigBanco:
+    host: str
+    port: int
+    user: str
+    password: str
+    dbname: str
+    application_name: str
+    search_path: str
+    connect_timeout: int
+    statement_timeout_ms: int
+    lock_timeout_ms: int
+    idle_in_transaction_ms: int
+    pool_max: int
+    preparar: bool
+
+    def options(self) -> str:
+        """Parâmetros de sessão aplicados a cada conexão nova (0 = padrão do servidor)."""
+        opts = [f"-c search_path={self.search_path}", f"-c application_name={self.application_name}"]
+        if self.statement_timeout_ms:
+            opts.append(f"-c statement_timeout={self.statement_timeout_ms}")
+        if self.lock_timeout_ms:
+            opts.append(f"-c lock_timeout={self.lock_timeout_ms}")
+        if self.idle_in_transaction_ms:
+            opts.append(f"-c idle_in_transaction_session_timeout={self.idle_in_transaction_ms}")
+        return " ".join(opts)
+
+    def parametros(self) -> dict:
+        """kwargs de psycopg2.connect."""
+        return {
+            "host": self.host, "port": self.port, "user": self.user, "password": self.password,
+            "dbname": self.dbname, "connect_timeout": self.connect_timeout, "options": self.options(),
+        }
+
+@dataclass(frozen=True)
+class ConfigSftp:
+    host: str
+    port: int
+    user: str
+    password: str
+    dir: str
+
+@dataclass(frozen=True)
+class ConfigArquivos:
+    novos: Path
+    lidos: Path
+    erros: Path
+    logs: Path
+    manifest: Path
+
+@dataclass(frozen=True)
+class Config:
+    banco: ConfigBanco
+    sftp: ConfigSftp
+    arquivos: ConfigArquivos
+
+def _int(nome: str, padrao: int) -> int:
+    v = os.getenv(nome)
+    if v is None or v == "":
+        return padrao
+    try:
+        return int(v)
+    except ValueError:
+        raise RuntimeError(f"Variável {nome} deve ser um número inteiro: {v!r}") from None
+
+def _app_name() -> str:
+    script = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] not in ("", "-c") else "python"
+    return f"rel83:{script}"[:63]
+
+@lru_cache(maxsize=1)
+def carregar() -> Config:
+    storage = Path(os.getenv("REL83_STORAGE_DIR", STORAGE_PADRAO))
+    return Config(
+        banco=ConfigBanco(
+            host=os.getenv("PGHOST", "localhost"),
+            port=_int("PGPORT", 5432),
+            user=os.getenv("PGUSER", ""),
+            password=os.getenv("PGPASSWORD", ""),
+            dbname=os.getenv("PGDATABASE", ""),
+            application_name=os.getenv("PGAPPNAME", _app_name()),
+            search_path=os.getenv("PG_SEARCH_PATH", "public,staging,dw,hist"),
+            connect_timeout=_int("PG_CONNECT_TIMEOUT", 10),
+            statement_timeout_ms=_int("PG_STATEMENT_TIMEOUT_MS", 0),
+            lock_timeout_ms=_int("PG_LOCK_TIMEOUT_MS", 0),
+            idle_in_transaction_ms=_int("PG_IDLE_TX_TIMEOUT_MS", 600000),
+            pool_max=_int("PG_POOL_MAX", 4),
+            preparar=os.getenv("PG_PREPARAR", "1") == "1",
+        ),
+        sftp=ConfigSftp(
+            host=os.getenv("SFTP_HOST", ""),
+            port=_int("SFTP_PORT", 22),
+            user=os.getenv("SFTP_USER", ""),
+            password=os.getenv("SFTP_PASS", ""),
+            dir=os.getenv("SFTP_DIR", ""),
+        ),
+        arquivos=ConfigArquivos(
+            novos=storage / "novos",
+            lidos=storage / "lidos",
+            erros=storage / "erros",
+            logs=storage / "logs",
+            manifest=Path(os.getenv("MANIFEST_PATH", str(storage / "manifest_rel83.sqlite"))),
+        ),
+    )
+
+_OBRIGATORIAS = {
+    # PGPASSWORD pode vir do .pgpass
+    "banco": ("PGHOST", "PGUSER", "PGDATABASE"),
+    "sftp": ("SFTP_HOST", "SFTP_USER", "SFTP_PASS", "SFTP_DIR"),
+}
+
+def validar(*secoes: str) -> Config:
+    """Confere as variáveis obrigatórias das seções ("banco", "sftp") e devolve a Config."""
+    faltando = [k for s in secoes for k in _OBRIGATORIAS[s] if not os.getenv(k)]
+    if faltando:
+        origem = ", ".join(str(p) for p in ENV_LIDOS) or "nenhum .env encontrado"
+        raise RuntimeError(f"Variáveis ausentes: {', '.join(faltando)} (lidos: {origem})")
+    return carregar()
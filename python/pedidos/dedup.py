@@ -0,0 +1,79 @@
+# deduplicação da carga rel_83 antes do COPY (02)
+#
+# Arquivo: o fornecedor reenvia o mesmo export com outro nome (ou o
+# safe_copy gera um __dup_). O sha256 do arquivo é comparado com o índice
+# `conteudos` do manifesto; conteúdo idêntico a um já carregado não é lido.
+#
+# Linha (opcional, CARGA_DEDUP_LINHAS=1): exports sobrepostos repetem linhas
+# idênticas. Cada linha mapeada (sem arquivo_origem) vira um blake2b de 16
+# bytes; as já presentes no índice `linhas` do manifesto, ou repetidas no
+# próprio arquivo, são descartadas antes do COPY. Os hashes novos só entram
+# no índice depois do commit (FiltroLinhas.confirmar).
+#
+# Só linhas byte a byte iguais são descartadas: uma linha com qualquer campo
+# diferente (ex.: nova ocorrência) segue para a staging e para o upsert.
+
+import hashlib
+import threading
+from itertools import islice
+
+LINHAS_POR_CONSULTA = 2000
+
+def hash_linha(linha) -> bytes:
+    """Hash da linha mapeada, ignorando a última coluna (arquivo_origem)."""
+    return hashlib.blake2b("\x1f".join(linha[:-1]).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+class FiltroLinhas:
+    """
+    Filtra um iterável de linhas mapeadas contra o índice do manifesto.
+    Depois de consumido: `repetidas` tem o nº de linhas descartadas e
+    `novas` os hashes a registrar com confirmar() após o commit.
+    """
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.novas = []
+        self.repetidas = 0
+
+    def __call__(self, linhas):
+        vistas = set()
+        linhas = iter(linhas)
+        while True:
+            lote = list(islice(linhas, LINHAS_POR_CONSULTA))
+            if not lote:
+                return
+            hashes = [hash_linha(r) for r in lote]
+            conhecidas = self.manifest.linhas_conhecidas(hashes) if self.manifest is not None else set()
+            for r, h in zip(lote, hashes):
+                if h in conhecidas or h in vistas:
+                    self.repetidas += 1
+                    continue
+                vistas.add(h)
+                self.novas.append(h)
+                yield r
+
+    def confirmar(self, manifest=None):
+        (manifest or self.manifest).registrar_linhas(self.novas)
+        self.novas = []
+
+class Evitados:
+    """Totais de uma execução: arquivos/bytes pulados e linhas descartadas (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.arquivos = 0
+        self.bytes = 0
+        self.linhas = 0
+
+    def arquivo(self, tamanho: int):
+        with self._lock:
+            self.arquivos += 1
+            self.bytes += tamanho
+
+    def somar_linhas(self, n: int):
+        with self._lock:
+            self.linhas += n
+
+    def resumo(self) -> str:
+        return (f"Evitados: {self.arquivos} arquivo(s) duplicado(s) ({self.bytes / 1024**2:.1f} MB), "
+                f"{self.linhas} linha(s) repetida(s)")
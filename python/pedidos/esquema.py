@@ -0,0 +1,330 @@
+# esquema das 41 colunas do rel_83: fonte única para carga, upsert, arquivo e DDL
+#
+# Cada Coluna declara:
+#   nome        coluna na staging, no DW e na hist (mesmo nome nas três)
+#   cabecalhos  variantes do cabeçalho no CSV do fornecedor (DE_PARA)
+#   tipo_dw     tipo em dw.fat_pedidos (staging e hist guardam o texto cru)
+#   regra       conversão texto -> tipo do DW (REGRAS): SQL do caminho texto,
+#               SQL do caminho tipado e, quando existe, a coluna <nome>_t que a
+#               carga tipada preenche (conversor Python em pedidos/tipos.py)
+#   conflito    como o upsert resolve a chave já existente no DW
+#   hash        entra no hash_conteudo (o que o merge compara)
+#
+# A partir daqui são gerados: a lista de colunas do COPY (02), as listas do
+# INSERT ... SELECT do arquivamento (04), os trechos do UPSERT_SQL (03), as
+# colunas tipadas da staging e os DDL de sql/ (python -m pedidos.esquema).
+# Acrescentar uma coluna é uma linha em COLUNAS_ESQUEMA + `--gravar`.
+
+import sys
+import difflib
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+TIPO_STAGING = "VARCHAR(255)"
+
+# políticas de conflito no ON CONFLICT (chave_nfe) DO UPDATE
+CONFLITO_CHAVE      = "chave"       # a própria chave: não entra no SET
+CONFLITO_COALESCE   = "coalesce"    # valor novo, se não for NULL; senão mantém
+CONFLITO_OCORRENCIA = "ocorrencia"  # valor novo só se data_ultima_ocr for mais recente
+CONFLITO_MAIOR      = "maior"       # GREATEST(atual, novo)
+CONFLITO_MANTER     = "manter"      # fica o valor da primeira inserção
+
+COLUNA_OCORRENCIA = "data_ultima_ocr"
+
+@dataclass(frozen=True)
+class Regra:
+    sql_texto: str          # expressão sobre a staging (s.{c}), caminho texto
+    sql_tipado: str = None  # caminho tipado (None = igual ao texto)
+    tipo_t: str = None      # tipo da coluna <nome>_t (None = sem coluna tipada)
+    tz: bool = False        # a expressão devolve timestamptz (hash usa ::timestamp)
+
+    def sql(self, coluna: str, tipado: bool = False) -> str:
+        modelo = self.sql_tipado if tipado and self.sql_tipado else self.sql_texto
+        return modelo.replace("{c}", coluna)
+
+@dataclass(frozen=True)
+class Coluna:
+    nome: str
+    cabecalhos: tuple
+    tipo_dw: str = "TEXT"
+    regra: str = "texto"
+    conflito: str = CONFLITO_COALESCE
+    hash: bool = True
+    tipo_stg: str = TIPO_STAGING
+
+    @property
+    def tipada(self):
+        """Coluna tipada da staging (<nome>_t) ou None."""
+        return f"{self.nome}_t" if REGRAS[self.regra].tipo_t else None
+
+# ===== REGRAS =====
+
+_SQL_DATA = r"""CASE
+      WHEN btrim(s.{c}) IN ('', '00/00/0000', '00/00/0000 00:00:00', '0000-00-00') THEN NULL
+      WHEN btrim(s.{c}) ~ '^\d{2}/\d{2}/\d{4}( \d{2}:\d{2}:\d{2})?$'
+        THEN to_timestamp(CASE WHEN position(' ' in btrim(s.{c}))>0 THEN btrim(s.{c}) ELSE btrim(s.{c})||' 00:00:00' END,'DD/MM/YYYY HH24:MI:SS')::date
+      WHEN btrim(s.{c}) ~ '^\d{2}-\d{2}-\d{4}$' THEN to_date(s.{c},'DD-MM-YYYY')
+      WHEN btrim(s.{c}) ~ '^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$'
+        THEN to_timestamp(replace(btrim(s.{c}),'T',' '),'YYYY-MM-DD HH24:MI:SS')::date
+      WHEN btrim(s.{c}) ~ '^\d{8}$' THEN to_date(s.{c},'YYYYMMDD')
+      ELSE NULL
+    END"""
+
+_SQL_TS_OCORRENCIA = r"""CASE
+      WHEN btrim(s.{c}) ~ '^\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}$'
+        THEN to_timestamp(btrim(s.{c}),'DD/MM/YYYY HH24:MI:SS')
+      WHEN btrim(s.{c}) ~ '^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2})?(\.\d+)?(Z|[+-]\d{2}:?\d{2})?$'
+        THEN to_timestamp(replace(btrim(s.{c}),'T',' '),'YYYY-MM-DD HH24:MI:SS')
+      WHEN btrim(s.{c}) ~ '^\d{2}/\d{2}/\d{4}$'
+        THEN to_timestamp(btrim(s.{c})||' 00:00:00','DD/MM/YYYY HH24:MI:SS')
+      ELSE NULL
+    END"""
+
+_SQL_TS_CHEGADA = r"""CASE
+      WHEN btrim(s.{c}) ~ '^\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}$'
+        THEN to_timestamp(btrim(s.{c}),'DD/MM/YYYY HH24:MI:SS')
+      WHEN btrim(s.{c}) ~ '^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2})?$'
+        THEN to_timestamp(replace(btrim(s.{c}),'T',' '),'YYYY-MM-DD HH24:MI:SS')
+      WHEN btrim(s.{c}) ~ '^\d{2}/\d{2}/\d{4}$'
+        THEN to_timestamp(btrim(s.{c})||' 00:00:00','DD/MM/YYYY HH24:MI:SS')
+      ELSE NULL
+    END"""
+
+# data_insercao ausente ou ilegível vira o instante do upsert
+_SQL_TS_INSERCAO = r"""COALESCE(
+      CASE
+        WHEN btrim(s.{c}) ~ '^\d{2}/\d{2}/\d{4}( \d{2}:\d{2}:\d{2})?$'
+          THEN to_timestamp(CASE WHEN position(' ' in btrim(s.{c}))>0 THEN btrim(s.{c}) ELSE btrim(s.{c})||' 00:00:00' END,'DD/MM/YYYY HH24:MI:SS')
+        WHEN btrim(s.{c}) ~ '^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$'
+          THEN to_timestamp(replace(btrim(s.{c}),'T',' '),'YYYY-MM-DD HH24:MI:SS')
+        ELSE NULL END,
+      now()
+    )"""
+
+def _sql_numero(casas: int, tipo: str) -> str:
+    """CASE numérico: milhar com ponto ou vírgula, decimal com vírgula ou ponto."""
+    c = "{1,%d}" % casas
+    return r"""CASE
+      WHEN s.{c} IS NULL OR btrim(s.{c}) = '' THEN NULL
+      WHEN btrim(s.{c}) ~ '^[+-]?\d{1,3}(\.\d{3})+,\d%(c)s$'
+        THEN replace(replace(btrim(s.{c}),'.',''),',','.')::%(t)s
+      WHEN btrim(s.{c}) ~ '^[+-]?\d{1,3}(,\d{3})+\.\d%(c)s$'
+        THEN replace(btrim(s.{c}),',','')::%(t)s
+      WHEN btrim(s.{c}) ~ '^[+-]?\d+,\d%(c)s$'
+        THEN replace(btrim(s.{c}),',','.')::%(t)s
+      WHEN btrim(s.{c}) ~ '^[+-]?\d+\.\d%(c)s$'
+        THEN btrim(s.{c})::%(t)s
+      WHEN btrim(s.{c}) ~ '^[+-]?\d{1,3}(\.\d{3})+$'
+        THEN replace(btrim(s.{c}),'.','')::%(t)s
+      WHEN btrim(s.{c}) ~ '^[+-]?\d{1,3}(,\d{3})+$'
+        THEN replace(btrim(s.{c}),',','')::%(t)s
+      WHEN btrim(s.{c}) ~ '^[+-]?\d+$'
+        THEN btrim(s.{c})::%(t)s
+      ELSE CAST(replace(replace(regexp_replace(s.{c},'[^0-9,.-]','','g'),'.',''),',','.') AS %(t)s)
+    END""" % {"c": c, "t": tipo}
+
+REGRAS = {
+    "texto":   Regra(r"NULLIF(TRIM(s.{c}),'')"),
+    "digitos": Regra(r"NULLIF(TRIM(regexp_replace(s.{c},'\D','','g')),'')"),
+    "uf":      Regra(r"""CASE WHEN length(upper(regexp_replace(s.{c},'[^A-Za-z]','','g'))) BETWEEN 2 AND 3
+         THEN upper(regexp_replace(s.{c},'[^A-Za-z]','','g')) ELSE NULL END"""),
+    "chave_nfe": Regra(r"""CASE WHEN length(regexp_replace(s.{c},'\D','','g'))=44
+         THEN regexp_replace(s.{c},'\D','','g') ELSE NULL END""", "s.{c}_t", "varchar(44)"),
+    "data":    Regra(_SQL_DATA, "s.{c}_t", "date"),
+    # os timestamps do caminho tipado passam por timestamptz como o to_timestamp
+    # do caminho texto (mesmo ajuste de horário de verão)
+    "ts_ocorrencia": Regra(_SQL_TS_OCORRENCIA, "s.{c}_t::timestamptz", "timestamp", tz=True),
+    "ts_chegada":    Regra(_SQL_TS_CHEGADA, "s.{c}_t::timestamptz", "timestamp", tz=True),
+    "ts_insercao":   Regra(_SQL_TS_INSERCAO, "COALESCE(s.{c}_t::timestamptz, now())", "timestamp", tz=True),
+    "valor":   Regra(_sql_numero(2, "numeric(15,2)"), "s.{c}_t", "numeric(15,2)"),
+    "peso":    Regra(_sql_numero(3, "numeric(12,3)"), "s.{c}_t", "numeric(12,3)"),
+    "inteiro": Regra(r"NULLIF(regexp_replace(s.{c},'\D','','g'),'')::int", "s.{c}_t", "int"),
+}
+
+# ===== COLUNAS =====
+
+COLUNAS_ESQUEMA = (
+    Coluna("id",                      ("ID",),                    "VARCHAR(50)"),
+    Coluna("data_insercao",           ("Data Inserção",),         "TIMESTAMP", "ts_insercao", CONFLITO_MAIOR, hash=False),
+    Coluna("tipo_entrega",            ("Tipo Entrega",),          "VARCHAR(50)"),
+    Coluna("pedido",                  ("Pedido",)),
+    Coluna("data_nfe",                ("Data Nfe",),              "DATE", "data", CONFLITO_MANTER),
+    Coluna("serie_nfe",               ("Serie Nfe",)),
+    Coluna("numero_nfe",              ("Número Nfe",)),
+    Coluna("valor_nfe",               ("Valor Nfe",),             "NUMERIC(15,2)", "valor"),
+    Coluna("qtd_volumes",             ("Qtd. Volumes",),          "INT", "inteiro"),
+    Coluna("peso",                    ("Peso",),                  "NUMERIC(12,3)", "peso"),
+    Coluna("remessa",                 ("Remessa",)),
+    Coluna("nome_destinatario",       ("Nome Destinatário",)),
+    Coluna("endereco_completo",       ("Endereço Completo",)),
+    Coluna("cep",                     ("CEP",),                   "VARCHAR(20)"),
+    Coluna("cod_cd",                  ("Cód. CD",),               "INT", "inteiro"),
+    Coluna("cd",                      ("CD",),                    "VARCHAR(50)"),
+    Coluna("cnpj_cpf_transportadora", ("CNPJ/CPF Transportadora",), regra="digitos"),
+    Coluna("transportador",           ("Transportador",)),
+    Coluna("lead_time",               ("Lead Time",)),
+    Coluna("data_prev_entrega",       ("Data Prev. Entrega",),    "DATE", "data", CONFLITO_OCORRENCIA),
+    Coluna("status_prazo",            ("Status Prazo",),          "VARCHAR(50)", conflito=CONFLITO_OCORRENCIA),
+    Coluna("id_ult_ocr",              ("ID Últ. Ocr.",),          conflito=CONFLITO_OCORRENCIA),
+    Coluna("ultima_ocorrencia",       ("Última Ocorrência",),     "VARCHAR(255)", conflito=CONFLITO_OCORRENCIA),
+    Coluna("chave_ult_ocr",           ("Chave Últ. Ocr.",),       conflito=CONFLITO_OCORRENCIA),
+    Coluna("data_ultima_ocr",         ("Data Última Ocr.",),      "TIMESTAMP", "ts_ocorrencia", CONFLITO_OCORRENCIA),
+    Coluna("agrupador",               ("Agrupador",),             "VARCHAR(100)"),
+    Coluna("endereco",                ("Endereço",),              "VARCHAR(255)"),
+    Coluna("numero",                  ("Numero",),                "VARCHAR(255)"),
+    Coluna("bairro",                  ("Bairro",),                "VARCHAR(255)"),
+    Coluna("cidades",                 ("Cidades",),               "VARCHAR(255)"),
+    Coluna("uf",                      ("UF",),                    regra="uf"),
+    Coluna("etiquetas",               ("Etiquetas",)),
+    Coluna("chegada_transportadora",  ("Chegada na Transportadora",), "TIMESTAMP", "ts_chegada", CONFLITO_OCORRENCIA),
+    Coluna("cod_vendedor",            ("Cod. Vendedor",)),
+    Coluna("chave_nfe",               ("Chave NFe",),             regra="chave_nfe", conflito=CONFLITO_CHAVE, hash=False),
+    Coluna("qtd_itens",               ("Qtd. Itens",)),
+    Coluna("data_prev_entrega_original",
+           ("Data Prev. Entrega Original)", "Data Prev. Entrega (Original)", "Data Prev. Entrega Original"),
+           "DATE", "data", CONFLITO_MANTER),
+    Coluna("cpf_destinatario",        ("CPF Destinatário",),      regra="digitos"),
+    Coluna("grau_risco",              ("Grau de Risco",),         "VARCHAR(50)"),
+    Coluna("tipo_operacao",           ("Tipo de Operação",),      "VARCHAR(50)"),
+    # preenchida pela carga com o nome do arquivo; só muda junto com data_ultima_ocr
+    Coluna("arquivo_origem",          (),                         "VARCHAR(255)", conflito=CONFLITO_OCORRENCIA, hash=False),
+)
+
+COLUNAS = [c.nome for c in COLUNAS_ESQUEMA]
+POR_NOME = {c.nome: c for c in COLUNAS_ESQUEMA}
+
+# cabeçalho do CSV -> coluna
+DE_PARA = {h: c.nome for c in COLUNAS_ESQUEMA for h in c.cabecalhos}
+
+TIPADAS = [c for c in COLUNAS_ESQUEMA if c.tipada]
+# colunas extras do COPY no modo tipado; `tipado` marca a linha para o upsert
+COLUNAS_TIPADAS = [c.tipada for c in TIPADAS] + ["tipado"]
+
+def lista(colunas=None, prefixo: str = "") -> str:
+    """'a, b, c' (com `prefixo`, ex.: 's.') na ordem do esquema."""
+    return ", ".join(f"{prefixo}{c}" for c in (colunas or COLUNAS))
+
+# ===== UPSERT =====
+
+def sql_select_staging(tipado: bool = False) -> str:
+    """Colunas do CTE src do upsert: staging -> tipos do DW."""
+    return ",\n".join(
+        f"    {REGRAS[c.regra].sql(c.nome, tipado)} AS {c.nome}" for c in COLUNAS_ESQUEMA
+    )
+
+def sql_hash(alias: str = "r") -> str:
+    """Valores que entram no hash_conteudo (timestamptz normalizado para timestamp)."""
+    return ", ".join(
+        f"{alias}.{c.nome}" + ("::timestamp" if REGRAS[c.regra].tz else "")
+        for c in COLUNAS_ESQUEMA if c.hash
+    )
+
+def sql_set_conflito(tabela: str = "dw.fat_pedidos") -> str:
+    """SET do ON CONFLICT, uma linha por coluna conforme a política declarada."""
+    mais_nova = f"EXCLUDED.{COLUNA_OCORRENCIA} > {tabela}.{COLUNA_OCORRENCIA}"
+    linhas = []
+    for c in COLUNAS_ESQUEMA:
+        n = c.nome
+        if c.conflito in (CONFLITO_CHAVE, CONFLITO_MANTER):
+            continue
+        if c.conflito == CONFLITO_OCORRENCIA:
+            expr = f"CASE WHEN {mais_nova} THEN EXCLUDED.{n} ELSE {tabela}.{n} END"
+        elif c.conflito == CONFLITO_MAIOR:
+            expr = f"GREATEST({tabela}.{n}, EXCLUDED.{n})"
+        else:
+            expr = f"COALESCE(EXCLUDED.{n}, {tabela}.{n})"
+        linhas.append(f"  {n} = {expr}")
+    return ",\n".join(linhas)
+
+# ===== DDL =====
+
+def ddl_colunas_tipadas(tabela: str = "staging.stg_pedidos") -> str:
+    largura = max(len(c) for c in COLUNAS_TIPADAS)
+    defs = [f"  ADD COLUMN IF NOT EXISTS {'tipado':<{largura}} boolean NOT NULL DEFAULT false"]
+    defs += [f"  ADD COLUMN IF NOT EXISTS {c.tipada:<{largura}} {REGRAS[c.regra].tipo_t}" for c in TIPADAS]
+    return f"ALTER TABLE {tabela}\n" + ",\n".join(defs) + ";"
+
+def _defs(tipo, recuo: str = "    ") -> list:
+    return [f"{recuo}{c.nome} {tipo(c)}" for c in COLUNAS_ESQUEMA]
+
+def ddl_staging() -> str:
+    defs = _defs(lambda c: c.tipo_stg) + ["    stg_seq BIGSERIAL"]
+    return (
+        "CREATE TABLE staging.stg_pedidos (\n" + ",\n".join(defs) + "\n);\n\n"
+        "-- sequência de carga usada como marca d'água pelo upsert incremental\n"
+        "CREATE INDEX IF NOT EXISTS ix_stg_pedidos_stg_seq ON staging.stg_pedidos (stg_seq);\n\n"
+        "-- colunas tipadas preenchidas pela carga com CARGA_TIPADA=1 (pedidos/tipos.py);\n"
+        "-- o upsert usa o caminho rápido quando todas as linhas do intervalo têm tipado = true\n"
+        + ddl_colunas_tipadas() + "\n"
+    )
+
+def ddl_dw() -> str:
+    defs = _defs(lambda c: c.tipo_dw) + [
+        "    -- md5 da última linha aplicada pelo upsert (03): linhas repetidas não são reescritas\n"
+        "    hash_conteudo BYTEA"
+    ]
+    return (
+        "CREATE TABLE dw.fat_pedidos (\n" + ",\n".join(defs) + "\n);\n\n"
+        "-- chave do upsert (03): ON CONFLICT (chave_nfe)\n"
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_fat_pedidos_chave_nfe ON dw.fat_pedidos (chave_nfe);\n"
+    )
+
+def ddl_hist() -> str:
+    defs = "\n".join(f"{d}," for d in _defs(lambda c: c.tipo_stg, "  "))
+    return f"""-- 1) Schema
+
+CREATE SCHEMA IF NOT EXISTS hist;
+
+-- 2) Tabela de histórico, particionada por mês de processed_ts
+--    As partições (hist.archive_pedidos_pAAAAMM) são criadas pelo 04_archive_pedidos.py
+--    antes de cada arquivamento; retenção e migração de uma tabela antiga não
+--    particionada: python/05_retencao_hist_pedidos.py
+CREATE TABLE IF NOT EXISTS hist.archive_pedidos (
+  hist_id        bigserial,                    -- PK técnica (com processed_ts, exigido pela partição)
+  processed_ts   timestamptz NOT NULL DEFAULT now(),
+  batch_id       uuid        NOT NULL,
+
+  -- mesmas colunas da staging
+{defs}
+
+  PRIMARY KEY (hist_id, processed_ts)
+) PARTITION BY RANGE (processed_ts);
+
+-- 3) Índices úteis (replicados em cada partição)
+CREATE INDEX IF NOT EXISTS ix_hist_pedidos_chave_nfe   ON hist.archive_pedidos (chave_nfe);
+CREATE INDEX IF NOT EXISTS ix_hist_pedidos_processed   ON hist.archive_pedidos (processed_ts DESC);
+CREATE INDEX IF NOT EXISTS ix_hist_pedidos_batch       ON hist.archive_pedidos (batch_id);
+"""
+
+DIR_SQL = Path(__file__).resolve().parent.parent.parent / "sql"
+ARQUIVOS_DDL = {
+    "ddl_stg_pedidos": ddl_staging,
+    "ddl_fat_pedidos": ddl_dw,
+    "ddl_hist_pedidos": ddl_hist,
+}
+
+def main():
+    ap = argparse.ArgumentParser(description="Confere (ou regrava) os DDL de sql/ gerados do esquema")
+    ap.add_argument("--gravar", action="store_true", help="regrava os arquivos divergentes")
+    args = ap.parse_args()
+    divergentes = 0
+    for nome, gerar in ARQUIVOS_DDL.items():
+        caminho = DIR_SQL / nome
+        novo = gerar()
+        atual = caminho.read_text(encoding="utf-8") if caminho.exists() else ""
+        if atual == novo:
+            print(f"{nome}: ok")
+            continue
+        if args.gravar:
+            caminho.write_text(novo, encoding="utf-8", newline="\n")
+            print(f"{nome}: regravado")
+            continue
+        divergentes += 1
+        print(f"{nome}: diverge do esquema")
+        sys.stdout.writelines(difflib.unified_diff(
+            atual.splitlines(True), novo.splitlines(True), f"sql/{nome}", "esquema"))
+    sys.exit(1 if divergentes else 0)
+
+if __name__ == "__main__":
+    main()
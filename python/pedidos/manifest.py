@@ -0,0 +1,279 @@
+# manifesto local de ingestão (SQLite)
+#
+# Substitui o glob de diretórios (novos/lidos/erros) para decidir o que é novo.
+# Cada arquivo é uma linha indexada pelo nome (sem distinção de caixa) com o
+# tamanho/mtime remotos, tamanho/sha256 locais e o status na pipeline:
+#   baixado -> aguardando carga na staging
+#   lido    -> carregado na staging
+#   erro    -> rejeitado na carga
+#   duplicado -> conteúdo idêntico a um arquivo já carregado; não entra na staging
+# Se o tamanho ou mtime remotos mudarem, o arquivo volta a ser baixado e
+# reprocessado.
+#
+# Índices de deduplicação da carga (02):
+#   conteudos -> sha256 de cada arquivo carregado com sucesso, com o nome de origem
+#   linhas    -> hash de cada linha já copiada para a staging (opcional,
+#                CARGA_DEDUP_LINHAS), podado por idade
+
+import os
+import sqlite3
+import hashlib
+import threading
+from datetime import date, datetime, timedelta
+
+STATUS_BAIXADO = "baixado"
+STATUS_LIDO    = "lido"
+STATUS_ERRO    = "erro"
+STATUS_DUPLICADO = "duplicado"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS arquivos (
+    nome          TEXT PRIMARY KEY COLLATE NOCASE,
+    remote_size   INTEGER,
+    remote_mtime  INTEGER,
+    local_size    INTEGER,
+    sha256        TEXT,
+    status        TEXT NOT NULL,
+    baixado_em    TEXT,
+    processado_em TEXT,
+    destino       TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_arquivos_status ON arquivos (status);
+CREATE INDEX IF NOT EXISTS ix_arquivos_sha256 ON arquivos (sha256);
+
+CREATE TABLE IF NOT EXISTS conteudos (
+    sha256        TEXT PRIMARY KEY,
+    nome          TEXT NOT NULL,
+    bytes         INTEGER,
+    carregado_em  TEXT
+);
+-- manifestos anteriores: arquivos já lidos com hash conhecido
+INSERT OR IGNORE INTO conteudos (sha256, nome, bytes, carregado_em)
+SELECT sha256, nome, local_size, processado_em FROM arquivos
+WHERE status = 'lido' AND sha256 IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS linhas (
+    hash          BLOB PRIMARY KEY,
+    dia           TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_linhas_dia ON linhas (dia);
+"""
+
+# parâmetros por consulta IN (...) no SQLite
+_LOTE_SQLITE = 500
+
+def _csvs(diretorio) -> set:
+    """Nomes dos .csv do diretório (qualquer caixa na extensão); vazio se não existe."""
+    if not diretorio or not os.path.isdir(diretorio):
+        return set()
+    return {e.name for e in os.scandir(diretorio) if e.is_file() and e.name.lower().endswith(".csv")}
+
+def sha256_arquivo(caminho: str, bloco: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        while True:
+            b = f.read(bloco)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+def _agora() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+def _hoje() -> str:
+    return date.today().isoformat()
+
+class Manifest:
+    """Acesso thread-safe ao manifesto. Use como context manager."""
+
+    def __init__(self, caminho: str):
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def vazio(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM arquivos LIMIT 1").fetchone() is None
+
+    def importar_legado(self, nomes, status: str) -> int:
+        """
+        Semeia o manifesto a partir dos diretórios existentes (primeira execução).
+        Não sobrescreve linhas já conhecidas. Tamanho/mtime remotos ficam nulos e
+        são adotados na primeira listagem do SFTP.
+        """
+        agora = _agora()
+        with self._lock, self._conn:
+            cur = self._conn.executemany(
+                "INSERT OR IGNORE INTO arquivos (nome, status, baixado_em) VALUES (?, ?, ?)",
+                [(n, status, agora) for n in nomes],
+            )
+            return cur.rowcount
+
+    def semear_diretorios(self, dir_novos, dir_lidos, dir_erros) -> int:
+        """
+        Primeira execução com manifesto (01 ou 02, o que rodar antes): registra
+        lidos/ e erros/ com seus status e só o que está apenas em novos/ como
+        baixado. Até o safe_copy antigo os processados ficavam também em novos/,
+        e não podem voltar para a carga. Não faz nada se o manifesto já tem linhas.
+        """
+        if not self.vazio():
+            return 0
+        lidos, erros, novos = (_csvs(d) for d in (dir_lidos, dir_erros, dir_novos))
+        ja_vistos = {n.lower() for n in lidos | erros}
+        n = self.importar_legado(lidos, STATUS_LIDO)
+        n += self.importar_legado(erros, STATUS_ERRO)
+        n += self.importar_legado([x for x in novos if x.lower() not in ja_vistos], STATUS_BAIXADO)
+        return n
+
+    # ===== ETAPA 01 (SFTP) =====
+
+    def pendentes_download(self, remote_entries):
+        """
+        Recebe os SFTPAttributes da listagem e devolve os que precisam ser
+        baixados: desconhecidos ou com tamanho/mtime remotos diferentes do
+        registrado. Linhas legadas (sem atributos remotos) adotam os da listagem.
+        """
+        pendentes = []
+        adotar = []
+        with self._lock:
+            for e in remote_entries:
+                row = self._conn.execute(
+                    "SELECT remote_size, remote_mtime FROM arquivos WHERE nome = ?",
+                    (e.filename,),
+                ).fetchone()
+                if row is None:
+                    pendentes.append(e)
+                elif row[0] is None:
+                    adotar.append((e.st_size, e.st_mtime, e.filename))
+                elif row[0] != e.st_size or row[1] != e.st_mtime:
+                    pendentes.append(e)
+            if adotar:
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE arquivos SET remote_size = ?, remote_mtime = ? WHERE nome = ?",
+                        adotar,
+                    )
+        return pendentes
+
+    def registrar_download(self, nome: str, remote_size: int, remote_mtime, caminho_local: str):
+        """Marca o arquivo como baixado (novo ou alterado) e pendente de carga."""
+        local_size = os.path.getsize(caminho_local)
+        digest = sha256_arquivo(caminho_local)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO arquivos (nome, remote_size, remote_mtime, local_size, sha256, status, baixado_em)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (nome) DO UPDATE SET
+                  remote_size = excluded.remote_size,
+                  remote_mtime = excluded.remote_mtime,
+                  local_size = excluded.local_size,
+                  sha256 = excluded.sha256,
+                  status = excluded.status,
+                  baixado_em = excluded.baixado_em,
+                  processado_em = NULL,
+                  destino = NULL
+                """,
+                (nome, remote_size, remote_mtime, local_size, digest, STATUS_BAIXADO, _agora()),
+            )
+
+    # ===== ETAPA 02 (STAGING) =====
+
+    def pendentes_carga(self):
+        """Nomes com status 'baixado', em ordem alfabética."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT nome FROM arquivos WHERE status = ? ORDER BY nome",
+                (STATUS_BAIXADO,),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def localizar(self, nome: str):
+        """(status, destino) do arquivo, ou None se desconhecido. destino é nulo até a carga."""
+        with self._lock:
+            row = self._conn.execute("SELECT status, destino FROM arquivos WHERE nome = ?", (nome,)).fetchone()
+        return tuple(row) if row else None
+
+    def registrar_carga(self, nome: str, status: str, destino: str = None):
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE arquivos SET status = ?, processado_em = ?, destino = ? WHERE nome = ?",
+                (status, _agora(), destino, nome),
+            )
+            if cur.rowcount == 0:
+                self._conn.execute(
+                    "INSERT INTO arquivos (nome, status, processado_em, destino) VALUES (?, ?, ?, ?)",
+                    (nome, status, _agora(), destino),
+                )
+
+    # ===== DEDUPLICAÇÃO =====
+
+    def sha256_local(self, nome: str, caminho_local: str) -> str:
+        """sha256 registrado no download; calcula e grava quando falta (arquivos legados ou manuais)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, local_size FROM arquivos WHERE nome = ?", (nome,)
+            ).fetchone()
+        tamanho = os.path.getsize(caminho_local)
+        if row and row[0] and row[1] == tamanho:
+            return row[0]
+        digest = sha256_arquivo(caminho_local)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE arquivos SET sha256 = ?, local_size = ? WHERE nome = ?", (digest, tamanho, nome)
+            )
+        return digest
+
+    def conteudo_carregado(self, sha256: str):
+        """Nome do arquivo já carregado com este conteúdo, ou None."""
+        with self._lock:
+            row = self._conn.execute("SELECT nome FROM conteudos WHERE sha256 = ?", (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def registrar_conteudo(self, sha256: str, nome: str, tamanho: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO conteudos (sha256, nome, bytes, carregado_em) VALUES (?, ?, ?, ?)",
+                (sha256, nome, tamanho, _agora()),
+            )
+
+    def linhas_conhecidas(self, hashes) -> set:
+        """Subconjunto de `hashes` já registrado como carregado."""
+        conhecidas = set()
+        with self._lock:
+            for i in range(0, len(hashes), _LOTE_SQLITE):
+                lote = hashes[i:i + _LOTE_SQLITE]
+                marcas = ",".join("?" * len(lote))
+                conhecidas.update(
+                    r[0] for r in self._conn.execute(f"SELECT hash FROM linhas WHERE hash IN ({marcas})", lote)
+                )
+        return conhecidas
+
+    def registrar_linhas(self, hashes):
+        """Chamado só depois do COPY commitado: linhas de uma carga que falhou não contam."""
+        hoje = _hoje()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO linhas (hash, dia) VALUES (?, ?)", ((h, hoje) for h in hashes)
+            )
+
+    def podar_linhas(self, dias: int) -> int:
+        """Esquece hashes de linha mais antigos que `dias`. Retorna quantos saíram."""
+        corte = (date.today() - timedelta(days=dias)).isoformat()
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM linhas WHERE dia < ?", (corte,)).rowcount
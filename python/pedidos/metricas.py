@@ -0,0 +1,170 @@
+# métricas estruturadas por etapa da pipeline rel_83
+#
+# Cada medição vira uma linha JSON em METRICAS_DIR/metricas_rel83.jsonl
+#   {"ts": ..., "job": "02_load_stage_pedidos", "etapa": "copy", "segundos": 1.2, "linhas": 50000, ...}
+# e é somada em memória para o textfile do Prometheus (node_exporter,
+# --collector.textfile.directory=METRICAS_DIR), gravado por descarregar():
+#   rel83_etapa_segundos_total{job="...",etapa="copy"} 12.3
+#   rel83_etapa_execucoes_total{job="...",etapa="copy"} 10
+#   rel83_etapa_linhas_total{job="...",etapa="copy"} 500000
+# Taxas, máximos e posições (ULTIMO_VALOR) não se somam: viram gauges com o
+# último valor (rel83_etapa_linhas_por_s{...}). Valores não numéricos
+# (ex.: arquivo) só vão para o JSON.
+#
+# Perfil opt-in de um único arquivo: PERFIL_ARQUIVO=<nome do CSV> (ou "*")
+# grava <nome>.prof (cProfile, abrir com snakeviz/pstats) e <nome>.perfil.txt
+# (funções mais caras e maiores alocações do tracemalloc) em METRICAS_DIR.
+
+import os
+import io
+import re
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICAS = os.getenv("METRICAS", "1") == "1"
+METRICAS_DIR = os.getenv(
+    "METRICAS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
+)
+PERFIL_ARQUIVO = os.getenv("PERFIL_ARQUIVO", "")
+
+ULTIMO_VALOR = {"linhas_por_s", "latencia_max_s", "pico_bytes", "ate", "fatia"}
+
+def _nome_prom(s: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", s)
+
+class Metricas:
+    """Coletor thread-safe de um processo (job)."""
+
+    def __init__(self, job: str, diretorio: str = METRICAS_DIR, ativo: bool = METRICAS):
+        self.job = job
+        self.diretorio = diretorio
+        self.ativo = ativo
+        self._lock = threading.Lock()
+        self._somas = {}
+        self._ultimos = {}
+        self._jsonl = None
+        if ativo:
+            os.makedirs(diretorio, exist_ok=True)
+            self._jsonl = open(os.path.join(diretorio, "metricas_rel83.jsonl"), "a", encoding="utf-8")
+
+    def registrar(self, etapa: str, segundos: float = None, **valores):
+        if not self.ativo:
+            return
+        evento = {"ts": datetime.now().isoformat(timespec="milliseconds"), "job": self.job, "etapa": etapa}
+        if segundos is not None:
+            evento["segundos"] = round(segundos, 6)
+        evento.update(valores)
+        linha = json.dumps(evento, ensure_ascii=False, default=str)
+        with self._lock:
+            self._jsonl.write(linha + "\n")
+            self._jsonl.flush()
+            soma = self._somas.setdefault(etapa, {"execucoes": 0})
+            soma["execucoes"] += 1
+            if segundos is not None:
+                soma["segundos"] = soma.get("segundos", 0.0) + segundos
+            for k, v in valores.items():
+                if not isinstance(v, (int, float)) or isinstance(v, bool):
+                    continue
+                if k in ULTIMO_VALOR:
+                    self._ultimos.setdefault(etapa, {})[k] = v
+                else:
+                    soma[k] = soma.get(k, 0) + v
+
+    @contextmanager
+    def medir(self, etapa: str, **valores):
+        """Mede o bloco; o dict devolvido pode receber valores (ex.: linhas) até o fim."""
+        extra = dict(valores)
+        t0 = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.registrar(etapa, time.perf_counter() - t0, **extra)
+
+    def descarregar(self):
+        """Grava o textfile do Prometheus (rel83_<job>.prom) de forma atômica."""
+        if not self.ativo:
+            return
+        with self._lock:
+            somas = {e: dict(v) for e, v in self._somas.items()}
+            ultimos = {e: dict(v) for e, v in self._ultimos.items()}
+            self._jsonl.flush()
+        por_metrica = {}
+        for tipo, grupo, sufixo in (("counter", somas, "_total"), ("gauge", ultimos, "")):
+            for etapa, valores in grupo.items():
+                for k, v in valores.items():
+                    por_metrica.setdefault((f"rel83_etapa_{_nome_prom(k)}{sufixo}", tipo), []).append((etapa, v))
+        out = io.StringIO()
+        for nome, tipo in sorted(por_metrica):
+            out.write(f"# TYPE {nome} {tipo}\n")
+            for etapa, v in sorted(por_metrica[(nome, tipo)]):
+                out.write(f'{nome}{{job="{self.job}",etapa="{etapa}"}} {v}\n')
+        out.write("# TYPE rel83_ultima_execucao_timestamp_seconds gauge\n")
+        out.write(f'rel83_ultima_execucao_timestamp_seconds{{job="{self.job}"}} {time.time():.0f}\n')
+        caminho = os.path.join(self.diretorio, f"rel83_{_nome_prom(self.job)}.prom")
+        tmp = caminho + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        os.replace(tmp, caminho)
+
+    def fechar(self):
+        self.descarregar()
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+            self.ativo = False
+
+_atual = None
+
+def iniciar(job: str) -> Metricas:
+    """Coletor do processo; chamado uma vez no início de cada script."""
+    global _atual
+    _atual = Metricas(job)
+    return _atual
+
+def atual() -> Metricas:
+    """Coletor corrente; sem iniciar() (ex.: processos filhos, uso como módulo) nada é gravado."""
+    global _atual
+    if _atual is None:
+        _atual = Metricas("rel83", ativo=False)
+    return _atual
+
+def registrar(etapa: str, segundos: float = None, **valores):
+    atual().registrar(etapa, segundos, **valores)
+
+def medir(etapa: str, **valores):
+    return atual().medir(etapa, **valores)
+
+@contextmanager
+def perfil(caminho: str):
+    """cProfile + tracemalloc do bloco quando PERFIL_ARQUIVO casa com o nome do arquivo."""
+    nome = os.path.basename(caminho)
+    if not PERFIL_ARQUIVO or (PERFIL_ARQUIVO != "*" and PERFIL_ARQUIVO.lower() != nome.lower()):
+        yield
+        return
+    os.makedirs(METRICAS_DIR, exist_ok=True)
+    base = os.path.join(METRICAS_DIR, nome)
+    tracemalloc.start(10)
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        snap = tracemalloc.take_snapshot()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        prof.dump_stats(base + ".prof")
+        with open(base + ".perfil.txt", "w", encoding="utf-8") as f:
+            f.write(f"# {nome}: pico de memória Python {pico / 1024**2:.1f} MB\n\n")
+            pstats.Stats(prof, stream=f).sort_stats("cumulative").print_stats(30)
+            f.write("\n# maiores alocações vivas no fim (tracemalloc)\n")
+            for st in snap.statistics("lineno")[:20]:
+                f.write(f"{st}\n")
+        registrar("perfil", arquivo=nome, pico_bytes=pico)
+        print(f"Perfil gravado em {base}.prof / {base}.perfil.txt")
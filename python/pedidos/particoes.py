@@ -0,0 +1,205 @@
+# particionamento mensal de hist.archive_pedidos por processed_ts
+#
+# Cada mês é uma partição <tabela>_pAAAAMM com limites na meia-noite do dia 1
+# no fuso HIST_FUSO. Não há partição DEFAULT: as partições do mês corrente e
+# dos próximos meses são criadas antes de cada arquivamento (04), e uma linha
+# fora delas faz o arquivamento falhar em vez de cair num balde genérico.
+#
+# Retenção (05_retencao_hist_pedidos.py): partições inteiras são desanexadas,
+# apagadas ou exportadas para .csv.gz e apagadas; nada de DELETE por linha.
+#
+# Migração de uma tabela comum (migrar_para_particionada): a tabela antiga vira
+# a partição <tabela>_legado, cobrindo de MINVALUE até o início do próximo mês.
+# CHECK e índice único são preparados antes sem bloquear o arquivamento e o
+# índice vira a PK do legado na troca, então o ATTACH não varre a tabela nem
+# cria índice.
+
+import os
+import gzip
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+HIST_FUSO = os.getenv("HIST_FUSO", "America/Sao_Paulo")
+
+# limites de cada partição, lidos de pg_class.relpartbound (de = NULL para MINVALUE)
+SQL_PARTICOES = """
+SELECT n.nspname || '.' || c.relname AS nome,
+       pg_get_expr(c.relpartbound, c.oid) AS limites,
+       (regexp_match(pg_get_expr(c.relpartbound, c.oid), $$FROM \\('([^']+)'\\)$$))[1]::timestamptz AS de,
+       (regexp_match(pg_get_expr(c.relpartbound, c.oid), $$TO \\('([^']+)'\\)$$))[1]::timestamptz AS ate
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE i.inhparent = %s::regclass
+"""
+
+def _mes(d: date, delta: int) -> date:
+    m = d.year * 12 + d.month - 1 + delta
+    return date(m // 12, m % 12 + 1, 1)
+
+def _limite(d: date) -> datetime:
+    return datetime(d.year, d.month, d.day, tzinfo=ZoneInfo(HIST_FUSO))
+
+def nome_particao(tabela: str, mes: date) -> str:
+    return f"{tabela}_p{mes.year:04d}{mes.month:02d}"
+
+def particionada(cur, tabela: str) -> bool:
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (tabela,))
+    r = cur.fetchone()
+    return bool(r and r[0])
+
+def listar(cur, tabela: str):
+    """[(nome, limites, de, ate)] das partições, da mais antiga para a mais nova."""
+    cur.execute(SQL_PARTICOES + "ORDER BY ate NULLS LAST", (tabela,))
+    return cur.fetchall()
+
+def garantir(cur, tabela: str, meses_a_frente: int, hoje: date = None) -> list:
+    """
+    Cria as partições do mês corrente e dos `meses_a_frente` seguintes que ainda
+    não existem. Retorna os nomes criados (vazio na maioria das execuções, sem
+    lock na tabela-mãe). Não faz nada se a tabela não for particionada.
+    """
+    if not particionada(cur, tabela):
+        return []
+    hoje = hoje or date.today()
+    faixas = [(de, ate) for _, _, de, ate in listar(cur, tabela) if ate is not None]
+    criadas = []
+    for k in range(meses_a_frente + 1):
+        de, ate = _limite(_mes(hoje, k)), _limite(_mes(hoje, k + 1))
+        # partes do mês já cobertas (partição mensal ou o legado da migração)
+        cobertas = [(d, a) for d, a in faixas if (d is None or d < ate) and a > de]
+        if any((d is None or d <= de) and a >= ate for d, a in cobertas):
+            continue
+        inicio = max([de] + [a for _, a in cobertas if a < ate])
+        nome = nome_particao(tabela, _mes(hoje, k))
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {nome} PARTITION OF {tabela} FOR VALUES FROM (%s) TO (%s)",
+            (inicio, ate),
+        )
+        criadas.append(nome)
+        faixas.append((inicio, ate))
+    return criadas
+
+def vencidas(cur, tabela: str, meses_manter: int, hoje: date = None):
+    """Partições cujo limite superior é anterior ao primeiro mês mantido."""
+    hoje = hoje or date.today()
+    corte = _limite(_mes(hoje, -(meses_manter - 1)))
+    cur.execute(f"SELECT nome FROM ({SQL_PARTICOES}) p WHERE ate <= %s ORDER BY ate", (tabela, corte))
+    return [r[0] for r in cur.fetchall()]
+
+def desanexar(cur, tabela: str, particao: str):
+    cur.execute(f"ALTER TABLE {tabela} DETACH PARTITION {particao}")
+
+def apagar(cur, particao: str):
+    cur.execute(f"DROP TABLE {particao}")
+
+def exportar(cur, particao: str, caminho: str) -> int:
+    """COPY da partição para um .csv.gz (escrito em .tmp e renomeado). Retorna bytes gravados."""
+    tmp = caminho + ".tmp"
+    # fsync no próprio handle de escrita: no Windows fsync de descritor só leitura dá EBADF
+    with open(tmp, "wb") as bruto:
+        with gzip.GzipFile(fileobj=bruto, mode="wb", compresslevel=6) as f:
+            cur.copy_expert(f"COPY {particao} TO STDOUT WITH (FORMAT csv, HEADER true)", f)
+        bruto.flush()
+        os.fsync(bruto.fileno())
+    os.replace(tmp, caminho)
+    return os.path.getsize(caminho)
+
+def migrar_para_particionada(conn, tabela: str, meses_a_frente: int, lock_timeout_ms: int = 5000,
+                             advisory_key: str = None):
+    """
+    Converte `tabela` (comum) em particionada por processed_ts, mantendo os dados
+    antigos como a partição <tabela>_legado. Idempotente: se já for particionada,
+    só garante as próximas partições.
+    """
+    esquema, nome = tabela.split(".")
+    legado = f"{tabela}_legado"
+    proximo = _limite(_mes(date.today(), 1))
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            if particionada(cur, tabela):
+                conn.autocommit = False
+                criadas = garantir(cur, tabela, meses_a_frente)
+                conn.commit()
+                return criadas
+            # 1) Preparação sem bloquear inserções: índice único com a chave de
+            #    partição e CHECK validado, para o ATTACH não varrer a tabela.
+            cur.execute(
+                f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {nome}_pk_part "
+                f"ON {tabela} (hist_id, processed_ts)"
+            )
+            cur.execute(
+                "SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s",
+                (tabela, f"{nome}_ck_legado"),
+            )
+            if cur.fetchone():
+                cur.execute(f"ALTER TABLE {tabela} DROP CONSTRAINT {nome}_ck_legado")
+            cur.execute(
+                f"ALTER TABLE {tabela} ADD CONSTRAINT {nome}_ck_legado "
+                f"CHECK (processed_ts IS NOT NULL AND processed_ts < %s) NOT VALID",
+                (proximo,),
+            )
+            cur.execute(f"ALTER TABLE {tabela} VALIDATE CONSTRAINT {nome}_ck_legado")
+
+        # 2) Troca numa transação curta
+        conn.autocommit = False
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL lock_timeout = %s", (f"{lock_timeout_ms}ms",))
+            if advisory_key:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (advisory_key,))
+            cur.execute(f"LOCK TABLE {tabela} IN ACCESS EXCLUSIVE MODE")
+            cur.execute(
+                "SELECT pg_get_serial_sequence(%s, 'hist_id')", (tabela,)
+            )
+            seq = cur.fetchone()[0]
+            cur.execute(f"ALTER TABLE {tabela} RENAME TO {nome}_legado")
+            # nomes dos índices antigos ficam livres para a tabela-mãe
+            cur.execute(
+                """
+                SELECT i.relname FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+                WHERE x.indrelid = %s::regclass
+                """,
+                (legado,),
+            )
+            for (idx,) in cur.fetchall():
+                if not idx.startswith(f"{nome}_legado"):
+                    cur.execute(f"ALTER INDEX {esquema}.{idx} RENAME TO {nome}_legado_{idx}")
+            cur.execute(
+                f"CREATE TABLE {tabela} (LIKE {legado} INCLUDING DEFAULTS INCLUDING STORAGE) "
+                f"PARTITION BY RANGE (processed_ts)"
+            )
+            cur.execute(f"ALTER TABLE {tabela} ADD CONSTRAINT {nome}_pkey PRIMARY KEY (hist_id, processed_ts)")
+            cur.execute(f"CREATE INDEX ix_hist_pedidos_chave_nfe ON {tabela} (chave_nfe)")
+            cur.execute(f"CREATE INDEX ix_hist_pedidos_processed ON {tabela} (processed_ts DESC)")
+            cur.execute(f"CREATE INDEX ix_hist_pedidos_batch ON {tabela} (batch_id)")
+            # a PK antiga (só hist_id) dá lugar a uma sobre o índice único
+            # (hist_id, processed_ts) preparado acima: o ATTACH só reaproveita
+            # índice de partição que sustenta constraint para a PK da mãe (um
+            # índice único solto seria refeito com a tabela bloqueada)
+            cur.execute(
+                "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", (legado,)
+            )
+            for (pk,) in cur.fetchall():
+                cur.execute(f"ALTER TABLE {legado} DROP CONSTRAINT {pk}")
+            cur.execute(
+                f"ALTER TABLE {legado} ADD CONSTRAINT {nome}_legado_pkey "
+                f"PRIMARY KEY USING INDEX {nome}_legado_{nome}_pk_part"
+            )
+            cur.execute(f"ALTER TABLE {tabela} ATTACH PARTITION {legado} FOR VALUES FROM (MINVALUE) TO (%s)",
+                        (proximo,))
+            # o CHECK só servia para o ATTACH dispensar a varredura
+            cur.execute(f"ALTER TABLE {legado} DROP CONSTRAINT {nome}_ck_legado")
+            if seq:
+                # a sequência do hist_id passa a pertencer à tabela-mãe: apagar o
+                # legado na retenção não pode levá-la junto
+                cur.execute(f"ALTER SEQUENCE {seq} OWNED BY {tabela}.hist_id")
+            criadas = garantir(cur, tabela, meses_a_frente)
+        conn.commit()
+        return [legado] + criadas
+    except Exception:
+        if not conn.autocommit:
+            conn.rollback()
+        raise
+    finally:
+        conn.autocommit = False
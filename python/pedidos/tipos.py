@@ -0,0 +1,245 @@
+# conversores da carga tipada (CARGA_TIPADA=1 em 02_load_stage_pedidos.py)
+#
+# Reproduzem em Python, valor a valor, as cadeias CASE/regex das REGRAS de
+# pedidos/esquema.py (caminho texto do upsert) para as colunas de data,
+# timestamp e número. O resultado já sai como literal do PostgreSQL (ISO para
+# datas, ponto decimal para números) ou None (NULL), pronto para o COPY em
+# formato text.
+#
+# As mesmas peculiaridades do to_timestamp/to_date são mantidas: dia ou mês
+# 00 viram 01, ano 0000 vira 1 BC, campos fora da faixa são erro. Onde o SQL
+# falharia (data inexistente, número que o cast não aceita, estouro de
+# numeric/int) o conversor levanta ValueError e o arquivo é rejeitado na carga.
+#
+# Datas se repetem muito dentro de um arquivo: cada conversor é memoizado.
+
+import re
+import calendar
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+from pedidos import esquema
+
+CACHE_CONVERSOES = 1 << 16
+
+_NULOS_DATA = ("", "00/00/0000", "00/00/0000 00:00:00", "0000-00-00")
+
+_RE_BR       = re.compile(r"(\d{2})/(\d{2})/(\d{4})(?: (\d{2}):(\d{2}):(\d{2}))?", re.ASCII)
+_RE_BR_HORA  = re.compile(r"(\d{2})/(\d{2})/(\d{4}) (\d{2}):(\d{2}):(\d{2})", re.ASCII)
+_RE_BR_DIA   = re.compile(r"(\d{2})/(\d{2})/(\d{4})", re.ASCII)
+_RE_TRACO    = re.compile(r"(\d{2})-(\d{2})-(\d{4})", re.ASCII)
+_RE_ISO      = re.compile(r"(\d{4})-(\d{2})-(\d{2})(?:[ T](\d{2}):(\d{2})(?::(\d{2}))?)?", re.ASCII)
+_RE_ISO_HORA = re.compile(r"(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2})(?::(\d{2}))?", re.ASCII)
+_RE_ISO_TZ   = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2})(?::(\d{2}))?(?:\.(\d+))?(Z|[+-]\d{2}:?\d{2})?", re.ASCII
+)
+_RE_COMPACTA = re.compile(r"\d{8}", re.ASCII)
+_RE_DIGITOS  = re.compile(r"[0-9]+")
+_RE_NAO_DIGITO = re.compile(r"[^0-9]")
+_RE_NAO_NUMERO = re.compile(r"[^0-9,.-]")
+
+def _padroes_numero(casas: int):
+    """Padrões do CASE numérico, na ordem, com a troca de separadores de cada um."""
+    c = "{1,%d}" % casas
+    return [
+        (re.compile(r"[+-]?\d{1,3}(\.\d{3})+,\d" + c, re.ASCII), lambda t: t.replace(".", "").replace(",", ".")),
+        (re.compile(r"[+-]?\d{1,3}(,\d{3})+\.\d" + c, re.ASCII), lambda t: t.replace(",", "")),
+        (re.compile(r"[+-]?\d+,\d" + c, re.ASCII),               lambda t: t.replace(",", ".")),
+        (re.compile(r"[+-]?\d+\.\d" + c, re.ASCII),              lambda t: t),
+        (re.compile(r"[+-]?\d{1,3}(\.\d{3})+", re.ASCII),        lambda t: t.replace(".", "")),
+        (re.compile(r"[+-]?\d{1,3}(,\d{3})+", re.ASCII),         lambda t: t.replace(",", "")),
+        (re.compile(r"[+-]?\d+", re.ASCII),                      lambda t: t),
+    ]
+
+_PADROES_NUMERO = {2: _padroes_numero(2), 3: _padroes_numero(3)}
+_PRECISAO = {2: 15, 3: 12}   # numeric(15,2) e numeric(12,3), como no DW
+
+# ===== DATAS =====
+
+def _data_pg(texto: str, a: str, m: str, d: str) -> str:
+    """
+    Valida dia/mês/ano como o to_timestamp (00 -> 01) e devolve o literal.
+    Ano 0 é 1 BC e, como no PostgreSQL, dia além do fim do mês transborda.
+    """
+    ano, mes, dia = int(a), int(m) or 1, int(d) or 1
+    if ano == 0:
+        if mes > 12 or dia > 31:
+            raise ValueError(f"data fora da faixa: {texto!r}")
+        # ano 4 tem o mesmo calendário bissexto de 1 BC
+        dt = date(4, mes, 1) + timedelta(days=dia - 1)
+        return f"0001-{dt.month:02d}-{dt.day:02d} BC"
+    if mes > 12 or dia > calendar.monthrange(ano, mes)[1]:
+        raise ValueError(f"data fora da faixa: {texto!r}")
+    return f"{ano:04d}-{mes:02d}-{dia:02d}"
+
+def _hora_pg(texto: str, h, mi, s) -> str:
+    hora, minuto, segundo = int(h or 0), int(mi or 0), int(s or 0)
+    if hora > 23 or minuto > 59 or segundo > 59:
+        raise ValueError(f"horário fora da faixa: {texto!r}")
+    return f"{hora:02d}:{minuto:02d}:{segundo:02d}"
+
+def _timestamp_pg(texto: str, a, m, d, h=None, mi=None, s=None) -> str:
+    data = _data_pg(texto, a, m, d)
+    hora = _hora_pg(texto, h, mi, s)
+    if data.endswith(" BC"):
+        return f"{data[:-3]} {hora} BC"
+    return f"{data} {hora}"
+
+def _segundos_sem_campo(texto: str, fracao, fuso) -> str:
+    """
+    'YYYY-MM-DD HH:MI' seguido de fração ou fuso: o to_timestamp com
+    'HH24:MI:SS' lê os primeiros dígitos seguintes como segundos.
+    """
+    if fracao is not None:
+        return fracao
+    if fuso is None:
+        return None
+    if fuso == "Z":
+        raise ValueError(f"valor inválido para segundos: {texto!r}")
+    return _RE_DIGITOS.match(fuso, 1).group(0)
+
+@lru_cache(maxsize=CACHE_CONVERSOES)
+def data(valor: str):
+    """data_nfe, data_prev_entrega, data_prev_entrega_original -> date."""
+    t = valor.strip(" ")
+    if t in _NULOS_DATA:
+        return None
+    g = _RE_BR.fullmatch(t)
+    if g:
+        _timestamp_pg(t, g[3], g[2], g[1], g[4], g[5], g[6])
+        return _data_pg(t, g[3], g[2], g[1])
+    g = _RE_TRACO.fullmatch(t)
+    if g:
+        return _data_pg(t, g[3], g[2], g[1])
+    g = _RE_ISO.fullmatch(t)
+    if g:
+        _timestamp_pg(t, g[1], g[2], g[3], g[4], g[5], g[6])
+        return _data_pg(t, g[1], g[2], g[3])
+    if _RE_COMPACTA.fullmatch(t):
+        return _data_pg(t, t[:4], t[4:6], t[6:])
+    return None
+
+@lru_cache(maxsize=CACHE_CONVERSOES)
+def timestamp_ocorrencia(valor: str):
+    """data_ultima_ocr -> timestamp (aceita fração e fuso no ISO, que são ignorados)."""
+    t = valor.strip(" ")
+    g = _RE_BR_HORA.fullmatch(t)
+    if g:
+        return _timestamp_pg(t, g[3], g[2], g[1], g[4], g[5], g[6])
+    g = _RE_ISO_TZ.fullmatch(t)
+    if g:
+        seg = g[6] if g[6] is not None else _segundos_sem_campo(t, g[7], g[8])
+        return _timestamp_pg(t, g[1], g[2], g[3], g[4], g[5], seg)
+    g = _RE_BR_DIA.fullmatch(t)
+    if g:
+        return _timestamp_pg(t, g[3], g[2], g[1])
+    return None
+
+@lru_cache(maxsize=CACHE_CONVERSOES)
+def timestamp_chegada(valor: str):
+    """chegada_transportadora -> timestamp."""
+    t = valor.strip(" ")
+    g = _RE_BR_HORA.fullmatch(t)
+    if g:
+        return _timestamp_pg(t, g[3], g[2], g[1], g[4], g[5], g[6])
+    g = _RE_ISO_HORA.fullmatch(t)
+    if g:
+        return _timestamp_pg(t, g[1], g[2], g[3], g[4], g[5], g[6])
+    g = _RE_BR_DIA.fullmatch(t)
+    if g:
+        return _timestamp_pg(t, g[3], g[2], g[1])
+    return None
+
+@lru_cache(maxsize=CACHE_CONVERSOES)
+def timestamp_insercao(valor: str):
+    """data_insercao -> timestamp; None vira now() no upsert."""
+    t = valor.strip(" ")
+    g = _RE_BR.fullmatch(t)
+    if g:
+        return _timestamp_pg(t, g[3], g[2], g[1], g[4], g[5], g[6])
+    g = _RE_ISO.fullmatch(t)
+    if g:
+        return _timestamp_pg(t, g[1], g[2], g[3], g[4], g[5], g[6])
+    return None
+
+# ===== NÚMEROS =====
+
+def _numeric_pg(texto: str, literal: str, casas: int) -> str:
+    try:
+        n = Decimal(literal)
+    except InvalidOperation:
+        raise ValueError(f"número inválido: {texto!r}") from None
+    if not n.is_finite():
+        raise ValueError(f"número inválido: {texto!r}")
+    n = n.quantize(Decimal(1).scaleb(-casas), rounding=ROUND_HALF_UP)
+    if not n:
+        n = n.copy_abs()   # numeric não tem -0
+    if n.adjusted() >= _PRECISAO[casas] - casas:
+        raise ValueError(f"número fora da faixa de numeric({_PRECISAO[casas]},{casas}): {texto!r}")
+    return str(n)
+
+def _numero(valor: str, casas: int):
+    t = valor.strip(" ")
+    if t == "":
+        return None
+    for padrao, normalizar in _PADROES_NUMERO[casas]:
+        if padrao.fullmatch(t):
+            return _numeric_pg(valor, normalizar(t), casas)
+    # mesmo fallback do SQL: descarta tudo que não é dígito/vírgula/ponto/sinal
+    limpo = _RE_NAO_NUMERO.sub("", valor).replace(".", "").replace(",", ".")
+    return _numeric_pg(valor, limpo, casas)
+
+@lru_cache(maxsize=CACHE_CONVERSOES)
+def valor(v: str):
+    """valor_nfe -> numeric(15,2)."""
+    return _numero(v, 2)
+
+@lru_cache(maxsize=CACHE_CONVERSOES)
+def peso(v: str):
+    """peso -> numeric(12,3)."""
+    return _numero(v, 3)
+
+@lru_cache(maxsize=CACHE_CONVERSOES)
+def inteiro(v: str):
+    """qtd_volumes, cod_cd -> int (só os dígitos)."""
+    d = _RE_NAO_DIGITO.sub("", v)
+    if not d:
+        return None
+    n = int(d)
+    if n > 2147483647:
+        raise ValueError(f"inteiro fora da faixa: {v!r}")
+    return str(n)
+
+def chave_nfe(v: str):
+    """Só dígitos; NULL quando não tem 44 (chaves não se repetem: sem cache)."""
+    d = _RE_NAO_DIGITO.sub("", v)
+    return d if len(d) == 44 else None
+
+# ===== COLUNAS =====
+
+# regra do esquema (pedidos/esquema.py) -> conversor
+CONVERSORES = {
+    "chave_nfe":     chave_nfe,
+    "data":          data,
+    "ts_ocorrencia": timestamp_ocorrencia,
+    "ts_chegada":    timestamp_chegada,
+    "ts_insercao":   timestamp_insercao,
+    "valor":         valor,
+    "peso":          peso,
+    "inteiro":       inteiro,
+}
+
+# (coluna texto da staging, coluna tipada, conversor)
+CONVERSOES = [(c.nome, c.tipada, CONVERSORES[c.regra]) for c in esquema.TIPADAS]
+
+COLUNAS_TIPADAS = esquema.COLUNAS_TIPADAS
+
+DDL_COLUNAS_TIPADAS = esquema.ddl_colunas_tipadas()
+
+def plano_tipado(colunas):
+    """[(índice da coluna texto em `colunas`, conversor)] na ordem de COLUNAS_TIPADAS."""
+    return [(colunas.index(origem), f) for origem, _, f in CONVERSOES]
+
+def converter_linha(linha, plano):
+    """Valores tipados (literal PG ou None) de uma linha já mapeada, + a marca `tipado`."""
+    return [f(linha[i]) for i, f in plano] + ["t"]
@@ -0,0 +1,235 @@
+# orquestrador da pipeline rel_83: 01 -> 02 -> 03 -> 04 num único processo
+#
+# As etapas rodam sobrepostas, ligadas por filas:
+#   download (01) -> cada arquivo baixado entra na fila de carga
+#   carga    (02) -> PIPELINE_CARGA_THREADS threads fazem o COPY na staging
+#   dw       (03 + 04) -> assim que há arquivos carregados, roda o upsert
+#                   incremental (marca d'água em stg_seq) e arquiva o que ele
+#                   já aplicou; repete enquanto os downloads continuam
+# O .env é lido uma vez (pedidos/config.py) e todas as etapas usam o mesmo
+# pool de conexões (pedidos/banco.py).
+# No fim imprime o tempo de cada etapa e a latência "arquivo baixado ->
+# linha visível em dw.fat_pedidos".
+#
+# uso: python pipeline_pedidos.py
+import os, sys, time
+import queue
+import logging
+import threading
+import importlib.util
+from contextlib import contextmanager
+from pedidos import metricas, dedup, banco
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# threads de COPY (o parse é Python puro, então poucas bastam)
+PIPELINE_CARGA_THREADS = int(os.getenv("PIPELINE_CARGA_THREADS", "2"))
+# arquivos carregados que disparam um ciclo de upsert + arquivamento
+# (com a fila de carga vazia o ciclo roda com o que houver)
+PIPELINE_UPSERT_ARQUIVOS = int(os.getenv("PIPELINE_UPSERT_ARQUIVOS", "20"))
+# 0 = não arquiva durante a pipeline (só upsert)
+PIPELINE_ARQUIVAR = os.getenv("PIPELINE_ARQUIVAR", "1") == "1"
+
+def _etapa(arquivo: str, nome: str):
+    spec = importlib.util.spec_from_file_location(nome, os.path.join(BASE_DIR, arquivo))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+class Tempos:
+    """Acumula, por etapa, itens processados e segundos ocupados (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.etapas = {}
+        self.latencias = []
+
+    @contextmanager
+    def medir(self, etapa: str, itens: int = 1):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            with self._lock:
+                n, s = self.etapas.get(etapa, (0, 0.0))
+                self.etapas[etapa] = (n + itens, s + dt)
+
+    def latencia(self, segundos: float):
+        with self._lock:
+            self.latencias.append(segundos)
+
+    def imprimir(self, inicio: float, linhas: int):
+        total = time.perf_counter() - inicio
+        print("===== PIPELINE =====")
+        for etapa, (n, s) in self.etapas.items():
+            print(f"{etapa:<12} itens={n:<6} ocupado={s:8.2f}s")
+        if self.latencias:
+            lat = sorted(self.latencias)
+            print(
+                f"Latência baixado -> DW: média={sum(lat) / len(lat):.1f}s "
+                f"p50={lat[len(lat) // 2]:.1f}s máx={lat[-1]:.1f}s ({len(lat)} arquivos)"
+            )
+        taxa = linhas / total if total > 0 else 0
+        print(f"Linhas na staging: {linhas} | Tempo total: {total:.2f}s | {taxa:.0f} linhas/s")
+
+def main():
+    inicio = time.perf_counter()
+    metricas.iniciar("pipeline_pedidos")
+    upsert = _etapa("03_upsert_dw_pedidos.py", "upsert_dw_pedidos")
+    archive = _etapa("04_archive_pedidos.py", "archive_pedidos")
+    ingest = _etapa("01_ingest_sftp_pedidos.py", "ingest_sftp_pedidos")
+    carga = _etapa("02_load_stage_pedidos.py", "load_stage_pedidos")
+    ingest.setup_logging()
+    ingest.cleanup_part_files()
+
+    tempos = Tempos()
+    fila_carga = queue.Queue()
+    fim_download = threading.Event()
+    fim_carga = threading.Event()
+    carregados = threading.Condition()
+    prontos = []          # (caminho, instante do download) carregados e ainda fora do DW
+    baixados_em = {}
+    totais = {"linhas": 0}
+    evitados = dedup.Evitados()
+    erros = []
+
+    # uma conexão por thread de carga + as do upsert (fatiado pode usar várias)
+    banco.pool(minimo=max(1, PIPELINE_CARGA_THREADS) + max(1, upsert.UPSERT_CONEXOES))
+    manifest = carga.Manifest(carga.MANIFEST_PATH)
+    if carga.CARGA_DEDUP_LINHAS:
+        manifest.podar_linhas(carga.CARGA_DEDUP_DIAS)
+
+    def falhou(etapa, e):
+        logging.error("Falha na etapa %s: %s", etapa, e)
+        erros.append((etapa, e))
+
+    # ===== 01: download =====
+    def baixar():
+        transports, sessions = [], []
+        try:
+            # arquivos baixados numa execução anterior e ainda não carregados
+            for caminho in carga.listar_csv_novos(carga.DIR_NOVOS, carga.DIR_LIDOS, carga.DIR_ERROS, manifest):
+                baixados_em[caminho] = time.perf_counter()
+                fila_carga.put(caminho)
+
+            with tempos.medir("sftp_conexao"):
+                transports, sessions = ingest.open_session_pool(ingest.SFTP_TRANSPORTS, ingest.SFTP_CHANNELS)
+            with tempos.medir("sftp_lista"):
+                remotos = ingest.list_remote_files(sessions[0], ingest.SFTP_DIR)
+                pendentes = sorted(manifest.pendentes_download(remotos), key=lambda x: x.filename)
+            logging.info("Arquivos .CSV no SFTP: %d | pendentes: %d", len(remotos), len(pendentes))
+
+            def pronto(f):
+                caminho = str(ingest.DEST_DIR / f.filename)
+                baixados_em[caminho] = time.perf_counter()
+                fila_carga.put(caminho)
+
+            with tempos.medir("download", len(pendentes)):
+                if len(sessions) > 1:
+                    ingest.download_parallel(sessions, pendentes, manifest, ao_baixar=pronto)
+                else:
+                    for f in pendentes:
+                        if ingest.baixar_arquivo(sessions[0], f, manifest):
+                            pronto(f)
+        except Exception as e:
+            falhou("download", e)
+        finally:
+            ingest.close_session_pool(transports, sessions)
+            fim_download.set()
+
+    # ===== 02: carga na staging =====
+    def carregar():
+        conn = banco.obter()
+        try:
+            while True:
+                try:
+                    caminho = fila_carga.get(timeout=0.5)
+                except queue.Empty:
+                    if fim_download.is_set() and fila_carga.empty():
+                        return
+                    continue
+                with tempos.medir("carga"):
+                    inseridas = carga.processar_arquivo(conn, manifest, caminho, evitados)
+                if inseridas:
+                    with carregados:
+                        totais["linhas"] += inseridas
+                        prontos.append((caminho, baixados_em.get(caminho, time.perf_counter())))
+                        carregados.notify()
+        except Exception as e:
+            falhou("carga", e)
+        finally:
+            banco.devolver(conn)
+
+    # ===== 03 + 04: upsert e arquivamento em ciclos =====
+    def dw():
+        conn = banco.obter()
+        try:
+            while True:
+                with carregados:
+                    carregados.wait_for(
+                        lambda: len(prontos) >= PIPELINE_UPSERT_ARQUIVOS
+                        or (prontos and fila_carga.empty())
+                        or fim_carga.is_set(),
+                        timeout=5,
+                    )
+                    lote = prontos[:]
+                    prontos.clear()
+                    acabou = fim_carga.is_set()
+                if lote:
+                    with tempos.medir("upsert"):
+                        st = upsert.run_upsert(conn=conn)
+                    agora = time.perf_counter()
+                    for _, t in lote:
+                        tempos.latencia(agora - t)
+                        metricas.registrar("latencia_dw", agora - t)
+                    print(
+                        f"Upsert ({len(lote)} arquivos): staging={st['linhas_staging']} "
+                        f"inseridas={st['inseridas']} atualizadas={st['atualizadas']} ignoradas={st['ignoradas']}"
+                    )
+                    if PIPELINE_ARQUIVAR:
+                        with tempos.medir("arquivamento"):
+                            ins, _, _ = archive.mover(conn)
+                        print(f"Arquivadas: {ins}")
+                if acabou and not lote:
+                    return
+        except Exception as e:
+            falhou("dw", e)
+        finally:
+            banco.devolver(conn)
+
+    try:
+        if carga.CARGA_TIPADA:
+            conn = banco.obter()
+            try:
+                carga.garantir_colunas_tipadas(conn)
+            finally:
+                banco.devolver(conn)
+
+        t_dw = threading.Thread(target=dw, name="dw", daemon=True)
+        t_dw.start()
+        t_cargas = [threading.Thread(target=carregar, name=f"carga{i}", daemon=True)
+                    for i in range(max(1, PIPELINE_CARGA_THREADS))]
+        for t in t_cargas:
+            t.start()
+        baixar()
+        for t in t_cargas:
+            t.join()
+        with carregados:
+            fim_carga.set()
+            carregados.notify()
+        t_dw.join()
+    finally:
+        manifest.close()
+        banco.fechar()
+        metricas.atual().fechar()
+
+    tempos.imprimir(inicio, totais["linhas"])
+    print(evitados.resumo())
+    if erros:
+        etapa, e = erros[0]
+        print(f"Falha na etapa {etapa}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
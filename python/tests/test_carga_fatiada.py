@@ -0,0 +1,102 @@
+import csv
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+from pedidos import esquema
+
+_spec = importlib.util.spec_from_file_location("load_stage", RAIZ / "02_load_stage_pedidos.py")
+load_stage = importlib.util.module_from_spec(_spec)
+sys.modules["load_stage"] = load_stage
+_spec.loader.exec_module(load_stage)
+
+# colunas que vêm do CSV (arquivo_origem e afins não têm cabeçalho)
+COLUNAS_CSV = [c for c in esquema.COLUNAS_ESQUEMA if c.cabecalhos]
+HEADER = [c.cabecalhos[0] for c in COLUNAS_CSV]
+
+
+def gerar_csv(caminho, linhas, seed=1):
+    """Endereço e destinatário entre aspas com quebras de linha e separadores."""
+    rnd = random.Random(seed)
+    with open(caminho, "w", encoding="cp1252", newline="") as f:
+        w = csv.writer(f, delimiter=";", quoting=csv.QUOTE_MINIMAL, lineterminator="\r\n")
+        w.writerow(HEADER)
+        for i in range(linhas):
+            linha = []
+            for c in COLUNAS_CSV:
+                if c.nome == "endereco_completo":
+                    linha.append(f"Rua {i};\r\nnº {rnd.randint(1, 999)},\n" + "bloco\n" * rnd.randint(0, 40) + 'apto "3"')
+                elif c.nome == "nome_destinatario":
+                    linha.append(rnd.choice(["José da Silva", "Maria;\nLtda", '"ACME"\r\nS/A', ""]))
+                elif c.nome == "chave_nfe":
+                    linha.append(f"3525{i:040d}")
+                else:
+                    linha.append(rnd.choice(["SP", "", "1.234,56", "31/12/2025 10:00:00"]))
+            w.writerow(linha)
+
+
+def ler_payload(res):
+    with open(res["tmp"], encoding="utf-8", newline="") as f:
+        return list(csv.reader(f))
+
+
+class CargaFatiadaTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.caminho = os.path.join(self._tmp.name, "rel_83_fatiado.csv")
+        gerar_csv(self.caminho, 400)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def fatias(self, tamanho_fatia):
+        """Mesma conferência em ordem de carregar_fatiado; retorna (linhas, nº de faixas relidas)."""
+        encoding, sep = load_stage.detectar_formato(self.caminho)
+        header, inicio = load_stage.cabecalho_arquivo(self.caminho, encoding, sep)
+        with load_stage.ArquivoMapeado(self.caminho) as arquivo:
+            cortes = load_stage.cortes_fatias(arquivo, inicio, tamanho_fatia)
+        self.assertGreater(len(cortes), 10)
+        linhas, esperado, refeitas = [], inicio, 0
+        for a, b in zip(cortes, cortes[1:]):
+            res = load_stage.preparar_fatia(self.caminho, a, b, encoding, sep, header,
+                                            excedente_max=load_stage.FATIA_EXCEDENTE_MAX)
+            if res["erro"] or res["inicio"] != esperado:
+                load_stage.remover_payload(res)
+                refeitas += 1
+                res = load_stage.preparar_fatia(self.caminho, esperado, b, encoding, sep, header)
+                self.assertIsNone(res["erro"])
+            try:
+                linhas += ler_payload(res)
+            finally:
+                load_stage.remover_payload(res)
+            esperado = res["fim_real"]
+        self.assertEqual(esperado, os.path.getsize(self.caminho))
+        return linhas, refeitas
+
+    def sequencial(self):
+        res = load_stage.preparar_arquivo(self.caminho)
+        try:
+            self.assertIsNone(res["erro"])
+            return ler_payload(res)
+        finally:
+            load_stage.remover_payload(res)
+
+    def test_fatias_com_cortes_dentro_de_aspas_dao_as_linhas_da_leitura_sequencial(self):
+        seq = self.sequencial()
+        self.assertEqual(len(seq), 400)
+        for tamanho in (997, 4096):
+            with self.subTest(tamanho_fatia=tamanho):
+                fat, refeitas = self.fatias(tamanho)
+                self.assertGreater(refeitas, 0, "nenhum corte caiu dentro de um campo entre aspas")
+                self.assertEqual(sorted(fat), sorted(seq))
+
+
+if __name__ == "__main__":
+    unittest.main()
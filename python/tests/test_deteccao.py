@@ -0,0 +1,52 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+_spec = importlib.util.spec_from_file_location("load_stage", RAIZ / "02_load_stage_pedidos.py")
+load_stage = importlib.util.module_from_spec(_spec)
+sys.modules["load_stage"] = load_stage
+_spec.loader.exec_module(load_stage)
+
+
+class DetectarFormatoTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        load_stage._CACHE_FORMATO.clear()
+
+    def tearDown(self):
+        load_stage._CACHE_FORMATO.clear()
+        self._tmp.cleanup()
+
+    def _gravar(self, nome, texto):
+        caminho = os.path.join(self._tmp.name, nome)
+        with open(caminho, "w", encoding="utf-8", newline="") as f:
+            f.write(texto)
+        return caminho
+
+    def test_acerto_de_cache_nao_mantem_separador_velho(self):
+        self._gravar_e_detectar("rel_83_1.csv", "a;b;c\n1;2;3\n" * 50, ";")
+        # início ambíguo: um campo entre aspas cheio de ';' domina os primeiros 8 KB,
+        # mas nas linhas que a detecção completa conta o separador é ','
+        campos = ",".join(["x"] * 40)
+        texto = campos + "\n" + '"' + ";" * 4000 + '",' + campos + "\n" + (campos + "\n") * 300
+        self._gravar_e_detectar("rel_83_2.csv", texto, ",")
+
+    def test_acerto_de_cache_com_mesmo_formato(self):
+        self._gravar_e_detectar("rel_83_1.csv", "a;b\n1;2\n" * 300, ";")
+        self._gravar_e_detectar("rel_83_2.csv", "a;b\n3;4\n" * 300, ";")
+        self.assertEqual(len(load_stage._CACHE_FORMATO), 1)
+
+    def _gravar_e_detectar(self, nome, texto, sep):
+        caminho = self._gravar(nome, texto)
+        self.assertEqual(load_stage.detectar_formato(caminho), ("utf-8", sep))
+        self.assertEqual(load_stage.detectar_formato(caminho), ("utf-8", sep))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pedidos.manifest import Manifest, STATUS_BAIXADO, STATUS_ERRO, STATUS_LIDO
+
+
+class SemearDiretoriosTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        base = Path(self._tmp.name)
+        self.novos, self.lidos, self.erros = base / "novos", base / "lidos", base / "erros"
+        for d in (self.novos, self.lidos, self.erros):
+            d.mkdir()
+        self.manifest = Manifest(str(base / "manifest.sqlite"))
+
+    def tearDown(self):
+        self.manifest.close()
+        self._tmp.cleanup()
+
+    def _criar(self, diretorio, *nomes):
+        for n in nomes:
+            (diretorio / n).write_text("a;b\n1;2\n", encoding="utf-8")
+
+    def _status(self):
+        return dict(self.manifest._conn.execute("SELECT nome, status FROM arquivos"))
+
+    def test_processados_que_ficaram_em_novos_nao_voltam_para_a_carga(self):
+        # safe_copy antigo: o processado foi copiado para lidos/ e erros/ e continua em novos/
+        self._criar(self.novos, "rel_83_1.csv", "rel_83_2.CSV", "rel_83_3.csv")
+        self._criar(self.lidos, "rel_83_1.csv", "REL_83_2.csv")
+        self._criar(self.erros, "rel_83_3.csv")
+
+        self.manifest.semear_diretorios(self.novos, self.lidos, self.erros)
+
+        status = self._status()
+        self.assertNotIn(STATUS_BAIXADO, status.values())
+        self.assertEqual(status["rel_83_1.csv"], STATUS_LIDO)
+        self.assertEqual(status["rel_83_3.csv"], STATUS_ERRO)
+        self.assertEqual(self.manifest.pendentes_carga(), [])
+
+    def test_so_em_novos_fica_baixado(self):
+        self._criar(self.novos, "rel_83_1.csv", "rel_83_novo.csv")
+        self._criar(self.lidos, "rel_83_1.csv")
+
+        self.manifest.semear_diretorios(self.novos, self.lidos, self.erros)
+
+        self.assertEqual(self._status()["rel_83_novo.csv"], STATUS_BAIXADO)
+        self.assertEqual(self.manifest.pendentes_carga(), ["rel_83_novo.csv"])
+
+    def test_manifesto_existente_nao_e_semeado_de_novo(self):
+        self._criar(self.novos, "rel_83_1.csv")
+        self.manifest.semear_diretorios(self.novos, self.lidos, self.erros)
+        self._criar(self.novos, "rel_83_2.csv")
+
+        self.assertEqual(self.manifest.semear_diretorios(self.novos, self.lidos, self.erros), 0)
+        self.assertNotIn("rel_83_2.csv", self._status())
+
+
+if __name__ == "__main__":
+    unittest.main()
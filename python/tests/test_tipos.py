@@ -0,0 +1,111 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import psycopg2
+from pedidos import banco, esquema, tipos
+
+# Entradas fixas por regra: o conversor da carga tipada (pedidos/tipos.py) e o
+# CASE/regex do caminho texto (pedidos/esquema.py) têm de chegar ao mesmo valor
+# no upsert. Só SELECTs sobre literais: nenhuma tabela é tocada.
+GOLDEN = {
+    "data": [
+        "31/12/2025", "31/12/2025 10:00:00", " 01/02/2024 ", "29/02/2024", "00/01/2025", "00/00/2025",
+        "2025-12-31", "2025-12-31T10:00", "2025-12-31 10:00:00", "31-12-2025", "20251231",
+        "0000-01-15", "", "   ", "00/00/0000", "00/00/0000 00:00:00", "0000-00-00", "lixo", "31/12/25",
+    ],
+    "ts_ocorrencia": [
+        "31/12/2025 23:59:59", "31/12/2025", "2025-03-01T10:20:30", "2025-03-01 10:20",
+        "2025-03-01T10:20:30.123-03:00", "2025-03-01T10:20:30Z", "2025-03-01 10:20.5",
+        "2025-03-01 10:20-03:00", "2018-11-04 00:30:00", "2019-02-16 23:30:00", "", "lixo",
+    ],
+    "ts_chegada": [
+        "31/12/2025 23:59:59", "31/12/2025", "2025-03-01T10:20", "2025-03-01 10:20:30",
+        "2018-11-04 00:30:00", "2025-03-01T10:20:30Z", "", "lixo",
+    ],
+    "ts_insercao": [
+        "31/12/2025", "31/12/2025 08:00:00", "2025-12-31", "2025-12-31T08:00", "", "lixo",
+    ],
+    "valor": [
+        "1.234,56", "1234,56", "1,234.56", "1234.56", "1.234", "1,234", "1234", "-1.234,56", "+12,5",
+        "0,005", "-0,001", "1.234,567", "R$ 1.234,56", " 12,5 ", "", "   ", "9.999.999.999.999,99",
+    ],
+    "peso": [
+        "1.234,567", "0,5", "12", "1,5 kg", "1.234,5678", "12.345.678,9", "", "0,0004",
+    ],
+    "inteiro": ["12", " 3 vol", "", "abc", "2147483647", "0012"],
+    "chave_nfe": ["3525" + "0" * 40, "35.25-" + "1" * 40, "123", ""],
+}
+
+# onde o SQL falha o conversor tem de falhar também (arquivo rejeitado na carga)
+GOLDEN_ERRO = {
+    "data": ["31/02/2025", "2025-13-01", "32/01/2025 10:00:00", "31/12/2025 24:00:00"],
+    "ts_ocorrencia": ["31/12/2025 10:61:00", "2025-03-01 10:20-0300"],
+    "ts_chegada": ["2025-02-30T10:00"],
+    "valor": ["1.2.3,4,5", "99.999.999.999.999,99"],
+    "peso": ["1.000.000.000,000"],
+    "inteiro": ["99999999999"],
+}
+
+
+def _sql_comparacao(regra: esquema.Regra) -> str:
+    """Valor do caminho texto e do tipado para uma linha (v texto cru, v_t saída do conversor)."""
+    texto, tipado = regra.sql("v"), regra.sql("v", tipado=True)
+    return (f"SELECT ({texto})::text, ({tipado})::text "
+            f"FROM (SELECT %s::{esquema.TIPO_STAGING} AS v, %s::{regra.tipo_t} AS v_t) s")
+
+
+class ConversoresIgualAoSqlTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.conn = banco.conectar()
+        except (RuntimeError, psycopg2.Error) as e:
+            raise unittest.SkipTest(f"PostgreSQL indisponível: {e}")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+
+    def setUp(self):
+        self._fuso()
+
+    def _fuso(self):
+        # fuso com horário de verão: to_timestamp e ::timestamptz têm de ajustar igual
+        with self.conn.cursor() as cur:
+            cur.execute("SET TimeZone = 'America/Sao_Paulo'")
+
+    def tearDown(self):
+        self.conn.rollback()
+
+    def _converter(self, nome, v):
+        return tipos.CONVERSORES[nome](v)
+
+    def test_mesmo_valor_nos_dois_caminhos(self):
+        for nome, valores in GOLDEN.items():
+            sql = _sql_comparacao(esquema.REGRAS[nome])
+            for v in valores:
+                with self.subTest(regra=nome, valor=v):
+                    with self.conn.cursor() as cur:
+                        cur.execute(sql, (v, self._converter(nome, v)))
+                        texto, tipado = cur.fetchone()
+                    self.assertEqual(tipado, texto)
+
+    def test_mesmos_erros_nos_dois_caminhos(self):
+        for nome, valores in GOLDEN_ERRO.items():
+            regra = esquema.REGRAS[nome]
+            for v in valores:
+                with self.subTest(regra=nome, valor=v):
+                    with self.assertRaises(ValueError):
+                        self._converter(nome, v)
+                    with self.assertRaises(psycopg2.DataError):
+                        with self.conn.cursor() as cur:
+                            cur.execute(f"SELECT ({regra.sql('v')})::text FROM (SELECT %s::text AS v) s", (v,))
+                    self.conn.rollback()
+                    self._fuso()
+
+
+if __name__ == "__main__":
+    unittest.main()